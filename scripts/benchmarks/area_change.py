@@ -0,0 +1,63 @@
+"""
+Benchmark for the per-client output buffer.
+
+Moving to another area sends the client a long run of small packets (HP,
+BN, LE, MC, TI, CT, ARUP...). Each one used to be its own transport.write,
+and so its own send() syscall and TCP segment, or websocket frame.
+Packets are now buffered per client and written once per event loop
+iteration. This counts transport writes per area change with and without
+the buffer (outside of an event loop, packets are still written as they
+are sent), and times the whole change, including the event loop
+iterations it takes to send everything when buffered.
+
+Usage: python scripts/benchmarks/area_change.py
+"""
+import asyncio
+import time
+
+from common import make_server, add_client
+
+
+def area_change(client, areas, moves):
+    start = time.perf_counter()
+    for i in range(moves):
+        client.set_area(areas[i % len(areas)])
+    return (time.perf_counter() - start) / moves * 1e6
+
+
+async def buffered_area_change(client, areas, moves):
+    start = time.perf_counter()
+    for i in range(moves):
+        client.set_area(areas[i % len(areas)])
+        # Let the flush, and the area updates scheduled for later, happen
+        for _ in range(3):
+            await asyncio.sleep(0)
+    return (time.perf_counter() - start) / moves * 1e6
+
+
+def main():
+    server = make_server()
+    hub = server.hub_manager.default_hub()
+    areas = hub.areas[:4]
+    # Someone in every area, so there is something to announce
+    for area in areas:
+        for _ in range(5):
+            add_client(server, area, char_id=len(area.clients))
+    mover = add_client(server, areas[0], char_id=40)
+    moves = 200
+
+    mover.transport.reset()
+    before_us = area_change(mover, areas, moves)
+    before = mover.transport.writes / moves
+
+    mover.transport.reset()
+    after_us = asyncio.run(buffered_area_change(mover, areas, moves))
+    after = mover.transport.writes / moves
+
+    print(f"{'':>10} {'writes per area change':>23} {'us per change':>14}")
+    print(f"{'before':>10} {before:>23.1f} {before_us:>14.0f}")
+    print(f"{'buffered':>10} {after:>23.1f} {after_us:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
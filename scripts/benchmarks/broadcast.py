@@ -0,0 +1,41 @@
+"""
+Micro-benchmark for area-wide broadcasts.
+
+Compares sending a packet to every client in an area one by one
+(encoding it once per recipient) against Area.send_command, which
+encodes the packet once and writes the same bytes to every transport.
+
+Usage: python scripts/benchmarks/broadcast.py
+"""
+from common import make_server, add_client, bench
+
+
+MS_ARGS = (
+    "chat", "-", "Phoenix", "normal", "Hold it! That's a contradiction!",
+    "def", "1", 0, 0, 0, 0, 0, 0, 0, 0, "Phoenix Wright", -1, "", "",
+    "0&0", "0&0", 0, 0, 0, 0, "-", "-", "-", 0, "",
+)
+
+
+def per_client(area, cmd, *args):
+    for c in area.clients:
+        c.send_command(cmd, *args)
+
+
+def main():
+    server = make_server()
+    area = server.hub_manager.default_hub().default_area()
+    print(f"{'clients':>8} {'packet':>6} {'per-client us':>14} "
+          f"{'send_command us':>16} {'speedup':>8}")
+    for count in (10, 50, 200):
+        while len(area.clients) < count:
+            add_client(server, area, char_id=len(area.clients))
+        for cmd, args in (("MS", MS_ARGS), ("CT", ("Phoenix", "Objection!", "0"))):
+            old = bench(lambda: per_client(area, cmd, *args))
+            new = bench(lambda: area.send_command(cmd, *args))
+            print(f"{count:>8} {cmd:>6} {old:>14.1f} {new:>16.1f} "
+                  f"{old / new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark for the censor engine.
+
+Compares the compiled Censor against running constants.censor once per
+word list (as the MS and CT handlers used to) with a 500-word list,
+and checks that both produce the same output.
+
+Usage: python scripts/benchmarks/censor.py
+"""
+import random
+import string
+
+from common import bench
+
+from server.constants import Censor, censor
+
+
+MESSAGES = [
+    "Hold it! The witness just contradicted the autopsy report.",
+    "I don't think that's how the murder happened, your honor.",
+    "Take that! This piece of evidence proves the defendant was elsewhere.",
+    "Objection! The prosecution is leading the witness again.",
+    "ok so who is going to be the judge for the next case",
+    "brb getting food, don't start without me",
+]
+
+
+def make_words(count, rng):
+    words = set()
+    while len(words) < count:
+        length = rng.randint(3, 10)
+        words.add("".join(rng.choice(string.ascii_lowercase)
+                  for _ in range(length)))
+    return sorted(words)
+
+
+def main():
+    rng = random.Random(0)
+    words = make_words(500, rng)
+    whole, partial = words[:400], words[400:]
+    replace = "*"
+
+    # Sprinkle some restricted words into otherwise clean chat
+    dirty = [
+        f"{msg} {rng.choice(whole).upper()} and x{rng.choice(partial)}y"
+        for msg in MESSAGES
+    ]
+
+    def old(text):
+        text = censor(text, whole, replace, True)
+        return censor(text, partial, replace, False)
+
+    engine = Censor(whole, partial, replace)
+    for msg in MESSAGES + dirty:
+        assert old(msg) == engine.scrub(msg), msg
+
+    print(f"{'':>6} {'censor() us':>12} {'Censor us':>10} {'speedup':>8}")
+    for name, corpus in (("clean", MESSAGES), ("dirty", dirty)):
+        before = bench(lambda: [old(msg) for msg in corpus], number=20)
+        after = bench(lambda: [engine.scrub(msg) for msg in corpus], number=20)
+        print(f"{name:>6} {before:>12.1f} {after:>10.1f} "
+              f"{before / after:>7.1f}x")
+    build = bench(lambda: Censor(whole, partial, replace), number=20)
+    print(f"Compiling the 500-word list takes {build:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
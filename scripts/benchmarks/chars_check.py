@@ -0,0 +1,75 @@
+"""
+Benchmark for the character occupancy of an area.
+
+Character availability used to be worked out by collecting every client's
+character ID on each check, and the CharsCheck list by subtracting that
+from the whole character list. This compares those against the occupancy
+counts and the cached CharsCheck packet, as an area fills up, along with
+sending CharsCheck to everyone in the area after a character change.
+
+Usage: python scripts/benchmarks/chars_check.py
+"""
+from common import make_server, add_client, bench
+
+from server.constants import encode_ao_command
+
+
+def old_is_char_available(area, char_id):
+    return char_id not in [x.char_id for x in area.clients]
+
+
+def old_available_char_list(area):
+    avail_char_ids = set(range(len(area.area_manager.char_list))) - {
+        x.char_id for x in area.clients
+    }
+    char_list = [-1] * len(area.area_manager.char_list)
+    for x in avail_char_ids:
+        char_list[x] = 0
+    return char_list
+
+
+def old_broadcast(area):
+    for client in area.clients:
+        client.send_command("CharsCheck", *old_available_char_list(area))
+
+
+def new_broadcast(area):
+    # A character change invalidates the cached packet
+    area.chars_check_args = None
+    area.chars_check_data = None
+    area.flush_chars_check()
+
+
+def main():
+    server = make_server(playerlimit=2000)
+    hub = server.hub_manager.default_hub()
+    # Large servers carry a few thousand characters
+    hub.char_list = [f"Char {i}" for i in range(2000)]
+    area = hub.areas[0]
+    area.reset_char_occupancy()
+
+    print(f"{'clients':>8} {'available us':>13} {'(was)':>8} "
+          f"{'CharsCheck us':>14} {'(was)':>9} {'broadcast us':>13} {'(was)':>9}")
+    for size in (10, 100, 500):
+        while len(area.clients) < size:
+            add_client(server, area, char_id=len(area.clients))
+        for client in area.clients:
+            client.transport.reset()
+        char_id = size - 1
+        assert area.is_char_available(char_id) == old_is_char_available(area, char_id)
+        assert list(area.get_chars_check()) == old_available_char_list(area)
+        assert area.get_chars_check_data() == encode_ao_command(
+            "CharsCheck", *old_available_char_list(area)).encode("utf-8")
+
+        avail_new = bench(lambda: area.is_char_available(char_id), number=2000)
+        avail_old = bench(lambda: old_is_char_available(area, char_id))
+        check_new = bench(lambda: area.get_chars_check_data(), number=2000)
+        check_old = bench(lambda: old_available_char_list(area))
+        send_new = bench(lambda: new_broadcast(area), number=5)
+        send_old = bench(lambda: old_broadcast(area), number=5)
+        print(f"{size:>8} {avail_new:>13.2f} {avail_old:>8.1f} "
+              f"{check_new:>14.2f} {check_old:>9.1f} {send_new:>13.0f} {send_old:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Shared helpers for the micro-benchmarks in this directory.
+
+The benchmarks run against a real TsuServer3 instance created inside a
+throwaway directory (sample config, empty storage and logs), with clients
+attached to fake transports so no sockets are opened.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+from heapq import heappop
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+class FakeTransport:
+    """Stand-in for an asyncio transport that counts what gets written."""
+
+    def __init__(self, ip="127.0.0.1"):
+        self.ip = ip
+        self.writes = 0
+        self.bytes = 0
+        self.closed = False
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+
+    def get_extra_info(self, name, default=None):
+        if name == "peername":
+            return (self.ip, 0)
+        return default
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.closed = True
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def reset(self):
+        self.writes = 0
+        self.bytes = 0
+
+
+def make_server(playerlimit=1000):
+    """
+    Create a TsuServer3 using the sample configuration in a temporary
+    working directory.
+    :param playerlimit: number of player IDs to make available
+    :returns: server instance
+    """
+    workdir = tempfile.mkdtemp(prefix="kfo-bench-")
+    shutil.copytree(os.path.join(REPO_ROOT, "config_sample"),
+                    os.path.join(workdir, "config"))
+    shutil.copytree(os.path.join(REPO_ROOT, "migrations"),
+                    os.path.join(workdir, "migrations"))
+    os.makedirs(os.path.join(workdir, "storage"))
+    os.makedirs(os.path.join(workdir, "logs"))
+    os.chdir(workdir)
+
+    from server.tsuserver import TsuServer3
+
+    server = TsuServer3()
+    # The server caps recursion very low; the benchmarks need the default.
+    sys.setrecursionlimit(1000)
+    server.config["playerlimit"] = playerlimit
+    server.client_manager.cur_id = [i for i in range(playerlimit)]
+    return server
+
+
+def add_client(server, area=None, char_id=-1):
+    """
+    Attach a client backed by a FakeTransport to the server.
+    :param server: server instance
+    :param area: area to place the client in (default area if None)
+    :param char_id: character ID to assign
+    :returns: created client object
+    """
+    from server import database
+
+    user_id = heappop(server.client_manager.cur_id)
+    transport = FakeTransport(f"127.0.{user_id // 256}.{user_id % 256}")
+    client = server.client_manager.Client(
+        server, transport, user_id, database.ipid(transport.ip))
+    client.server = server
+    client.char_id = char_id
+    server.client_manager.clients.add(client)
+    if area is None:
+        area = server.hub_manager.default_hub().default_area()
+    client.area = area
+    area.clients.add(client)
+    area.area_manager.clients.add(client)
+    server.hub_manager.clients.add(client)
+    area.update_visibility(client)
+    area.update_char(client)
+    server.client_manager.index_client(client)
+    return client
+
+
+def bench(func, number=200, repeat=5):
+    """
+    Time a callable.
+    :returns: best time per call in microseconds
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number * 1e6
@@ -0,0 +1,108 @@
+"""
+Benchmark for mass disconnects.
+
+Disconnects a share of the clients on a busy hub (CMs, invite lists,
+followers and clients sharing an IPID) at once, as happens after a
+network blip. Compares ClientManager.remove_client, which only visits
+what the client is tied to, against the previous version, which walked
+every area of every hub and every client for each disconnect.
+
+Usage: python scripts/benchmarks/disconnect.py
+"""
+import asyncio
+import time
+from heapq import heappush
+
+from common import make_server, add_client
+
+from server.client_manager import ClientManager
+
+
+def walking_remove_client(self, client):
+    """ClientManager.remove_client as it was before the reverse indexes."""
+    if client in client.area.area_manager.owners:
+        client.area.area_manager.owners.remove(client)
+        client.area.area_manager.update_owner(client)
+    for hub in self.server.hub_manager.hubs:
+        for a in hub.areas:
+            if client in a._owners:
+                a.remove_owner(client, dc=True)
+            if client.id in a.invite_list:
+                a.invite_list.discard(client.id)
+    heappush(self.cur_id, client.id)
+    temp_ipid = client.ipid
+    for c in self.server.client_manager.clients:
+        if c.ipid == temp_ipid:
+            c.clientscon -= 1
+        if c.following == client:
+            c.unfollow()
+    self.clients.remove(client)
+    self.unindex_client(client)
+    self.server.hub_manager.hub_list_viewers.discard(client)
+    self.server.hub_manager.send_hub_list()
+
+
+def populate(server, areas, clients_per_area):
+    hub = server.hub_manager.default_hub()
+    while len(hub.areas) < areas:
+        hub.create_area()
+    clients = []
+    for area in hub.areas:
+        for _ in range(clients_per_area):
+            clients.append(add_client(server, area, char_id=0))
+    for i, client in enumerate(clients):
+        if i % 10 == 0:
+            client.area.add_owner(client)
+        if i % 7 == 0:
+            client.following = clients[i - 1]
+        # Invite a few people to every area
+        client.area.invite_list.add(clients[(i * 31) % len(clients)].id)
+    return clients
+
+
+async def mass_disconnect(remove_client, areas, clients_per_area, share=0.3):
+    teardown = 0
+
+    def timed_remove_client(self, client):
+        nonlocal teardown
+        start = time.perf_counter()
+        remove_client(self, client)
+        teardown += time.perf_counter() - start
+
+    original = ClientManager.remove_client
+    ClientManager.remove_client = timed_remove_client
+    try:
+        server = make_server(playerlimit=areas * clients_per_area + 100)
+        clients = populate(server, areas, clients_per_area)
+        # Let the ARUP updates from setting up go out first
+        await asyncio.sleep(0)
+        leaving = clients[::int(1 / share)]
+        start = time.perf_counter()
+        for client in leaving:
+            server.remove_client(client)
+        # Include the coalesced ARUP updates the disconnects scheduled
+        await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+    finally:
+        ClientManager.remove_client = original
+    return len(clients), len(leaving), elapsed, teardown
+
+
+async def main():
+    # Total time for the whole batch, and the part spent in
+    # ClientManager.remove_client
+    print(f"{'areas':>6} {'clients':>8} {'leaving':>8} {'walk ms':>9} "
+          f"{'indexed ms':>11} {'remove_client walk ms':>22} "
+          f"{'indexed ms':>11}")
+    for areas, per_area in ((40, 5), (200, 5), (400, 5)):
+        total, leaving, old, old_teardown = await mass_disconnect(
+            walking_remove_client, areas, per_area)
+        _, _, new, new_teardown = await mass_disconnect(
+            ClientManager.remove_client, areas, per_area)
+        print(f"{areas:>6} {total:>8} {leaving:>8} {old * 1000:>9.1f} "
+              f"{new * 1000:>11.1f} {old_teardown * 1000:>22.1f} "
+              f"{new_teardown * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Benchmark for emote validation and the INI swap whitelist.
+
+Emotes.validate used to loop over every emote of the character, and
+Area.is_iniswap over every INI swap group, on each IC message. This checks
+the indexed versions against those loops on random input, then compares
+their speed for a character with a few hundred emotes.
+
+Usage: python scripts/benchmarks/emotes.py
+"""
+import os
+import random
+import tempfile
+
+from common import bench
+
+from server import emotes
+from server.emotes import Emotes
+from server.tsuserver import TsuServer3
+
+
+def write_char_ini(directory, name, count):
+    os.makedirs(os.path.join(directory, name))
+    lines = ["[Options]", f"name = {name}", "[Emotions]", f"number = {count}"]
+    for i in range(1, count + 1):
+        # Some emotes share a preanim or an animation
+        lines.append(f"{i} = Emote {i}#Pre{i % 40}#Anim{i}#0#")
+    with open(os.path.join(directory, name, "char.ini"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def old_validate(emote_set, preanim, anim, sfx):
+    if len(emote_set) == 0:
+        return True
+    sfx = ""
+    for emote in emote_set:
+        if (preanim == "" or emote[0] == preanim) and (anim == "" or emote[1] == anim) and (sfx == "" or emote[2] == sfx):
+            return True
+    return False
+
+
+def old_allowed(allowed_iniswaps, char_name, char):
+    for char_link in allowed_iniswaps:
+        if char_name in char_link and char in char_link:
+            return True
+    return False
+
+
+def main():
+    emotes.char_dir = tempfile.mkdtemp(prefix="kfo-bench-")
+    write_char_ini(emotes.char_dir, "Phoenix", 250)
+    char = Emotes("Phoenix")
+    empty = Emotes("Nobody")
+    assert len(char.emotes) == 250
+
+    rng = random.Random(0)
+    names = ["", "pre1", "pre7", "anim3", "anim250", "anim251", "ANIM3", "pre99"]
+    for _ in range(2000):
+        args = (rng.choice(names), rng.choice(names), rng.choice(("", "sfx")))
+        assert char.validate(*args) == old_validate(char.emotes, *args)
+        assert empty.validate(*args) == old_validate(empty.emotes, *args)
+
+    chars = [f"Char {i}" for i in range(300)]
+    groups = [rng.sample(chars, rng.randint(2, 6)) for _ in range(150)]
+    iniswap_map = TsuServer3.build_iniswap_map(groups)
+    for _ in range(2000):
+        a, b = rng.choice(chars), rng.choice(chars)
+        assert (b in iniswap_map.get(a, ())) == old_allowed(groups, a, b)
+    assert TsuServer3.build_iniswap_map(None) == {}
+    print("Equivalence check passed")
+
+    print(f"{'case':>22} {'new us':>8} {'old us':>8}")
+    cases = (
+        ("last emote", ("pre10", "anim250", "")),
+        ("unknown emote", ("pre10", "anim251", "")),
+        ("animation only", ("", "anim250", "")),
+    )
+    for name, args in cases:
+        new = bench(lambda: char.validate(*args), number=2000)
+        old = bench(lambda: old_validate(char.emotes, *args))
+        print(f"{name:>22} {new:>8.2f} {old:>8.1f}")
+    a, b = groups[-1][0], "Char not in any group"
+    new = bench(lambda: b in iniswap_map.get(a, ()), number=2000)
+    old = bench(lambda: old_allowed(groups, a, b))
+    print(f"{'iniswap whitelist':>22} {new:>8.2f} {old:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Check the master server heartbeat against local stand-ins.
+
+The heartbeat used to run a STUN probe in an executor and post the
+server information every 60 seconds, whether or not anything changed.
+This runs MasterServerClient with a counting probe and a stub master
+server on localhost, with the intervals scaled down, and reports how many
+probes and posts it made against how many the old loop would have.
+
+Usage: python scripts/benchmarks/masterserver.py
+"""
+import asyncio
+
+from aiohttp import web
+from common import make_server, add_client
+
+from server.network.masterserverclient import MasterServerClient
+
+
+class StubMasterServer:
+    def __init__(self):
+        self.posts = []
+        # Statuses to answer with before going back to 200
+        self.errors = []
+
+    async def handle(self, request):
+        self.posts.append(await request.json())
+        if self.errors:
+            return web.Response(status=self.errors.pop(0))
+        return web.Response(text="ok")
+
+
+async def main():
+    stub = StubMasterServer()
+    app = web.Application()
+    app.router.add_post("/servers", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    probes = []
+
+    def probe():
+        probes.append(1)
+        return "203.0.113.7"
+
+    server = make_server()
+    # One tick here stands for ten seconds
+    tick = 0.02
+    server.config["masterserver_min_interval"] = tick
+    server.config["masterserver_max_interval"] = 6 * tick
+    server.config["masterserver_ip_ttl"] = 360 * tick
+    server.config.pop("masterserver_custom_hostname", None)
+    ms = MasterServerClient(server, probe=probe,
+                            api_base_url=f"http://127.0.0.1:{port}")
+    task = asyncio.ensure_future(ms.connect())
+
+    # An idle server, then players joining
+    await asyncio.sleep(60 * tick)
+    idle_posts = len(stub.posts)
+    for _ in range(3):
+        add_client(server, char_id=0)
+    await asyncio.sleep(2 * tick)
+    assert stub.posts[-1]["players"] == 3
+    print(f"10 idle minutes: {len(probes)} STUN probe(s), {idle_posts} posts "
+          "(was 10 probes and 10 posts)")
+    print("player count change: advertised within one check interval")
+
+    # The master server failing: backoff, and a fresh probe after it
+    # rejected the request
+    probes.clear()
+    stub.posts.clear()
+    stub.errors = [500, 503, 400, 500]
+    await asyncio.sleep(40 * tick)
+    assert stub.posts[-1]["ip"] == "203.0.113.7"
+    assert ms.failures == 0
+    print(f"4 failures in a row (one a 400): {len(stub.posts)} posts in ~7 minutes, "
+          f"{len(probes)} re-probe(s), recovered")
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
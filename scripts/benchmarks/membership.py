@@ -0,0 +1,72 @@
+"""
+Benchmark for the hub membership and area owner sets.
+
+Hub and server client sets used to be unions of every area's clients,
+rebuilt on every read, and an area's owners were the union of its CMs
+and the hub's GMs. This compares those unions against the maintained
+sets as a hub grows, along with an OOC broadcast that reaches the area
+owners.
+
+Usage: python scripts/benchmarks/membership.py
+"""
+from common import make_server, add_client, bench
+
+from server.area import Area
+
+
+def union_hub_clients(hub):
+    clients = set()
+    for area in hub.areas:
+        clients = clients | area.clients
+    return clients
+
+
+def union_server_clients(hub_manager):
+    clients = set()
+    for hub in hub_manager.hubs:
+        clients = clients | union_hub_clients(hub)
+    return clients
+
+
+def main():
+    server = make_server(playerlimit=2000)
+    hub = server.hub_manager.default_hub()
+    maintained_owners = Area.owners
+    union_owners = property(lambda self: self.area_manager.owners | self._owners)
+
+    print(f"{'areas':>6} {'clients':>8} {'hub.clients us':>15} {'(was)':>9} "
+          f"{'server us':>10} {'(was)':>9} {'OOC us':>8} {'(was)':>8}")
+    for size in (10, 100, 500):
+        while len(hub.areas) < size:
+            hub.create_area()
+        for area in hub.areas:
+            while len(area.clients) < 2:
+                add_client(server, area, char_id=0)
+        target = hub.areas[1]
+        # A couple of GMs and a CM listening in from elsewhere
+        for area, role in ((hub.areas[0], "gm"), (hub.areas[2], "gm"), (hub.areas[3], "cm")):
+            owner = next(iter(area.clients))
+            owner.remote_listen = 3
+            if role == "gm":
+                hub.owners.add(owner)
+                hub.update_owner(owner)
+            else:
+                target._owners.add(owner)
+                target.update_owner(owner)
+        assert union_hub_clients(hub) == hub.clients
+        assert union_server_clients(server.hub_manager) == server.hub_manager.clients
+
+        hub_new = bench(lambda: len(hub.clients), number=2000)
+        hub_old = bench(lambda: union_hub_clients(hub))
+        all_new = bench(lambda: len(server.hub_manager.clients), number=2000)
+        all_old = bench(lambda: union_server_clients(server.hub_manager))
+        ooc_new = bench(lambda: target.broadcast_ooc("Hold it!"))
+        Area.owners = union_owners
+        ooc_old = bench(lambda: target.broadcast_ooc("Hold it!"))
+        Area.owners = maintained_owners
+        print(f"{size:>6} {len(hub.clients):>8} {hub_new:>15.2f} {hub_old:>9.1f} "
+              f"{all_new:>10.2f} {all_old:>9.1f} {ooc_new:>8.1f} {ooc_old:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Check and benchmark the metrics endpoint.
+
+Serves AOProtocol and the metrics endpoint on localhost, connects a client
+that sends IC messages and OOC commands (one of them failing), then
+scrapes /metrics and prints what was recorded. Also times a burst of IC
+messages through data_received with metrics enabled and disabled, to show
+what recording costs per packet.
+
+Usage: python scripts/benchmarks/metrics.py
+"""
+import asyncio
+import socket
+import time
+
+import aiohttp
+from common import make_server
+
+from server.network.aoprotocol import AOProtocol
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def ms_packet(i, char_id):
+    return (f"MS#chat#-#Adrian#normal#line {i}#wit#0#0#{char_id}#0#0#0#0#0#0#%").encode()
+
+
+def time_packets(protocol, packets):
+    start = time.perf_counter()
+    for packet in packets:
+        protocol.data_received(packet)
+    return (time.perf_counter() - start) / len(packets) * 1e6
+
+
+async def main():
+    server = make_server()
+    server.config["metrics_enabled"] = True
+    server.config["metrics_port"] = free_port()
+    server.config["watchdog_interval"] = 0.05
+    server.metrics.enabled = True
+    server.watchdog.start()
+    await server.metrics.start()
+    tcp = await asyncio.get_running_loop().create_server(
+        lambda: AOProtocol(server), "127.0.0.1", 0)
+    port = tcp.sockets[0].getsockname()[1]
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"HI#hdid#%ID#1#AO2#2.10.0#%askchaa#%RC#%RM#%RD#%CC#0#0#hdid#%")
+    for i in range(20):
+        writer.write(ms_packet(i, 0))
+    writer.write(b"CT#tester#/getarea#%CT#tester#/pm#%CT#tester#/roll 6#%")
+    await writer.drain()
+    await asyncio.sleep(0.5)
+
+    url = f"http://127.0.0.1:{server.config['metrics_port']}/metrics"
+    async with aiohttp.ClientSession() as http:
+        async with http.get(url) as res:
+            assert res.status == 200
+            text = await res.text()
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    assert samples['kfo_packets_total{packet="MS"}'] == 20
+    assert samples['kfo_commands_total{command="pm"}'] == 1
+    assert samples['kfo_commands_errors_total{command="pm"}'] == 1
+    assert samples['kfo_clients{hub="0",name="Main"}'] == 1
+    print(f"scraped {len(samples)} samples, for example:")
+    for name in ('kfo_packets_total{packet="MS"}', 'kfo_packet_seconds_sum{packet="MS"}',
+                 'kfo_commands_errors_total{command="pm"}', "kfo_received_bytes_total",
+                 "kfo_sent_bytes_total", "kfo_db_queue_depth",
+                 "kfo_event_loop_lag_seconds_count"):
+        print(f"  {name} {samples[name]:g}")
+
+    # What recording costs per packet
+    protocol = AOProtocol(server)
+    protocol.client = next(iter(server.client_manager.clients))
+    # No area flood protection between the packets
+    server.config["block_repeat"] = False
+    packets = [ms_packet(i, 0) for i in range(2000)]
+    server.metrics.enabled = False
+    off = time_packets(protocol, packets)
+    server.metrics.enabled = True
+    on = time_packets(protocol, packets)
+    print(f"us per IC message: {off:.1f} without metrics, {on:.1f} with")
+
+    writer.close()
+    tcp.close()
+    await server.metrics.close()
+    await server.watchdog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Check /profile and /memprofile under load.
+
+Runs a server with 100 clients and pushes IC messages through the area
+while a moderator profiles it. Checks that /profile writes collapsed
+stacks, some of them in the IC message handler, and how much sampling
+slows IC messages down; then that /memprofile writes its report, and how long
+the event loop was held up while it was taken.
+
+Usage: python scripts/benchmarks/profiler.py
+"""
+import asyncio
+import time
+
+from common import make_server, add_client
+
+from server import commands
+from server.network.aoprotocol import AOProtocol
+
+
+def ms_packet(i, char_id):
+    return (f"MS#chat#-#Adrian#normal#line {i}#wit#0#0#{char_id}#0#0#0#0#0#0#%").encode()
+
+
+async def send_messages(protocol, seconds):
+    """Send IC messages for a while, yielding to the event loop between them."""
+    start = time.perf_counter()
+    count = 0
+    while time.perf_counter() - start < seconds:
+        protocol.data_received(ms_packet(count, 0))
+        count += 1
+        await asyncio.sleep(0)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def main():
+    server = make_server()
+    server.config["block_repeat"] = False
+    area = server.hub_manager.default_hub().default_area()
+    for i in range(100):
+        add_client(server, area, char_id=i)
+    player = next(c for c in server.client_manager.clients if c.char_id == 0)
+    protocol = AOProtocol(server)
+    protocol.client = player
+    mod = add_client(server, area, char_id=100)
+    mod.is_mod = True
+    lines = []
+    mod.send_ooc = lines.append
+
+    before = await send_messages(protocol, 1)
+    commands.call(mod, "profile", "start 1m")
+    profiled = await send_messages(protocol, 1)
+    commands.call(mod, "profile", "stop")
+    path = lines[-1].rsplit(" ", 1)[1].rstrip(".")
+    print(lines[-1])
+    with open(path, encoding="utf-8") as f:
+        stacks = [line.rsplit(" ", 1) for line in f]
+    assert all(count.strip().isdigit() for _stack, count in stacks)
+    ic = sum(int(count) for stack, count in stacks if "net_cmd_ms" in stack)
+    total = sum(int(count) for _stack, count in stacks)
+    assert ic > 0
+    print(f"{len(stacks)} stacks, {ic} of {total} samples in net_cmd_ms")
+    print(f"us per IC message: {before:.1f} without profiling, {profiled:.1f} sampling")
+
+    commands.call(mod, "memprofile", "1s")
+    # Keep the server busy, and see how late the event loop gets
+    worst = 0
+    deadline = time.monotonic() + 3
+    i = 0
+    while server.memprofiler.running and time.monotonic() < deadline:
+        start = time.perf_counter()
+        protocol.data_received(ms_packet(i, 0))
+        i += 1
+        await asyncio.sleep(0)
+        worst = max(worst, time.perf_counter() - start)
+    assert not server.memprofiler.running
+    print(lines[-1])
+    print(f"longest event loop iteration while profiling memory: {worst * 1000:.1f} ms")
+    path = lines[-1].rsplit(" ", 1)[1].rstrip(".")
+    with open(path, encoding="utf-8") as f:
+        print(f.read())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Check flow control for AO2 clients that fall behind.
+
+Serves AOProtocol on localhost and connects two clients that stop
+reading, then floods their area with IC messages and area updates. One
+client catches up after a while: it should have been paused, had its ARUP
+and CharsCheck updates skipped, and got them again on resume. The other
+never reads: it should be disconnected once write_buffer_max bytes wait
+for it, instead of buffering without limit.
+
+Usage: python scripts/benchmarks/slow_consumer.py
+"""
+import asyncio
+import socket
+
+from common import make_server
+
+from server.network.aoprotocol import AOProtocol
+
+
+async def connect(port, i):
+    sock = socket.socket()
+    # Keep the kernel from soaking up everything we send
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(f"HI#hdid{i}#%ID#1#AO2#2.10.0#%askchaa#%RC#%RM#%RD#%CC#0#{i}#hdid{i}#%".encode())
+    await writer.drain()
+    return reader, writer
+
+
+async def main():
+    server = make_server()
+    server.config["write_buffer_high"] = 16 * 1024
+    server.config["write_buffer_low"] = 4 * 1024
+    server.config["write_buffer_max"] = 512 * 1024
+    tcp = await asyncio.get_running_loop().create_server(
+        lambda: AOProtocol(server), "127.0.0.1", 0)
+    port = tcp.sockets[0].getsockname()[1]
+
+    catching_up = await connect(port, 0)
+    stalled = await connect(port, 1)
+    await asyncio.sleep(0.5)
+    clients = sorted(server.client_manager.clients, key=lambda c: c.id)
+    area = clients[0].area
+    hub = area.area_manager
+
+    recovering, stuck = clients
+    # Enough to fill the kernel's socket buffers too
+    text = "x" * 2000
+
+    def flood(i):
+        area.send_command("MS", "chat", "-", "Adrian", "normal", f"{i} {text}",
+                          "wit", "", 0, 0, 0, 0, 0, 0, 0, 0)
+        if i % 10 == 0:
+            # Area updates, which can be skipped
+            area.status = ("IDLE", "LOOKING-FOR-PLAYERS")[i // 10 % 2]
+            hub.send_arup_status()
+            area.flush_chars_check()
+
+    i = 0
+    while recovering.dropped_packets == 0 or stuck.dropped_packets == 0:
+        flood(i)
+        i += 1
+        await asyncio.sleep(0)
+    print(f"both clients paused after {i} IC messages, "
+          f"{recovering.get_buffered_bytes()} bytes waiting")
+
+    # One client reads everything: it resumes and gets the skipped updates
+    reader, writer = catching_up
+    received = bytearray()
+
+    async def read_forever():
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received.extend(data)
+
+    read_task = asyncio.ensure_future(read_forever())
+    while recovering.write_paused:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)
+    assert recovering.dropped_commands == set()
+    last_arup = received.rfind(b"ARUP#1#")
+    print(f"catching up client: resumed, {recovering.dropped_packets} packets skipped, "
+          f"then sent the latest area status ({received[last_arup:last_arup + 40].decode()}...)")
+
+    # The other never reads, and is cut off at write_buffer_max
+    while not stuck.transport.is_closing():
+        flood(i)
+        i += 1
+        await asyncio.sleep(0)
+    print(f"stalled client: disconnected after {i} IC messages, "
+          f"{stuck.dropped_packets} packets skipped, reading client still connected: "
+          f"{not recovering.transport.is_closing()}")
+    assert not recovering.transport.is_closing()
+
+    read_task.cancel()
+    writer.close()
+    stalled[1].close()
+    tcp.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
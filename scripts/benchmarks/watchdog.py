@@ -0,0 +1,107 @@
+"""
+Check the event loop watchdog.
+
+Runs the watchdog with a 50 ms threshold and holds up the event loop in
+the ways the server can: slow OOC commands sent by a real client (one of
+them failing), a slow area timer, and a database write stuck behind
+another connection's lock.
+Each should be logged with what it was, the client and the area, the lag
+sampler should blame the stall on the slowest of them, and /lag should
+list them worst first.
+
+Usage: python scripts/benchmarks/watchdog.py
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+from common import make_server, add_client
+
+from server import commands, database
+from server.exceptions import ArgumentError
+from server.network.aoprotocol import AOProtocol
+
+
+def ooc_cmd_stall(client, arg):
+    """Stand-in for a command that blocks the event loop, and may then fail."""
+    seconds, *fail = arg.split()
+    time.sleep(float(seconds))
+    if fail:
+        raise ArgumentError("Usage: /stall <seconds> [fail]")
+
+
+def lock_database(seconds, locked):
+    """Hold the database write lock from another connection, like a big log batch."""
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.execute("BEGIN IMMEDIATE")
+    locked.set()
+    time.sleep(seconds)
+    conn.rollback()
+    conn.close()
+
+
+async def main():
+    server = make_server()
+    server.config["watchdog_interval"] = 0.02
+    server.watchdog.threshold = 0.05
+    commands.ooc_cmd_stall = ooc_cmd_stall
+    server.watchdog.start()
+
+    tcp = await asyncio.get_running_loop().create_server(
+        lambda: AOProtocol(server), "127.0.0.1", 0)
+    port = tcp.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"HI#hdid#%ID#1#AO2#2.10.0#%askchaa#%RC#%RM#%RD#%CC#0#0#hdid#%")
+    await writer.drain()
+    await asyncio.sleep(0.2)
+    player = next(iter(server.client_manager.clients))
+
+    # A slow command, through the packet handler
+    writer.write(b"CT#tester#/stall 0.15#%")
+    await writer.drain()
+    await asyncio.sleep(0.2)
+
+    # A slow command that fails, which is still reported
+    writer.write(b"CT#tester#/stall 0.06 fail#%")
+    await writer.drain()
+    await asyncio.sleep(0.2)
+
+    # A slow area timer
+    player.area.add_owner(player)
+    commands.call(player, "timer", "1 1s")
+    commands.call(player, "timer", "1 /stall 0.08")
+    commands.call(player, "timer", "1 start")
+    await asyncio.sleep(1.2)
+
+    # A database write waiting on a lock
+    locked = threading.Event()
+    thread = threading.Thread(target=lock_database, args=(0.12, locked))
+    thread.start()
+    locked.wait()
+    database.add_hdid(player.ipid, "watchdog")
+    thread.join()
+    await asyncio.sleep(0.1)
+
+    mod = add_client(server, char_id=1)
+    mod.is_mod = True
+    lines = []
+    mod.send_ooc = lines.append
+    commands.call(mod, "lag", "")
+    print(lines[0])
+
+    failed = [slow for slow in server.watchdog.slow_calls
+              if slow.kind == "command" and 0.06 <= slow.seconds < 0.08]
+    assert failed, "slow failing command not reported"
+    kinds = {slow.kind for slow in server.watchdog.slow_calls}
+    assert {"packet", "command", "timer", "db", "lag"} <= kinds, kinds
+    blamed = [slow.name for slow in server.watchdog.slow_calls if slow.kind == "lag"]
+    assert any(name.startswith("packet CT by client") for name in blamed), blamed
+
+    writer.close()
+    tcp.close()
+    await server.watchdog.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""
+Check and benchmark webhook delivery against a local stub HTTP server.
+
+send_webhook used to call requests.post from the command handler, so the
+whole server waited for Discord to answer. This starts a stub webhook
+endpoint on localhost and checks that sending never blocks the event
+loop, that rate limits and server errors are retried, that bursts are
+combined when coalescing is on, and that an unreachable endpoint only
+costs the retries.
+
+Usage: python scripts/benchmarks/webhooks.py
+"""
+import asyncio
+import time
+
+from aiohttp import web
+from common import make_server
+
+
+class StubEndpoint:
+    """Webhook endpoint that answers with a scripted list of replies."""
+
+    def __init__(self):
+        self.replies = []
+        self.received = []
+        self.delay = 0
+
+    async def handle(self, request):
+        self.received.append(await request.json())
+        await asyncio.sleep(self.delay)
+        if self.replies:
+            status, body = self.replies.pop(0)
+            return web.json_response(body, status=status)
+        return web.Response(status=204)
+
+    def reset(self, replies=(), delay=0):
+        self.replies = list(replies)
+        self.received = []
+        self.delay = delay
+
+
+async def drain(webhooks, timeout=10):
+    await asyncio.wait_for(webhooks.queue.join(), timeout)
+
+
+async def max_loop_lag(duration):
+    """Largest delay seen by a task sleeping in short steps."""
+    worst = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start - 0.01)
+    return worst * 1000
+
+
+async def main():
+    endpoint = StubEndpoint()
+    app = web.Application()
+    app.router.add_post("/webhook", endpoint.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    server = make_server()
+    server.config["webhooks_enabled"] = True
+    server.config["webhook_url"] = f"http://127.0.0.1:{port}/webhook"
+    server.config["webhook_backoff"] = 0.05
+    webhooks = server.webhooks
+
+    # A slow endpoint doesn't hold up the caller or the loop
+    endpoint.reset(delay=0.5)
+    start = time.perf_counter()
+    for i in range(5):
+        webhooks.kick(f"ipid{i}", "spam")
+    call_us = (time.perf_counter() - start) / 5 * 1e6
+    lag = await max_loop_lag(1.0)
+    await drain(webhooks)
+    assert len(endpoint.received) == 5
+    print(f"slow endpoint: send_webhook took {call_us:.0f} us per call, "
+          f"worst loop lag {lag:.1f} ms while delivering")
+
+    # Rate limits are waited out, server errors retried
+    endpoint.reset([(429, {"retry_after": 0.3}), (502, {}), (200, {})])
+    start = time.perf_counter()
+    webhooks.unban(1)
+    await drain(webhooks)
+    took = time.perf_counter() - start
+    assert len(endpoint.received) == 3 and took >= 0.3
+    print(f"429 then 502 then 200: delivered on attempt 3 after {took * 1000:.0f} ms")
+
+    # Client errors aren't retried
+    endpoint.reset([(400, {})])
+    webhooks.unban(2)
+    await drain(webhooks)
+    assert len(endpoint.received) == 1
+    print("400: given up after 1 attempt")
+
+    # Bursts are combined when coalescing is enabled
+    for coalesce in (False, True):
+        server.config["webhook_coalesce"] = coalesce
+        endpoint.reset(delay=0.05)
+        for i in range(30):
+            webhooks.kick(f"ipid{i}", "spam")
+        await drain(webhooks)
+        lines = sum(len(r["content"].split("\n")) for r in endpoint.received)
+        assert lines == 30
+        print(f"burst of 30, coalesce={coalesce}: {len(endpoint.received)} requests")
+    server.config["webhook_coalesce"] = False
+
+    # An unreachable endpoint only costs the retries
+    server.config["webhook_url"] = "http://127.0.0.1:1/webhook"
+    start = time.perf_counter()
+    webhooks.unban(3)
+    lag = await max_loop_lag(0.2)
+    await drain(webhooks)
+    print(f"unreachable endpoint: gave up after {(time.perf_counter() - start) * 1000:.0f} ms, "
+          f"worst loop lag {lag:.1f} ms")
+
+    # Overflowing the queue drops payloads instead of blocking
+    server.config["webhook_url"] = f"http://127.0.0.1:{port}/webhook"
+    endpoint.reset(delay=0.01)
+    size = server.config["webhook_queue_size"]
+    for i in range(size + 20):
+        webhooks.unban(i)
+    await drain(webhooks)
+    assert size <= len(endpoint.received) <= size + 1
+    print(f"{size + 20} queued at once with room for {size}: "
+          f"{len(endpoint.received)} delivered")
+
+    await webhooks.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
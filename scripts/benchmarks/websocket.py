@@ -0,0 +1,148 @@
+"""
+Check and benchmark the websocket send queue.
+
+Every packet to a webAO client used to be decoded and sent from a task of
+its own, so one IC message to 100 webAO users meant hundreds of tasks,
+with nothing keeping them in order or bounding what a slow client could
+pile up. This serves real websocket clients on localhost, and compares
+the queue against the old per-packet tasks: tasks created, websocket
+messages sent and time taken for a burst of IC messages, and whether
+every client got every packet in order. Then it checks that a client
+which stops reading is disconnected at the high-water mark.
+
+Usage: python scripts/benchmarks/websocket.py [number of clients]
+"""
+import asyncio
+import sys
+import time
+
+import websockets
+from common import make_server
+
+from server.network.aoprotocol_ws import AOProtocolWS, new_websocket_client
+
+
+class OldTransportWrapper(AOProtocolWS.TransportWrapper):
+    """The previous write: one task per packet."""
+
+    def __init__(self, websocket, server):
+        self.ws = websocket
+
+    def write(self, message):
+        message = message.decode("utf-8")
+        asyncio.ensure_future(self.ws_try_writing_message(message))
+
+    def close(self):
+        asyncio.ensure_future(self.ws.close())
+
+    async def ws_try_writing_message(self, message):
+        try:
+            await self.ws.send(message)
+        except websockets.ConnectionClosed:
+            return
+
+
+async def join(port, i):
+    ws = await websockets.connect(f"ws://127.0.0.1:{port}", max_queue=None)
+    await ws.send(f"HI#hdid{i}#%ID#1#webAO#2.10.0#%askchaa#%RC#%RM#%RD#%")
+    await ws.send(f"CC#0#{i}#hdid{i}#%")
+    return ws
+
+
+async def read_until(ws, marker, timeout=10):
+    """Read websocket messages until a packet starting with marker."""
+    packets = []
+    messages = 0
+    while True:
+        data = await asyncio.wait_for(ws.recv(), timeout)
+        messages += 1
+        for packet in data.split("#%"):
+            if packet:
+                packets.append(packet)
+        if any(p.startswith(marker) for p in packets):
+            return packets, messages
+
+
+async def run(server, port, count, lines=20):
+    clients = [await join(port, i) for i in range(count)]
+    await asyncio.sleep(0.5)
+    for ws in clients:
+        await ws.send("CT#warmup#/getarea#%")
+    # Wait until everyone is in
+    for ws in clients:
+        await read_until(ws, "CT#")
+    sender = next(c for c in server.client_manager.clients)
+
+    tasks_before = len(asyncio.all_tasks())
+    start = time.perf_counter()
+    most_tasks = 0
+    for i in range(lines):
+        sender.area.send_command("CT", "narrator", f"line {i}", "1")
+        sender.area.send_command("MS", "chat", "-", "Adrian", "normal", f"line {i}",
+                                 "wit", "", 0, sender.char_id, 0, 0, 0, 0, 0, 0)
+        most_tasks = max(most_tasks, len(asyncio.all_tasks()) - tasks_before)
+    sender.area.send_command("CT", "narrator", "done", "1")
+    results = await asyncio.gather(*(read_until(ws, "CT#narrator#done") for ws in clients))
+    took = (time.perf_counter() - start) * 1000
+
+    for packets, _messages in results:
+        lines_seen = [p.split("#")[2] for p in packets if p.startswith("CT#narrator")]
+        assert lines_seen == [f"line {i}" for i in range(lines)] + ["done"], lines_seen
+    messages = sum(m for _packets, m in results)
+    for ws in clients:
+        await ws.close()
+    await asyncio.sleep(0.2)
+    return most_tasks, messages, took
+
+
+class StalledWebsocket:
+    """A websocket whose client never reads."""
+
+    remote_address = ("203.0.113.1", 1234)
+
+    def __init__(self):
+        self.closed = False
+
+    async def send(self, message):
+        await asyncio.Future()
+
+    async def close(self):
+        self.closed = True
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server = make_server()
+    # Every client connects from 127.0.0.1
+    server.config["multiclient_limit"] = count + 1
+    async with websockets.serve(new_websocket_client(server), "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        print(f"{count} webAO clients, 41 packets each")
+        print(f"{'':>8} {'tasks':>6} {'ws messages':>12} {'ms':>6}")
+        for name, wrapper in (("before", OldTransportWrapper),
+                              ("queue", AOProtocolWS.TransportWrapper)):
+            saved = AOProtocolWS.TransportWrapper
+            AOProtocolWS.TransportWrapper = wrapper
+            try:
+                tasks, messages, took = await run(server, port, count)
+            finally:
+                AOProtocolWS.TransportWrapper = saved
+            print(f"{name:>8} {tasks:>6} {messages:>12} {took:>6.0f}")
+
+    # A client that stops reading is cut off at the high-water mark
+    server.config["websocket_high_water"] = 64 * 1024
+    ws = StalledWebsocket()
+    transport = AOProtocolWS.TransportWrapper(ws, server)
+    packet = ("CT#narrator#" + "x" * 1000 + "#1#%").encode("utf-8")
+    written = 0
+    while not ws.closed and written < 1000:
+        transport.write(packet)
+        written += 1
+        await asyncio.sleep(0)
+    assert ws.closed
+    print(f"stalled client disconnected after {written} packets "
+          f"({written * len(packet) // 1024} KiB)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,9 @@
 from server import database
 from server import commands
 from server.evidence import EvidenceList
+from server.music_list import MusicList
 from server.exceptions import ClientError, AreaError, ArgumentError, ServerError
-from server.constants import MusicEffect
+from server.constants import MusicEffect, encode_ao_command
 
 from collections import OrderedDict
 
@@ -11,14 +12,51 @@ import random
 import time
 import arrow
 
-import oyaml as yaml  # ordered yaml
-import os
 import datetime
 import logging
 
 logger = logging.getLogger("area")
 
 
+class InviteList(set):
+    """
+    The IDs of the clients invited to an area. Clients keep the set of
+    areas they are invited to in step with it, see Client.invited_areas.
+    """
+
+    def __init__(self, area):
+        super().__init__()
+        self.area = area
+
+    def _client(self, client_id):
+        return self.area.server.client_manager.by_id.get(client_id)
+
+    def add(self, client_id):
+        super().add(client_id)
+        client = self._client(client_id)
+        if client is not None:
+            client.invited_areas.add(self.area)
+
+    def discard(self, client_id):
+        super().discard(client_id)
+        client = self._client(client_id)
+        if client is not None:
+            client.invited_areas.discard(self.area)
+
+    def remove(self, client_id):
+        super().remove(client_id)
+        client = self._client(client_id)
+        if client is not None:
+            client.invited_areas.discard(self.area)
+
+    def clear(self):
+        for client_id in self:
+            client = self._client(client_id)
+            if client is not None:
+                client.invited_areas.discard(self.area)
+        super().clear()
+
+
 class Area:
     class Timer:
         """Represents a single instance of a timer in the area."""
@@ -99,9 +137,27 @@ class Area:
 
     def __init__(self, area_manager, name):
         self.clients = set()
-        self.invite_list = set()
+        # Clients counted towards the player count (not hidden or spectating)
+        self.visible_clients = set()
+        self._hide_clients = False
+        self.invite_list = InviteList(self)
         self.area_manager = area_manager
+        # Number of clients in the area playing each of the hub's characters,
+        # and the character ID each client was counted under. Kept up to date
+        # by update_char.
+        self.char_occupancy = []
+        self.char_holders = {}
+        # CharsCheck arguments and encoded packet, built when first needed
+        self.chars_check_args = None
+        self.chars_check_data = None
+        # Scheduled CharsCheck broadcast
+        self.chars_check_handle = None
+        self.reset_char_occupancy()
+        # Index in the hub's area list, kept up to date by the AreaManager.
+        # -1 while the area is not part of the hub.
+        self.id = -1
         self._name = name
+        self._abbreviation = ""
 
         # Initialize prefs
         self.background = "default"
@@ -206,7 +262,7 @@ class Area:
         # /end
 
         self.old_muted = False
-        self.old_invite_list = set()
+        self.old_invite_list = InviteList(self)
 
         # original states for resetting the area after all CMs leave in a single area CM hub
         self.o_name = self._name
@@ -236,9 +292,11 @@ class Area:
         self.jukebox_votes = []
         self.jukebox_prev_char_id = -1
 
-        self.music_list = []
+        self.music_list = MusicList()
 
         self._owners = set()
+        # CMs and the hub's GMs, kept up to date by update_owner
+        self._all_owners = set(area_manager.owners)
         self.afkers = []
 
         # Dictionary of dictionaries with further info, examine def link for more info
@@ -258,6 +316,117 @@ class Area:
             "leave": "",  # User leaves the area.
         }
 
+    @property
+    def hide_clients(self):
+        """If the area's clients are left out of the hub's player count."""
+        return self._hide_clients
+
+    @hide_clients.setter
+    def hide_clients(self, value):
+        if value != self._hide_clients:
+            delta = len(self.visible_clients)
+            self.area_manager.count += -delta if value else delta
+        self._hide_clients = value
+
+    def update_visibility(self, client):
+        """
+        Keep the area and hub player counts in line with the client's
+        presence and visibility. Call whenever either changes.
+        :param client: client
+        """
+        visible = client in self.clients and not client.hidden
+        if visible == (client in self.visible_clients):
+            return
+        if visible:
+            self.visible_clients.add(client)
+            delta = 1
+        else:
+            self.visible_clients.discard(client)
+            delta = -1
+        if not self._hide_clients:
+            self.area_manager.count += delta
+
+    def update_char(self, client):
+        """
+        Keep the character occupancy in line with the client's presence and
+        character, and let the area know if a character was taken or freed.
+        Call whenever either changes.
+        :param client: client
+        """
+        char_id = client.char_id
+        if client not in self.clients or char_id is None or not (
+            0 <= char_id < len(self.char_occupancy)
+        ):
+            char_id = None
+        old_id = self.char_holders.get(client)
+        if char_id == old_id:
+            return
+        changed = False
+        if old_id is not None:
+            self.char_occupancy[old_id] -= 1
+            changed = self.char_occupancy[old_id] == 0
+            del self.char_holders[client]
+        if char_id is not None:
+            self.char_occupancy[char_id] += 1
+            changed = changed or self.char_occupancy[char_id] == 1
+            self.char_holders[client] = char_id
+        if changed:
+            self.chars_check_args = None
+            self.chars_check_data = None
+            self.send_chars_check()
+
+    def reset_char_occupancy(self):
+        """Recount the character occupancy after the hub's character list changed."""
+        self.char_occupancy = [0] * len(self.area_manager.char_list)
+        holders = self.char_holders
+        self.char_holders = {}
+        for client in holders:
+            self.update_char(client)
+        self.chars_check_args = None
+        self.chars_check_data = None
+
+    def get_chars_check(self):
+        """
+        Get the CharsCheck arguments for the area: -1 for every taken
+        character, 0 for every free one.
+        """
+        if self.chars_check_args is None:
+            self.chars_check_args = tuple(
+                -1 if count else 0 for count in self.char_occupancy
+            )
+        return self.chars_check_args
+
+    def get_chars_check_data(self):
+        """Get the area's CharsCheck packet, encoded once for all its clients."""
+        if self.chars_check_data is None:
+            self.chars_check_data = encode_ao_command(
+                "CharsCheck", *self.get_chars_check()
+            ).encode("utf-8")
+        return self.chars_check_data
+
+    def send_chars_check(self):
+        """
+        Let everyone in the area know which characters are taken.
+        Coalesced like ARUP: sent once on the next event loop iteration, and
+        only if `chars_check_updates` is enabled.
+        """
+        if not self.server.config["chars_check_updates"]:
+            return
+        if self.chars_check_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not serving yet, nobody to update
+            return
+        self.chars_check_handle = loop.call_soon(self.flush_chars_check)
+
+    def flush_chars_check(self):
+        """Send the area's CharsCheck to everyone in it."""
+        self.chars_check_handle = None
+        for client in self.clients:
+            client.send_chars_check()
+
     @property
     def name(self):
         """Area's name string. Abbreviation is also updated according to this."""
@@ -272,9 +441,14 @@ class Area:
         self.abbreviation = self.abbreviate()
 
     @property
-    def id(self):
-        """Get area's index in the AreaManager's 'areas' list if present in its areas. Otherwise, return -1."""
-        return self.area_manager.areas.index(self) if self in self.area_manager.areas else -1
+    def abbreviation(self):
+        """Area's abbreviation string."""
+        return self._abbreviation
+
+    @abbreviation.setter
+    def abbreviation(self, value):
+        self._abbreviation = value
+        self.area_manager.area_lookup = None
 
     @property
     def server(self):
@@ -284,7 +458,18 @@ class Area:
     @property
     def owners(self):
         """Area's owners. Also appends Game Masters (Hub Managers)."""
-        return self.area_manager.owners | self._owners
+        return self._all_owners
+
+    def update_owner(self, client):
+        """
+        Keep the owners set in line with the client's CM and GM status.
+        Call whenever either changes.
+        :param client: client
+        """
+        if client in self._owners or client in self.area_manager.owners:
+            self._all_owners.add(client)
+        else:
+            self._all_owners.discard(client)
 
     def trigger(self, trig, target):
         """Call the trigger's associated command."""
@@ -638,6 +823,10 @@ class Area:
     def new_client(self, client):
         """Add a client to the area."""
         self.clients.add(client)
+        self.area_manager.clients.add(client)
+        self.area_manager.hub_manager.clients.add(client)
+        self.update_visibility(client)
+        self.update_char(client)
         if client.char_id is not None:
             database.log_area("area.join", client, self)
 
@@ -743,6 +932,10 @@ class Area:
         self.trigger("leave", client)
         if client in self.clients:
             self.clients.remove(client)
+            self.area_manager.clients.discard(client)
+            self.area_manager.hub_manager.clients.discard(client)
+        self.update_visibility(client)
+        self.update_char(client)
         if client in self.afkers:
             self.afkers.remove(client)
             self.server.client_manager.toggle_afk(client)
@@ -755,11 +948,6 @@ class Area:
         if not client.hidden:
             self.area_manager.send_arup_players()
 
-        # Update everyone's available characters list
-        # Commented out due to potentially causing clientside lag...
-        # self.send_command('CharsCheck',
-        #                     *client.get_available_char_list())
-
     def unlock(self):
         """Mark the area as unlocked."""
         self.locked = False
@@ -827,29 +1015,34 @@ class Area:
         Check if a character is available for use.
         :param char_id: character ID
         """
+        if 0 <= char_id < len(self.char_occupancy):
+            return self.char_occupancy[char_id] == 0
+        # Spectators and unknown IDs aren't counted
         return char_id not in [x.char_id for x in self.clients]
 
     def get_rand_avail_char_id(self):
         """Get a random available character ID."""
-        avail_set = set(range(len(self.area_manager.char_list))) - {
-            x.char_id for x in self.clients
-        }
-        if len(avail_set) == 0:
+        avail = [
+            char_id
+            for char_id, count in enumerate(self.char_occupancy)
+            if count == 0
+        ]
+        if len(avail) == 0:
             raise AreaError("No available characters.")
-        return random.choice(tuple(avail_set))
+        return random.choice(avail)
 
     def send_command(self, cmd, *args):
         """
         Broadcast an AO-compatible command to all clients in the area.
         """
-        for c in self.clients:
-            c.send_command(cmd, *args)
+        self.server.client_manager.broadcast_command(self.clients, cmd, *args)
 
     def send_owner_command(self, cmd, *args):
         """
         Send an AO-compatible command to all owners of the area
         that are not currently in the area.
         """
+        targets = []
         for c in self.owners:
             if c in self.clients:
                 continue
@@ -858,7 +1051,8 @@ class Area:
                 or (cmd == "CT" and c.remote_listen == 2)
                 or (cmd == "MS" and c.remote_listen == 1)
             ):
-                c.send_command(cmd, *args)
+                targets.append(c)
+        self.server.client_manager.broadcast_command(targets, cmd, *args)
 
     def send_owner_ic(self, bg, cmd, *args):
         """
@@ -1094,6 +1288,39 @@ class Area:
 
         if targets is None:
             targets = self.clients
+        ms_args = (
+            msg_type,
+            pre,
+            folder,
+            anim,
+            msg,
+            pos,
+            sfx,
+            emote_mod,
+            cid,
+            sfx_delay,
+            button,
+            evidence,
+            flip,
+            ding,
+            color,
+            showname,
+            charid_pair,
+            other_folder,
+            other_emote,
+            offset_pair,
+            other_offset,
+            other_flip,
+            nonint_pre,
+            sfx_looping,
+            screenshake,
+            frames_shake,
+            frames_realization,
+            frames_sfx,
+            additive,
+            effect,
+        )
+        receivers = []
         for c in targets:
             # Blinded clients don't receive IC messages
             if c.blinded:
@@ -1117,37 +1344,15 @@ class Area:
                     c.send_command(
                         "CT", f"[pos '{pos}'] {name}", msg)
                     continue
-            c.send_command("MS", msg_type,
-                           pre,
-                           folder,
-                           # if we're in first person mode, treat our msgs as narration
-                           "" if c == client and client.firstperson else anim,
-                           msg,
-                           pos,
-                           sfx,
-                           emote_mod,
-                           cid,
-                           sfx_delay,
-                           button,
-                           evidence,
-                           flip,
-                           ding,
-                           color,
-                           showname,
-                           charid_pair,
-                           other_folder,
-                           other_emote,
-                           offset_pair,
-                           other_offset,
-                           other_flip,
-                           nonint_pre,
-                           sfx_looping,
-                           screenshake,
-                           frames_shake,
-                           frames_realization,
-                           frames_sfx,
-                           additive,
-                           effect)
+            # if we're in first person mode, treat our msgs as narration
+            if c == client and client.firstperson:
+                lst = list(ms_args)
+                lst[3] = ""
+                c.send_command("MS", *lst)
+                continue
+            receivers.append(c)
+        # Everyone else gets the exact same packet, so only encode it once
+        self.server.client_manager.broadcast_command(receivers, "MS", *ms_args)
         if self.recording:
             # See if the testimony is supposed to end here.
             scrunched = "".join(e for e in msg if e.isalnum())
@@ -1269,13 +1474,11 @@ class Area:
         try:
             statement = self.testimony[idx]
             self.testimony_index = idx
-            targets = self.clients
-            for c in targets:
-                # Blinded clients don't receive IC messages
-                if c.blinded:
-                    continue
-                # Ignore those losers with listenpos for testimony
-                c.send_command("MS", *statement)
+            # Blinded clients don't receive IC messages
+            # Ignore those losers with listenpos for testimony
+            targets = [c for c in self.clients if not c.blinded]
+            self.server.client_manager.broadcast_command(
+                targets, "MS", *statement)
         except (ValueError, IndexError):
             raise AreaError("Invalid testimony reference!")
 
@@ -1306,42 +1509,17 @@ class Area:
         if client.narrator or client.blankpost:
             return False
         if char.lower() != client.char_name.lower():
-            for char_link in self.server.allowed_iniswaps:
-                # Only allow if both the original character and the
-                # target character are in the allowed INI swap list
-                if client.char_name in char_link and char in char_link:
-                    return False
-            return True
+            # Only allow if both the original character and the
+            # target character are in the same allowed INI swap group
+            return char not in self.server.iniswap_map.get(client.char_name, ())
         return not self.server.char_emotes[char].validate(preanim, anim, sfx)
 
     def clear_music(self):
-        self.music_list.clear()
+        self.music_list = MusicList()
         self.music_ref = ""
 
     def load_music(self, path):
-        try:
-            with open(path, "r", encoding="utf-8") as stream:
-                music_list = yaml.safe_load(stream)
-
-            prepath = ""
-            for item in music_list:
-                # deprecated, use 'replace_music' area pref instead
-                # if 'replace' in item:
-                #     self.replace_music = item['replace'] is True
-                if "use_unique_folder" in item and item["use_unique_folder"] is True:
-                    prepath = os.path.splitext(os.path.basename(path))[0] + "/"
-
-                if "category" not in item:
-                    continue
-
-                if "songs" in item:
-                    for song in item["songs"]:
-                        song["name"] = prepath + song["name"]
-            self.music_list = music_list
-        except ValueError:
-            raise
-        except AreaError:
-            raise
+        self.music_list = MusicList.load(path)
 
     def add_jukebox_vote(self, client, music_name, length=-1, showname=""):
         """
@@ -1527,7 +1705,9 @@ class Area:
             length = 120.0  # Play each song for at least 2 minutes
 
         self.music_looper = asyncio.get_running_loop().call_later(
-            max(5, length), lambda: self.start_jukebox()
+            max(5, length),
+            self.server.watchdog.wrap(
+                self.start_jukebox, "jukebox", vote_picked.name, area=self),
         )
 
     def set_ambience(self, name):
@@ -1760,6 +1940,8 @@ class Area:
         Add a CM to the area.
         """
         self._owners.add(client)
+        client.owned_areas.add(self)
+        self.update_owner(client)
 
         # Make sure the client's available areas are updated
         self.broadcast_area_list(client)
@@ -1778,6 +1960,8 @@ class Area:
         Remove a CM from the area.
         """
         self._owners.remove(client)
+        client.owned_areas.discard(self)
+        self.update_owner(client)
         if not dc and len(client.broadcast_list) > 0:
             client.broadcast_list.clear()
             client.send_ooc("Your broadcast list has been cleared.")
@@ -2084,7 +2268,9 @@ class Area:
         if header == "wait":
             secs = float(args[0]) / 1000
             self.demo_schedule = asyncio.get_running_loop().call_later(
-                secs, lambda: self.play_demo(client)
+                secs,
+                self.server.watchdog.wrap(
+                    lambda: self.play_demo(client), "demo", "playback", client, area=self),
             )
             return
         if header.startswith("/"):  # It's a command call
@@ -1,9 +1,11 @@
 from server import commands
 from server.exceptions import ClientError, AreaError, ArgumentError, ServerError
 from server.area import Area
+from server.music_list import MusicList
 from collections import OrderedDict
 
 import oyaml as yaml  # ordered yaml
+import asyncio
 import os
 import datetime
 import logging
@@ -84,11 +86,25 @@ class AreaManager:
 
     def __init__(self, hub_manager, name):
         self.hub_manager = hub_manager
+        # Index in the hub list, kept up to date by the HubManager.
+        # -1 while the hub is not part of the hub list.
+        self.id = -1
         self.areas = []
+        # Areas by name, lowercase name and abbreviation, rebuilt after
+        # an area is added, removed, moved or renamed
+        self.area_lookup = None
         self.owners = set()
+        # Clients in any of the hub's areas, kept up to date by the areas
+        self.clients = set()
+        # Number of players shown in the hub list, kept up to date by the areas
+        self.count = 0
+        # ARUP types waiting to be sent to the hub, and the scheduled send
+        self.arup_dirty = set()
+        self.arup_handle = None
 
         # prefs
         self._name = name
+        self._abbreviation = ""
         self.abbreviation = self.abbreviate()
         self.move_delay = 0
         self.arup_enabled = True
@@ -111,7 +127,7 @@ class AreaManager:
         self.o_name = self._name
         self.o_abbreviation = self.abbreviation
 
-        self.music_list = []
+        self.music_list = MusicList()
 
         # Save character information for character select screen ID's in the hub data
         # ex. {"1": {"keys": [1, 2, 3, 5], "fatigue": 100.0, "hunger": 34.0}, "2": {"keys": [4, 6, 8]}}
@@ -149,22 +165,20 @@ class AreaManager:
         self.abbreviation = self.abbreviate()
 
     @property
-    def id(self):
-        """Get area's index in the HubManager's 'hubs' list."""
-        return self.hub_manager.hubs.index(self)
+    def abbreviation(self):
+        """Hub's abbreviation string."""
+        return self._abbreviation
+
+    @abbreviation.setter
+    def abbreviation(self, value):
+        self._abbreviation = value
+        self.hub_manager.hub_lookup = None
 
     @property
     def server(self):
         """Area's server. Accesses HubManager's 'server' property"""
         return self.hub_manager.server
 
-    @property
-    def clients(self):
-        clients = set()
-        for area in self.areas:
-            clients = clients | area.clients
-        return clients
-
     def abbreviate(self):
         """Abbreviate our name."""
         if self.name.lower().startswith("hub"):
@@ -260,7 +274,10 @@ class AreaManager:
                 need_update = True
         if need_update:
             # self.char_emotes = {char: Emotes(char) for char in self.char_list}
+            for area in self.areas:
+                area.reset_char_occupancy()
             for client in self.clients:
+                self.server.client_manager.update_index(client)
                 self.send_characters(client)
                 client.char_select()
 
@@ -322,37 +339,15 @@ class AreaManager:
         return hub
 
     def clear_music(self):
-        self.music_list.clear()
+        self.music_list = MusicList()
         self.music_ref = ""
         self.replace_music = False
 
     def load_music(self, path):
-        try:
-            if not os.path.isfile(path):
-                raise AreaError(
-                    f"Hub {self.name} trying to load music list: File path {path} is invalid!")
-            with open(path, "r", encoding="utf-8") as stream:
-                music_list = yaml.safe_load(stream)
-
-            prepath = ""
-            for item in music_list:
-                # deprecated, use 'replace_music' hub pref instead
-                # if 'replace' in item:
-                #    self.replace_music = item['replace'] is True
-                if "use_unique_folder" in item and item["use_unique_folder"] is True:
-                    prepath = os.path.splitext(os.path.basename(path))[0] + "/"
-
-                if "category" not in item:
-                    continue
-
-                if "songs" in item:
-                    for song in item["songs"]:
-                        song["name"] = prepath + song["name"]
-            self.music_list = music_list
-        except ValueError:
-            raise
-        except AreaError:
-            raise
+        if not os.path.isfile(path):
+            raise AreaError(
+                f"Hub {self.name} trying to load music list: File path {path} is invalid!")
+        self.music_list = MusicList.load(path)
 
     def load_character_data(self, path="config/character_data.yaml"):
         """
@@ -430,6 +425,8 @@ class AreaManager:
             raise AreaError(f"Area limit reached! ({self.max_areas})")
         area = Area(self, f"Area {idx}")
         self.areas.append(area)
+        area.id = idx
+        self.area_lookup = None
         return area
 
     def remove_area(self, area):
@@ -438,7 +435,7 @@ class AreaManager:
         :param area: target area instance.
 
         """
-        if not (area in self.areas):
+        if area.area_manager is not self or area.id == -1:
             raise AreaError("Area not found.")
         # Make a copy because it can change size during iteration
         # (causes runtime error otherwise)
@@ -462,6 +459,8 @@ class AreaManager:
                 elif link == str(area.id):
                     del ar.links[link]
         self.areas.remove(area)
+        area.id = -1
+        self.renumber_areas()
 
     def swap_area(self, area1, area2, fix_links=True):
         """
@@ -470,16 +469,17 @@ class AreaManager:
         :param area2: second area to swap.
 
         """
-        if not (area1 in self.areas):
+        if area1.area_manager is not self or area1.id == -1:
             raise AreaError("First area not found.")
-        if not (area2 in self.areas):
+        if area2.area_manager is not self or area2.id == -1:
             raise AreaError("Second area not found.")
         # Grab the indexes
-        a = self.areas.index(area1)
-        b = self.areas.index(area2)
+        a = area1.id
+        b = area2.id
 
         # Swap 'em good
         self.areas[a], self.areas[b] = self.areas[b], self.areas[a]
+        self.renumber_areas()
 
         if fix_links:
             # Turn indexes to string
@@ -508,6 +508,7 @@ class AreaManager:
         Add a GM to the Hub.
         """
         self.owners.add(client)
+        self.update_owner(client)
 
         # Make sure the client's available areas are updated
         client.area.broadcast_area_list(client)
@@ -523,6 +524,7 @@ class AreaManager:
         Remove a GM from the Hub.
         """
         self.owners.remove(client)
+        self.update_owner(client)
         if len(client.broadcast_list) > 0:
             client.broadcast_list.clear()
             client.send_ooc("Your broadcast list has been cleared.")
@@ -541,6 +543,14 @@ class AreaManager:
         )
         client.hide(False)
 
+    def update_owner(self, client):
+        """
+        Update every area's owners after the client's GM status changed.
+        :param client: client
+        """
+        for area in self.areas:
+            area.update_owner(client)
+
     def get_gms(self):
         """
         Get a list of GMs.
@@ -555,28 +565,51 @@ class AreaManager:
         """Get the default area."""
         return self.areas[0]
 
+    def renumber_areas(self):
+        """Update the area IDs after areas were added, removed or moved."""
+        for i, area in enumerate(self.areas):
+            area.id = i
+        self.area_lookup = None
+
+    def get_area_lookup(self):
+        """
+        Get the dictionaries used to find areas by name, lowercase name
+        and abbreviation. When several areas share one, the first wins.
+        """
+        if self.area_lookup is None:
+            by_name = {}
+            by_lower_name = {}
+            by_abbreviation = {}
+            for area in self.areas:
+                by_name.setdefault(area.name, area)
+                by_lower_name.setdefault(area.name.lower(), area)
+                by_abbreviation.setdefault(area.abbreviation, area)
+            self.area_lookup = (by_name, by_lower_name, by_abbreviation)
+        return self.area_lookup
+
     def get_area_by_name(self, name, case_sensitive=False):
         """Get an area by name."""
-        for area in self.areas:
-            a_name = area.name.lower() if case_sensitive else area.name
-            name = name.lower() if case_sensitive else name
-            if a_name == name:
-                return area
-        raise AreaError("Area not found.")
+        by_name, by_lower_name, _ = self.get_area_lookup()
+        if case_sensitive:
+            area = by_lower_name.get(name.lower())
+        else:
+            area = by_name.get(name)
+        if area is None:
+            raise AreaError("Area not found.")
+        return area
 
     def get_area_by_id(self, num):
         """Get an area by ID."""
-        for area in self.areas:
-            if area.id == num:
-                return area
+        if isinstance(num, int) and 0 <= num < len(self.areas):
+            return self.areas[num]
         raise AreaError("Area not found.")
 
     def get_area_by_abbreviation(self, abbr):
         """Get an area by abbreviation."""
-        for area in self.areas:
-            if area.abbreviation == abbr:
-                return area
-        raise AreaError("Area not found.")
+        area = self.get_area_lookup()[2].get(abbr)
+        if area is None:
+            raise AreaError("Area not found.")
+        return area
 
     def send_command(self, cmd, *args):
         """
@@ -609,82 +642,107 @@ class AreaManager:
 
     def send_arup_players(self, clients=None):
         """Broadcast ARUP packet containing player counts."""
-        if not self.arup_enabled:
-            return
-        players_list = [0]
-        if len(self.server.hub_manager.hubs) > 1:
-            players_list = [0, -1]
-        if clients is None:
-            clients = self.clients
-        for client in clients:
-            for area in client.local_area_list:
-                playercount = -1
-                if not self.hide_clients and not area.hide_clients:
-                    playercount = len(
-                        [c for c in area.clients if not c.hidden])
-                players_list.append(playercount)
-                playerhubcount = 0
-                for area in client.local_area_list:
-                    for c in area.clients:
-                        if (
-                            not self.hide_clients
-                            and not area.hide_clients
-                            and not c.hidden
-                        ):
-                            playerhubcount = playerhubcount + 1
-                if len(self.server.hub_manager.hubs) > 1:
-                    players_list[1] = playerhubcount
-            self.server.send_arup(client, players_list)
+        self.send_arup(0, clients)
 
     def send_arup_status(self, clients=None):
         """Broadcast ARUP packet containing area statuses."""
-        if not self.arup_enabled:
-            return
-        status_list = [1]
-        if len(self.server.hub_manager.hubs) > 1:
-            status_list = [1, "GAMING"]
-        if clients is None:
-            clients = self.clients
-        for client in clients:
-            for area in client.local_area_list:
-                status = area.status
-                if status == "IDLE":
-                    status = ""
-                status_list.append(status)
-            self.server.send_arup(client, status_list)
+        self.send_arup(1, clients)
 
     def send_arup_cms(self, clients=None):
         """Broadcast ARUP packet containing area CMs."""
-        if not self.arup_enabled:
-            return
-        cms_list = [2]
-        if len(self.server.hub_manager.hubs) > 1:
-            cms_list = [2, "Double-Click for Hubs"]
-        if clients is None:
-            clients = self.clients
-        for client in clients:
-            for area in client.local_area_list:
-                cm = ""
-                if len(area.owners) > 0:
-                    cm = area.get_owners()
-                cms_list.append(cm)
-            self.server.send_arup(client, cms_list)
+        self.send_arup(2, clients)
 
     def send_arup_lock(self, clients=None):
         """Broadcast ARUP packet containing the lock status of each area."""
+        self.send_arup(3, clients)
+
+    def send_arup(self, arup_type, clients=None):
+        """
+        Send an ARUP packet of the given type.
+        Packets for specific clients are sent right away. Hub-wide updates are
+        coalesced: the type is marked dirty and everyone in the hub is updated
+        once on the next event loop iteration (or after `arup_interval` seconds).
+        :param arup_type: 0 for players, 1 for status, 2 for CMs, 3 for locks
+        :param clients: clients to update right away (Default value = None)
+        """
+        if not self.arup_enabled:
+            return
+        if clients is not None:
+            values = {}
+            for client in clients:
+                self.send_arup_to(client, arup_type, values, force=True)
+            return
+        self.arup_dirty.add(arup_type)
+        if self.arup_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not serving yet, nothing to coalesce with
+            self.flush_arup()
+            return
+        interval = self.server.config["arup_interval"]
+        if interval > 0:
+            self.arup_handle = loop.call_later(interval, self.flush_arup)
+        else:
+            self.arup_handle = loop.call_soon(self.flush_arup)
+
+    def flush_arup(self):
+        """Send the pending ARUP updates to everyone in the hub."""
+        self.arup_handle = None
+        dirty = self.arup_dirty
+        self.arup_dirty = set()
         if not self.arup_enabled:
             return
-        lock_list = [3]
+        for arup_type in sorted(dirty):
+            # Each area's value is only worked out once per flush
+            values = {}
+            for client in self.clients:
+                self.send_arup_to(client, arup_type, values)
+
+    def get_arup_value(self, arup_type, area):
+        """Get what an ARUP packet of the given type shows for an area."""
+        if arup_type == 0:
+            if self.hide_clients or area.hide_clients:
+                return -1
+            return len(area.visible_clients)
+        if arup_type == 1:
+            if area.status == "IDLE":
+                return ""
+            return area.status
+        if arup_type == 2:
+            if len(area.owners) > 0:
+                return area.get_owners()
+            return ""
+        if area.locked:
+            return "LOCKED"
+        if area.muted:
+            return "SPECTATABLE"
+        return ""
+
+    def send_arup_to(self, client, arup_type, values, force=False):
+        """
+        Send an ARUP packet to a client if it differs from the last one it got.
+        :param client: client
+        :param arup_type: 0 for players, 1 for status, 2 for CMs, 3 for locks
+        :param values: area -> value cache shared between clients
+        :param force: send even if the client already has this packet
+        """
+        area_values = []
+        for area in client.local_area_list:
+            if area not in values:
+                values[area] = self.get_arup_value(arup_type, area)
+            area_values.append(values[area])
+        args = [arup_type]
         if len(self.server.hub_manager.hubs) > 1:
-            lock_list = [3, ""]
-        if clients is None:
-            clients = self.clients
-        for client in clients:
-            for area in client.local_area_list:
-                state = ""
-                if area.locked:
-                    state = "LOCKED"
-                elif area.muted:
-                    state = "SPECTATABLE"
-                lock_list.append(state)
-            self.server.send_arup(client, lock_list)
+            # The first entry is the "Double-Click for Hubs" pseudo-area
+            if arup_type == 0:
+                args.append(sum(v for v in area_values if v != -1))
+            else:
+                args.append(("GAMING", "Double-Click for Hubs", "")[arup_type - 1])
+        args += area_values
+        args = tuple(args)
+        if not force and client.arup_sent.get(arup_type) == args:
+            return
+        client.arup_sent[arup_type] = args
+        self.server.send_arup(client, list(args))
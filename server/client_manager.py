@@ -2,15 +2,14 @@ import re
 import string
 import time
 import math
-import os
+import asyncio
 from heapq import heappop, heappush
 
 
 from server import database
-from server.constants import TargetType, encode_ao_packet, contains_URL
+from server.constants import TargetType, encode_ao_command, contains_URL
 from server.exceptions import ClientError, AreaError, ServerError
-
-import oyaml as yaml  # ordered yaml
+from server.music_list import MusicList
 
 
 class ClientManager:
@@ -99,6 +98,11 @@ class ClientManager:
                     self.server.config["ooc_floodguard"]["times_per_interval"]
                 )
             ]
+            # Areas we're a CM of, and areas with our ID on the invite list,
+            # so disconnecting only visits those
+            self.owned_areas = set()
+            self.invited_areas = set()
+
             # security stuff
             self.clientscon = 0
             self.gm_save_time = 0
@@ -116,7 +120,9 @@ class ClientManager:
             self.hidden_in = None
             self.sneaking = False
             self.listen_pos = None
-            self.following = None
+            self._following = None
+            # Clients following us, kept up to date by the following setter
+            self.followers = set()
             self.forced_to_follow = False
             self.edit_ambience = False
             # if we're currently trying to set a song for the minigame
@@ -143,18 +149,27 @@ class ClientManager:
 
             # a list of all areas the client can currently see
             self.local_area_list = []
+            # Last ARUP arguments sent to the client, by ARUP type
+            self.arup_sent = {}
+            # Set while the client isn't keeping up with what we send it (see
+            # AOProtocol.pause_writing). Packets that are only updates of some
+            # state are dropped meanwhile, and sent again on resume.
+            self.write_paused = False
+            self.write_pauses = 0
+            self.dropped_packets = 0
+            self.dropped_commands = set()
             # a list of all songs the client can currently see
-            self.local_music_list = []
+            self.local_music_list = MusicList()
             # reference to the storage/musiclists/ref.yaml for displaying purposes
             self.music_ref = ""
             # a music list that was loaded manually by the client
-            self.music_list = []
+            self.music_list = MusicList()
             # whether or not to replace music list with ours
             self.replace_music = False
             # list of areas to broadcast the message, music and judge buttons to
             self.broadcast_list = []
             # Whether we're viewing hub list or not in the A/M area list
-            self.viewing_hub_list = False
+            self._viewing_hub_list = False
             # Whether or not the client used the /showname command
             self.used_showname_command = False
 
@@ -178,12 +193,143 @@ class ClientManager:
             # rock paper scissors choice
             self.rps_choice = ""
 
+            # Packets waiting to be written to the transport, see send_raw_data
+            self.output = []
+
         def send_raw_message(self, msg):
             """
             Send a raw packet over TCP.
             :param msg: string to send
             """
-            self.transport.write(msg.encode("utf-8"))
+            self.send_raw_data(msg.encode("utf-8"))
+
+        def send_raw_data(self, data):
+            """
+            Send an already encoded packet over TCP.
+            Packets sent during the same event loop iteration are written to
+            the transport together, once it ends (see flush_output).
+            :param data: bytes to send
+            """
+            self.output.append(data)
+            if len(self.output) == 1:
+                self.server.client_manager.schedule_flush(self)
+
+        def flush_output(self):
+            """Write the packets waiting in the output buffer to the transport."""
+            if len(self.output) == 0:
+                return
+            if len(self.output) == 1:
+                data = self.output[0]
+            else:
+                data = b"".join(self.output)
+            self.output.clear()
+            self.transport.write(data)
+            self.server.metrics.bytes_out += len(data)
+            if self.write_paused:
+                buffered = self.get_buffered_bytes()
+                if buffered > self.server.config["write_buffer_max"]:
+                    self.write_paused = False
+                    database.log_misc("disconnect.slow", self, data=buffered)
+                    # close() would wait for the buffer to drain
+                    self.transport.abort()
+
+        def get_buffered_bytes(self):
+            """Get how many bytes are waiting to be sent to the client."""
+            return self.transport.get_write_buffer_size() + sum(
+                len(data) for data in self.output)
+
+        def drop_packet(self, command, args):
+            """
+            Check whether a packet should be left out because the client is
+            falling behind. Only packets that get sent again on resume are.
+            :param command: command name
+            :param args: tuple of arguments
+            :returns: True if the packet should not be sent
+            """
+            if command not in ("ARUP", "CharsCheck"):
+                return False
+            self.dropped_packets += 1
+            self.dropped_commands.add(command)
+            if command == "ARUP":
+                # Make sure it doesn't look like the client has it
+                self.arup_sent.pop(args[0], None)
+            return True
+
+        def pause_writing(self):
+            """Stop sending non-critical packets until resume_writing."""
+            self.write_paused = True
+            self.write_pauses += 1
+
+        def resume_writing(self):
+            """Catch the client up on the packets dropped while paused."""
+            self.write_paused = False
+            dropped = self.dropped_commands
+            self.dropped_commands = set()
+            if "ARUP" in dropped:
+                area_manager = self.area.area_manager
+                area_manager.send_arup_players([self])
+                area_manager.send_arup_status([self])
+                area_manager.send_arup_cms([self])
+                area_manager.send_arup_lock([self])
+            if "CharsCheck" in dropped:
+                self.send_chars_check()
+
+        def prepare_command(self, command, args):
+            """
+            Apply the tweaks this client needs to an outgoing AO-compatible message.
+            :param command: command name
+            :param args: tuple of arguments
+            :returns: the arguments to send (the very same tuple if nothing
+            had to change), or None if the message should not be sent
+            """
+            if self.write_paused and self.drop_packet(command, args):
+                return None
+            if not args:
+                return args
+            # Area list packet
+            if command == "FA":
+                # Fresh area list, so whatever ARUP the client had is stale
+                self.arup_sent.clear()
+            # Music packet
+            elif command == "MC":
+                channel = int(args[4])
+                # If this MC packet is using multilayer audio and the client doesn't support it
+                # ...or we got an invalid channel
+                if channel < 0 or (channel > 0 and not self.has_multilayer_audio):
+                    # Ignore the packet, don't send the music
+                    return None
+                if channel in [0, 1]:
+                    self.playing_audio[channel] = args[0]
+            # IC Message packet
+            elif command == "MS":
+                lst = None
+                # The pos is blank, we're using last pos.
+                if args[5] == "":
+                    if self.area.last_ic_message is not None:
+                        # Set the pos to last message's pos
+                        lst = list(args)
+                        lst[5] = self.area.last_ic_message[5]
+                    elif len(self.area.pos_lock) > 0:
+                        # Set the pos to the 0th pos-lock
+                        lst = list(args)
+                        lst[5] = self.area.pos_lock[0]
+                for evi_num in range(len(self.evi_list)):
+                    if self.evi_list[evi_num] == args[11]:
+                        if evi_num != args[11]:
+                            if lst is None:
+                                lst = list(args)
+                            lst[11] = evi_num
+                        break
+                # If we have someone using the DRO 1.1.0 Client
+                if self.version.startswith("1.1.0"):
+                    if lst is None:
+                        lst = list(args)
+                    lst[16] = ""  # No video support :(
+                    lst[17] = 0  # no hiding character
+                    lst[18] = self.id  # sender character id
+                if lst is not None:
+                    args = tuple(lst)
+            return args
 
         def send_command(self, command, *args):
             """
@@ -192,52 +338,10 @@ class ClientManager:
             :param command: command name
             :param *args: list of arguments
             """
-            if args:
-                # Music packet
-                if command == "MC":
-                    channel = int(args[4])
-                    # If this MC packet is using multilayer audio and the client doesn't support it
-                    # ...or we got an invalid channel
-                    if channel < 0 or (channel > 0 and not self.has_multilayer_audio):
-                        # Ignore the packet, don't send the music
-                        return
-                    if channel in [0, 1]:
-                        self.playing_audio[channel] = args[0]
-                # IC Message packet
-                if command == "MS":
-                    # The pos is blank, we're using last pos.
-                    if args[5] == "":
-                        lst = list(args)
-                        if self.area.last_ic_message is not None:
-                            # Set the pos to last message's pos
-                            lst[5] = self.area.last_ic_message[5]
-                        else:
-                            # Set the pos to the 0th pos-lock
-                            if len(self.area.pos_lock) > 0:
-                                lst[5] = self.area.pos_lock[0]
-                        args = tuple(lst)
-                    for evi_num in range(len(self.evi_list)):
-                        if self.evi_list[evi_num] == args[11]:
-                            lst = list(args)
-                            lst[11] = evi_num
-                            args = tuple(lst)
-                            break
-                    # If we have someone using the DRO 1.1.0 Client
-                    if self.version.startswith("1.1.0"):
-                        lst = list(args)
-                        lst[16] = ""  # No video support :(
-                        lst[17] = 0  # no hiding character
-                        lst[18] = self.id  # sender character id
-                        args = tuple(lst)
-            command, *args = encode_ao_packet([command] + list(args))
-            message = f"{command}#"
-            for arg in args:
-                # Evidence packet uses tuples to construct its evidence entries
-                if type(arg) is tuple:
-                    # AO2 evidence packet uses & to separate pieces of evidence
-                    arg = "&".join(arg)
-                message += f"{arg}#"
-            self.send_raw_message(message + "%")
+            args = self.prepare_command(command, args)
+            if args is None:
+                return
+            self.send_raw_message(encode_ao_command(command, *args))
 
         def send_ooc(self, msg):
             """
@@ -288,6 +392,8 @@ class ClientManager:
 
         def disconnect(self):
             """Disconnect the client gracefully."""
+            # Send what is waiting first, e.g. the reason for a kick
+            self.flush_output()
             self.transport.close()
 
         def change_character(self, char_id, force=False):
@@ -330,11 +436,11 @@ class ClientManager:
             arup = (self.char_id == -1 or char_id == -
                     1) and self.char_id != char_id
             self.char_id = char_id
+            self.server.client_manager.update_index(self)
+            self.area.update_visibility(self)
+            self.area.update_char(self)
             self.pos = ""
             self.send_command("PV", self.id, "CID", self.char_id)
-            # Commented out due to potentially causing clientside lag...
-            # self.area.send_command('CharsCheck',
-            #                        *self.get_available_char_list())
             if arup:
                 self.area.area_manager.send_arup_players()
             new_char = self.char_name
@@ -629,34 +735,11 @@ class ClientManager:
 
         def clear_music(self):
             self.music_ref = ""
-            self.music_list.clear()
+            self.music_list = MusicList()
 
         def load_music(self, path):
             """Load a music list from a path. Use it for the local music list and reload it."""
-            # TODO: Move the musiclist parsing function to tsuserver3.py or something
-            try:
-                with open(path, "r", encoding="utf-8") as stream:
-                    music_list = yaml.safe_load(stream)
-
-                prepath = ""
-                for item in music_list:
-                    if (
-                        "use_unique_folder" in item
-                        and item["use_unique_folder"] is True
-                    ):
-                        prepath = os.path.splitext(
-                            os.path.basename(path))[0] + "/"
-
-                    if "category" not in item:
-                        continue
-
-                    for song in item["songs"]:
-                        song["name"] = prepath + song["name"]
-                self.music_list = music_list
-            except ValueError:
-                raise
-            except AreaError:
-                raise
+            self.music_list = MusicList.load(path)
 
         def construct_music_list(self):
             """
@@ -664,7 +747,7 @@ class ClientManager:
             :param client_music: when True, include the client's music in the equation.
             """
             # Server music list
-            song_list = self.server.music_list
+            layers = [self.server.music_list]
 
             # Hub music list
             if (
@@ -672,9 +755,9 @@ class ClientManager:
                 and len(self.area.area_manager.music_list) > 0
             ):
                 if self.area.area_manager.replace_music:
-                    song_list = self.area.area_manager.music_list
+                    layers = [self.area.area_manager.music_list]
                 else:
-                    song_list = song_list + self.area.area_manager.music_list
+                    layers.append(self.area.area_manager.music_list)
 
             # Area music list
             if (
@@ -683,9 +766,9 @@ class ClientManager:
                 and len(self.area.music_list) > 0
             ):
                 if self.area.replace_music:
-                    song_list = self.area.music_list
+                    layers = [self.area.music_list]
                 else:
-                    song_list = song_list + self.area.music_list
+                    layers.append(self.area.music_list)
 
             # Client music list
             if (
@@ -699,33 +782,35 @@ class ClientManager:
                 and len(self.music_list) > 0
             ):
                 if self.replace_music:
-                    song_list = self.music_list
+                    layers = [self.music_list]
                 else:
-                    song_list = song_list + self.music_list
+                    layers.append(self.music_list)
 
-            return song_list
+            # The same layering always gives back the same (cached) list
+            return MusicList.combine(*layers)
 
         def refresh_music(self):
             """
             Rebuild the client's music list, updating the local music list if there was a change.
             """
             song_list = self.construct_music_list()
-            if self.local_music_list != song_list:
-                self.reload_music_list(song_list)
+            if self.local_music_list is song_list:
+                return
+            if self.local_music_list.names == song_list.names:
+                # Same songs from different lists, nothing to resend
+                self.local_music_list = song_list
+                return
+            self.reload_music_list(song_list)
 
-        def reload_music_list(self, music=[]):
+        def reload_music_list(self, music=None):
             """
-            Rebuild the music list with the provided array, or the server music list as a whole.
+            Rebuild the music list with the provided music list, or the server music list as a whole.
             """
-            song_list = []
-
-            if len(music) > 0:
-                song_list = music
-            else:
-                song_list = self.server.music_list
+            if music is None or len(music) <= 0:
+                music = self.server.music_list
 
             self.local_music_list = music
-            song_list = self.server.build_music_list(song_list)
+            song_list = self.server.build_music_list(music)
             # KEEP THE ASTERISK
             self.send_command("FM", *song_list)
 
@@ -778,6 +863,8 @@ class ClientManager:
             if self in old_area.clients:
                 old_area.remove_client(self)
             self.area = area
+            # The character name depends on the hub's character list
+            self.server.client_manager.update_index(self)
 
             if old_area.area_manager != area.area_manager and old_area.area_manager.char_list != area.area_manager.char_list:
                 # Send them that hub's char list
@@ -804,29 +891,7 @@ class ClientManager:
 
             self.area.area_manager.send_arup_players()
 
-            for hub in self.server.hub_manager.hubs:
-                count = 0
-                for c in hub.clients:
-                    if not c.area.hide_clients and not c.hidden:
-                        count = count + 1
-                hub.count = count
-            for c in self.server.client_manager.clients:
-                if c.viewing_hub_list:
-                    c.send_command(
-                        "FA",
-                        *[
-                            "🌐 Hubs 🌐\n Double-Click me to see Areas\n  _______",
-                            *[
-                                f"[{hub.id}] {hub.name} (users: {hub.count})"
-                                for hub in self.server.hub_manager.hubs
-                            ],
-                        ],
-                    )
-
-            # Update everyone's available characters list
-            # Commented out due to potentially causing clientside lag...
-            # self.area.send_command('CharsCheck',
-            #                        *self.get_available_char_list())
+            self.server.hub_manager.send_hub_list()
             # Get defense HP bar
             self.send_command("HP", 1, self.area.hp_def)
             # Get prosecution HP bar
@@ -1013,7 +1078,7 @@ class ClientManager:
             self.set_area(area, target_pos)
             self.last_move_time = round(time.time() * 1000.0)
 
-            for c in self.server.client_manager.clients:
+            for c in list(self.followers):
                 # If target c is following us
                 if c.following == self:
                     if self.area.area_manager != c.area.area_manager:
@@ -1604,7 +1669,10 @@ class ClientManager:
             selection screen, even if the client has already joined.
             """
             self.char_id = -1
-            self.send_command("CharsCheck", *self.get_available_char_list())
+            self.server.client_manager.update_index(self)
+            self.area.update_visibility(self)
+            self.area.update_char(self)
+            self.send_chars_check()
             self.send_command("HP", 1, self.area.hp_def)
             self.send_command("HP", 2, self.area.hp_pro)
             if self.area.dark:
@@ -1643,19 +1711,23 @@ class ClientManager:
 
         def get_available_char_list(self):
             """Get a list of character IDs that the client can select."""
-            if len(self.charcurse) > 0:
-                avail_char_ids = set(range(len(self.area.area_manager.char_list))) and set(
-                    self.charcurse
-                )
-            else:
-                avail_char_ids = set(range(len(self.area.area_manager.char_list))) - {
-                    x.char_id for x in self.area.clients
-                }
+            if len(self.charcurse) == 0:
+                return list(self.area.get_chars_check())
             char_list = [-1] * len(self.area.area_manager.char_list)
-            for x in avail_char_ids:
-                char_list[x] = 0
+            for x in self.charcurse:
+                if 0 <= x < len(char_list):
+                    char_list[x] = 0
             return char_list
 
+        def send_chars_check(self):
+            """Send the client which characters it can select."""
+            if self.write_paused and self.drop_packet("CharsCheck", ()):
+                return
+            if len(self.charcurse) > 0:
+                self.send_command("CharsCheck", *self.get_available_char_list())
+            else:
+                self.send_raw_data(self.area.get_chars_check_data())
+
         def auth_mod(self, password):
             """
             Attempt to log in as a moderator.
@@ -1774,6 +1846,32 @@ class ClientManager:
             self.area.area_manager.set_character_data(
                 self.char_id, "desc", value)
 
+        @property
+        def viewing_hub_list(self):
+            """Whether we're viewing hub list or not in the A/M area list."""
+            return self._viewing_hub_list
+
+        @viewing_hub_list.setter
+        def viewing_hub_list(self, value):
+            self._viewing_hub_list = value
+            if value:
+                self.server.hub_manager.hub_list_viewers.add(self)
+            else:
+                self.server.hub_manager.hub_list_viewers.discard(self)
+
+        @property
+        def following(self):
+            """The client we're following, or None."""
+            return self._following
+
+        @following.setter
+        def following(self, value):
+            if self._following is not None:
+                self._following.followers.discard(self)
+            self._following = value
+            if value is not None:
+                value.followers.add(self)
+
         @property
         def hidden(self):
             """Return if the character is hidden or not. Always True if char_id is -1 (spectator)"""
@@ -1822,6 +1920,7 @@ class ClientManager:
                         self.last_move_time = round(time.time() * 1000.0)
 
             self._hidden = tog
+            self.area.update_visibility(self)
             self.send_ooc(f"You are {msg} from /getarea and playercounts.")
             self.area.area_manager.send_arup_players()
 
@@ -1930,14 +2029,26 @@ class ClientManager:
     def __init__(self, server):
         self.clients = set()
         self.server = server
+        # Clients with packets in their output buffer, and the scheduled flush
+        self.unflushed = set()
+        self.flush_handle = None
         self.cur_id = [i for i in range(self.server.config["playerlimit"])]
 
+        # Lookup tables for get_targets
+        self.by_id = {}
+        self.by_ipid = {}
+        self.by_ip = {}
+        self.by_hdid = {}
+        self.by_ooc_name = {}
+        self.by_char_name = {}
+        # client -> (hdid, OOC name, char name) it is currently indexed under
+        self.indexed_keys = {}
+
     def new_client_preauth(self, client):
         maxclients = self.server.config["multiclient_limit"]
-        for c in self.server.client_manager.clients:
-            if c.ipid == client.ipid:
-                if c.clientscon > maxclients:
-                    return False
+        for c in self.by_ipid.get(client.ipid, ()):
+            if c.clientscon > maxclients:
+                return False
         return True
 
     def new_client(self, transport):
@@ -1956,35 +2067,58 @@ class ClientManager:
         c = self.Client(self.server, transport, user_id,
                         database.ipid(peername))
         self.clients.add(c)
-        temp_ipid = c.ipid
-        for client in self.server.client_manager.clients:
-            if client.ipid == temp_ipid:
-                client.clientscon += 1
+        self.index_client(c)
+        for client in self.by_ipid[c.ipid]:
+            client.clientscon += 1
         return c
 
+    def schedule_flush(self, client):
+        """
+        Have a client's output buffer written out at the end of the current
+        event loop iteration, together with every other client's.
+        :param client: client with packets waiting
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not serving yet, nothing to coalesce with
+            client.flush_output()
+            return
+        self.unflushed.add(client)
+        if self.flush_handle is None:
+            self.flush_handle = loop.call_soon(self.flush_output)
+
+    def flush_output(self):
+        """Write out every client's output buffer."""
+        self.flush_handle = None
+        unflushed = self.unflushed
+        self.unflushed = set()
+        for client in unflushed:
+            client.flush_output()
+
     def remove_client(self, client):
         """
         Remove a disconnected client from the client list.
         :param client: disconnected client
         """
+        self.unflushed.discard(client)
+        client.output.clear()
         if client in client.area.area_manager.owners:
             client.area.area_manager.owners.remove(client)
-        for hub in self.server.hub_manager.hubs:
-            for a in hub.areas:
-                if client in a._owners:
-                    a.remove_owner(client, dc=True)
-                # This discards the client's ID from any of the area invite lists
-                # as that ID will no longer refer to this specific player.
-                if client.id in a.invite_list:
-                    a.invite_list.discard(client.id)
+            client.area.area_manager.update_owner(client)
+        for a in list(client.owned_areas):
+            a.remove_owner(client, dc=True)
+        # This discards the client's ID from any of the area invite lists
+        # as that ID will no longer refer to this specific player.
+        for a in list(client.invited_areas):
+            a.invite_list.discard(client.id)
         heappush(self.cur_id, client.id)
-        temp_ipid = client.ipid
-        for c in self.server.client_manager.clients:
-            if c.ipid == temp_ipid:
-                c.clientscon -= 1
-            if c.following == client:
-                c.unfollow()
+        for c in self.by_ipid.get(client.ipid, ()):
+            c.clientscon -= 1
+        for c in list(client.followers):
+            c.unfollow()
         self.clients.remove(client)
+        self.unindex_client(client)
 
         # TODO: Maybe take into account than sending the "CU" packet can reveal your cover.
         # So you could simply treat the hidden client as if they didn't declare their char_url.
@@ -1995,24 +2129,105 @@ class ClientManager:
             clients = (c for c in client.area.clients if c.id != client.id)
             for c in clients:
                 c.remove_user_link(client.char_name)
-        for hub in self.server.hub_manager.hubs:
-            count = 0
-            for c in hub.clients:
-                if not c.area.hide_clients and not c.hidden:
-                    count = count + 1
-            hub.count = count
-        for c in self.server.client_manager.clients:
-            if c.viewing_hub_list:
-                c.send_command(
-                    "FA",
-                    *[
-                        "🌐 Hubs 🌐\n Double-Click me to see Areas\n  _______",
-                        *[
-                            f"[{hub.id}] {hub.name} (users: {hub.count})"
-                            for hub in self.server.hub_manager.hubs
-                        ],
-                    ],
-                )
+        self.server.hub_manager.hub_list_viewers.discard(client)
+        self.server.hub_manager.send_hub_list()
+
+    def broadcast_command(self, clients, command, *args):
+        """
+        Send an AO-compatible message to several clients, encoding it only once.
+        Clients that need their own variant of the message (see
+        Client.prepare_command) get it encoded separately.
+        :param clients: iterable of recipients
+        :param command: command name
+        :param *args: list of arguments
+        """
+        data = None
+        last_args = None
+        last_data = None
+        for client in clients:
+            client_args = client.prepare_command(command, args)
+            if client_args is None:
+                continue
+            if client_args is args:
+                if data is None:
+                    data = encode_ao_command(command, *args).encode("utf-8")
+                client.send_raw_data(data)
+                continue
+            # Recipients in the same area usually end up with the same rewrite
+            if last_args is None or client_args != last_args:
+                last_args = client_args
+                last_data = encode_ao_command(
+                    command, *client_args).encode("utf-8")
+            client.send_raw_data(last_data)
+
+    @staticmethod
+    def _index_add(table, key, client):
+        table.setdefault(key, set()).add(client)
+
+    @staticmethod
+    def _index_discard(table, key, client):
+        clients = table.get(key)
+        if clients is None:
+            return
+        clients.discard(client)
+        if len(clients) <= 0:
+            del table[key]
+
+    def index_client(self, client):
+        """
+        Add a newly connected client to the lookup tables used by get_targets.
+        :param client: client
+        """
+        self.by_id[client.id] = client
+        self._index_add(self.by_ipid, client.ipid, client)
+        self._index_add(self.by_ip, str(client.ip).lower(), client)
+        self.update_index(client)
+
+    def update_index(self, client):
+        """
+        Bring the lookup tables up to date with the client's HDID, OOC name
+        and character name. Must be called whenever any of those change,
+        including when the client moves to a hub with a different character list.
+        :param client: client
+        """
+        if client.id not in self.by_id:
+            return
+        keys = (client.hdid, client.name.lower(), client.char_name.lower())
+        old_keys = self.indexed_keys.get(client)
+        if old_keys == keys:
+            return
+        tables = (self.by_hdid, self.by_ooc_name, self.by_char_name)
+        if old_keys is not None:
+            for table, key in zip(tables, old_keys):
+                self._index_discard(table, key, client)
+        for table, key in zip(tables, keys):
+            self._index_add(table, key, client)
+        self.indexed_keys[client] = keys
+
+    def unindex_client(self, client):
+        """
+        Remove a disconnected client from the lookup tables.
+        :param client: client
+        """
+        if self.by_id.get(client.id) is client:
+            del self.by_id[client.id]
+        self._index_discard(self.by_ipid, client.ipid, client)
+        self._index_discard(self.by_ip, str(client.ip).lower(), client)
+        old_keys = self.indexed_keys.pop(client, None)
+        if old_keys is not None:
+            tables = (self.by_hdid, self.by_ooc_name, self.by_char_name)
+            for table, key in zip(tables, old_keys):
+                self._index_discard(table, key, client)
+
+    @staticmethod
+    def _index_prefixes(table, value, allow_empty=False):
+        """Find every client indexed under a prefix of `value`."""
+        matches = []
+        for i in range(0 if allow_empty else 1, len(value) + 1):
+            clients = table.get(value[:i])
+            if clients is not None:
+                matches.extend(clients)
+        return matches
 
     def get_targets(self, client, key, value, local=False, single=False, all_hub=False):
         """
@@ -2029,37 +2244,50 @@ class ClientManager:
         """
         targets = []
         if key == TargetType.ALL:
-            for nkey in range(6):
+            for nkey in (
+                TargetType.IP,
+                TargetType.OOC_NAME,
+                TargetType.ID,
+                TargetType.CHAR_NAME,
+                TargetType.IPID,
+                TargetType.HDID,
+            ):
                 targets += self.get_targets(client, nkey, value, local)
-        if all_hub and not local:
-            hubs = self.server.hub_manager.hubs
-        else:
-            hubs = [client.area.area_manager]
-        for hub in hubs:
+            return targets
+
+        if key == TargetType.IP:
+            matches = self._index_prefixes(self.by_ip, str(value).lower())
+        elif key == TargetType.OOC_NAME:
+            matches = self._index_prefixes(self.by_ooc_name, str(value).lower())
+        elif key == TargetType.CHAR_NAME:
+            matches = self._index_prefixes(self.by_char_name, str(value).lower())
+        elif key == TargetType.ID:
+            target = self.by_id.get(value)
+            matches = [] if target is None else [target]
+        elif key == TargetType.IPID:
+            matches = list(self.by_ipid.get(value, ()))
+        elif key == TargetType.HDID:
+            matches = list(self.by_hdid.get(value, ()))
+        elif key == TargetType.AFK:
             if local:
                 areas = [client.area]
+            elif all_hub:
+                areas = [a for hub in self.server.hub_manager.hubs for a in hub.areas]
             else:
-                areas = hub.areas
-            for area in areas:
-                for client in area.clients:
-                    if key == TargetType.IP:
-                        if value.lower().startswith(client.ip.lower()):
-                            targets.append(client)
-                    elif key == TargetType.OOC_NAME:
-                        if value.lower().startswith(client.name.lower()) and client.name:
-                            targets.append(client)
-                    elif key == TargetType.CHAR_NAME:
-                        if value.lower().startswith(client.char_name.lower()):
-                            targets.append(client)
-                    elif key == TargetType.ID:
-                        if client.id == value:
-                             targets.append(client)
-                    elif key == TargetType.IPID:
-                        if client.ipid == value:
-                            targets.append(client)
-                    elif key == TargetType.AFK:
-                        if client in area.afkers:
-                            targets.append(client)
+                areas = client.area.area_manager.areas
+            return [c for area in areas for c in area.afkers]
+        else:
+            return targets
+
+        if local:
+            targets = [c for c in matches if c.area == client.area]
+        elif all_hub:
+            targets = matches
+        else:
+            hub = client.area.area_manager
+            targets = [c for c in matches if c.area.area_manager == hub]
+        if len(targets) > 1:
+            targets.sort(key=lambda c: (c.area.area_manager.id, c.area.id))
         return targets
 
     def get_muted_clients(self):
@@ -1,5 +1,6 @@
 def call(client, cmd, arg):
     import sys
+    import time
 
     me = sys.modules[__name__]
     called_function = f"ooc_cmd_{cmd}"
@@ -11,7 +12,19 @@ def call(client, cmd, arg):
             f"Invalid command: {cmd}. Use /help to find up-to-date commands."
         )
         return
-    getattr(me, called_function)(client, arg)
+    metrics = client.server.metrics
+    name = called_function[len("ooc_cmd_"):]
+    error = False
+    start = time.perf_counter()
+    try:
+        getattr(me, called_function)(client, arg)
+    except Exception:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe_command(name, elapsed, error=error)
+        client.server.watchdog.check(elapsed, "command", name, client)
 
 
 def submodules():
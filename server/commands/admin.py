@@ -33,6 +33,11 @@ __all__ = [
     "ooc_cmd_restart",
     "ooc_cmd_myid",
     "ooc_cmd_multiclients",
+    "ooc_cmd_buffers",
+    "ooc_cmd_metrics",
+    "ooc_cmd_lag",
+    "ooc_cmd_profile",
+    "ooc_cmd_memprofile",
 ]
 
 
@@ -570,3 +575,139 @@ def ooc_cmd_multiclients(client, arg):
             info += f": {c.name}"
     info += f"\nMatched {len(found_clients)} online clients."
     client.send_ooc(info)
+
+
+@mod_only()
+def ooc_cmd_buffers(client, arg):
+    """
+    Show the clients that are falling behind on what the server sends them: bytes waiting to be sent,
+    how often they fell behind, and how many packets were skipped for them.
+    Usage: /buffers
+    """
+    if len(arg) > 0:
+        raise ArgumentError("This command takes no arguments")
+    clients = [
+        (c.get_buffered_bytes(), c)
+        for c in client.server.client_manager.clients
+    ]
+    clients = [
+        (buffered, c) for buffered, c in clients
+        if buffered > 0 or c.write_pauses > 0
+    ]
+    clients.sort(key=lambda x: x[0], reverse=True)
+    info = "Clients falling behind:"
+    for buffered, c in clients:
+        info += f"\n[{c.id}] {c.showname} ({c.ipid}): {buffered} bytes waiting"
+        if c.write_paused:
+            info += " (paused)"
+        info += f", fell behind {c.write_pauses} time(s), {c.dropped_packets} packet(s) skipped"
+    info += f"\nMatched {len(clients)} online clients."
+    client.send_ooc(info)
+
+
+@mod_only()
+def ooc_cmd_metrics(client, arg):
+    """
+    Show a summary of the server metrics: bytes sent and received, event loop lag, database queue,
+    webhook and Discord bridge delivery, clients per hub, and the packet types and commands that took the most time.
+    Usage: /metrics
+    """
+    if len(arg) > 0:
+        raise ArgumentError("This command takes no arguments")
+    metrics = client.server.metrics
+    if not metrics.enabled:
+        client.send_ooc(
+            "Metrics are disabled. Set metrics_enabled in config.yaml to collect them.\n"
+            + metrics.delivery_summary())
+        return
+    client.send_ooc(metrics.summary())
+
+
+@mod_only()
+def ooc_cmd_lag(client, arg):
+    """
+    Show how late the server is running, and the recent packets, commands, timers and database calls
+    that held it up the most.
+    Usage: /lag
+    """
+    if len(arg) > 0:
+        raise ArgumentError("This command takes no arguments")
+    watchdog = client.server.watchdog
+    info = f"Event loop lag: {watchdog.last_lag * 1000:.1f} ms now, {watchdog.max_lag * 1000:.1f} ms at worst."
+    slow_calls = watchdog.worst()
+    info += f"\nCalls over {watchdog.threshold * 1000:.0f} ms, slowest first:"
+    for slow in slow_calls:
+        info += f"\n{arrow.get(slow.timestamp).to('local').format('HH:mm:ss')} {slow.seconds * 1000:.0f} ms: {slow}"
+    info += f"\nMatched {len(slow_calls)} slow calls."
+    client.send_ooc(info)
+
+
+@mod_only()
+def ooc_cmd_profile(client, arg):
+    """
+    Find out what the server spends its time on by sampling its stack. The stacks are written under logs/
+    in the collapsed format flamegraph tools read.
+    `start` starts sampling for `duration` (at most the configured maximum), forgetting earlier samples.
+    `stop` stops sampling and writes the stacks, and `dump` writes the stacks sampled so far.
+    Without arguments, shows what the profiler is doing.
+    Usage: /profile [start [duration]|stop|dump]
+    """
+    args = arg.split()
+    profiler = client.server.profiler
+    if len(args) == 0:
+        client.send_ooc(profiler.status())
+    elif args[0] == "start" and len(args) <= 2:
+        if profiler.running:
+            raise ClientError("The profiler is already running.")
+        duration = None
+        if len(args) == 2:
+            duration = pytimeparse.parse(args[1])
+            if duration is None or duration <= 0:
+                raise ArgumentError("Invalid duration.")
+        profiler.start(duration)
+        database.log_misc("profile.start", client, data=duration)
+        client.send_ooc(
+            f"Profiling for {profiler.deadline - profiler.started:g} seconds. Use /profile stop to stop early.")
+    elif args[0] == "stop" and len(args) == 1:
+        if not profiler.running:
+            raise ClientError("The profiler is not running.")
+        profiler.stop()
+        path = profiler.dump()
+        client.send_ooc(f"{profiler.status()}\nStacks written to {path}.")
+    elif args[0] == "dump" and len(args) == 1:
+        if profiler.started is None:
+            raise ClientError("The profiler has not been started.")
+        path = profiler.dump()
+        client.send_ooc(f"{profiler.status()}\nStacks written to {path}.")
+    else:
+        raise ArgumentError("Usage: /profile [start [duration]|stop|dump]")
+
+
+@mod_only()
+def ooc_cmd_memprofile(client, arg):
+    """
+    Find out what the server's memory is used by. Traces allocations for `duration` (30 seconds by default,
+    at most the configured maximum), then writes a report under logs/ with the memory used by clients, areas,
+    evidence, music lists, testimony and the database, and the places that allocated the most.
+    Usage: /memprofile [duration]
+    """
+    memprofiler = client.server.memprofiler
+    if memprofiler.running:
+        raise ClientError("A memory profile is already being taken.")
+    duration = 30
+    if len(arg) > 0:
+        duration = pytimeparse.parse(arg)
+        if duration is None or duration <= 0:
+            raise ArgumentError("Invalid duration. Usage: /memprofile [duration]")
+
+    def done(path):
+        if client not in client.server.client_manager.clients:
+            return
+        if path is None:
+            client.send_ooc("Couldn't write the memory report, check the server log.")
+        else:
+            client.send_ooc(f"Memory report written to {path}.")
+
+    duration = memprofiler.start(duration, done)
+    database.log_misc("memprofile", client, data=duration)
+    client.send_ooc(f"Tracing allocations for {duration:g} seconds.")
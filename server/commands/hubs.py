@@ -179,13 +179,12 @@ def ooc_cmd_load_hub(client, arg):
         client.area.area_manager.broadcast_ooc("Hub clearing initiated...")
         client.server.hub_manager.load()
         client.send_ooc("Success, loading all Hubs from areas.yaml...")
-        clients = set()
         for hub in client.server.hub_manager.hubs:
             hub.send_arup_status()
             hub.send_arup_cms()
             hub.send_arup_lock()
-            clients = clients | hub.clients
-        client.server.client_manager.refresh_music(clients)
+        client.server.client_manager.refresh_music(
+            client.server.hub_manager.clients)
         client.send_ooc("Success, sending ARUP and refreshing music...")
 
 
@@ -216,13 +215,12 @@ def ooc_cmd_overlay_hub(client, arg):
     else:
         client.server.hub_manager.load()
         client.send_ooc("Overlaying all Hubs from areas.yaml...")
-        clients = set()
         for hub in client.server.hub_manager.hubs:
             hub.send_arup_status()
             hub.send_arup_cms()
             hub.send_arup_lock()
-            clients = clients | hub.clients
-        client.server.client_manager.refresh_music(clients)
+        client.server.client_manager.refresh_music(
+            client.server.hub_manager.clients)
         client.send_ooc("Success, sending ARUP and refreshing music...")
 
 
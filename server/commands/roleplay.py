@@ -841,8 +841,13 @@ def ooc_cmd_timer(client, arg):
         if timer.schedule:
             timer.schedule.cancel()
         if timer.started:
+            timer_expired = client.server.watchdog.wrap(
+                timer.timer_expired, "timer", str(timer_id), client,
+                area=timer.area if timer_id != 0 else None,
+                hub=client.area.area_manager,
+            )
             timer.schedule = asyncio.get_running_loop().call_later(
-                int(timer.static.total_seconds()), timer.timer_expired
+                int(timer.static.total_seconds()), timer_expired
             )
 
 
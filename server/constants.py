@@ -67,6 +67,76 @@ def censor(text, censor_list=[], replace="*", whole_words=True):
     return text
 
 
+class Censor:
+    """
+    Replaces restricted words in a single pass.
+    The whole-word and partial lists are compiled into one regular expression
+    when the censor list is loaded. Plain words are grouped by their first
+    letter so that the expression stays fast with hundreds of entries; entries
+    using regex syntax are kept as they are.
+    Where restricted words overlap, the longest match is replaced.
+    """
+
+    def __init__(self, whole=None, partial=None, replace="*"):
+        """
+        :param whole: words that are only matched as full words
+        :param partial: words that are matched anywhere, even inside other words
+        :param replace: what to replace every letter of the word with
+        """
+        self.replace = replace
+        alternatives = []
+        whole = self._compile_words(whole)
+        if whole is not None:
+            alternatives.append(rf"\b{whole}\b")
+        partial = self._compile_words(partial)
+        if partial is not None:
+            alternatives.append(partial)
+        self.pattern = None
+        if len(alternatives) > 0:
+            self.pattern = re.compile("|".join(alternatives), re.IGNORECASE)
+
+    @staticmethod
+    def _compile_words(words):
+        """Build a regular expression matching any of the words."""
+        if words is None or len(words) <= 0:
+            return None
+        # Plain words are grouped by their first letter, which lets the
+        # regex engine skip most of the list at every position. This is kept
+        # flat on purpose: the server runs with a very low recursion limit.
+        groups = {}
+        other = []
+        for word in words:
+            word = str(word)
+            if word == "":
+                continue
+            if re.escape(word) != word:
+                # Already regex syntax (or has characters that need escaping)
+                other.append(f"(?:{word})")
+                continue
+            word = word.lower()
+            groups.setdefault(word[0], set()).add(word[1:])
+        if len(groups) + len(other) <= 0:
+            return None
+        alternatives = []
+        for first, rests in sorted(groups.items()):
+            # Longest first, so that the longest restricted word wins
+            rests = sorted(rests, key=lambda rest: (-len(rest), rest))
+            alternatives.append(f"{first}(?:{'|'.join(rests)})")
+        return f"(?:{'|'.join(alternatives + other)})"
+
+    def _replace_match(self, match):
+        return len(match.group()) * self.replace
+
+    def scrub(self, text):
+        """
+        Replace every restricted word in the text with the replace char.
+        Returns a parsed string.
+        """
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._replace_match, text)
+
+
 def remove_URL(sample):
     """Remove URLs from a sample string"""
     return re.sub(r"http\S+", "", sample)
@@ -101,6 +171,26 @@ def encode_ao_packet(params):
             )
     return new_params
 
+
+def encode_ao_command(command, *args):
+    """
+    Compose an AO-compatible message, with arguments delimited by `#`
+    and ending with `#%`.
+    :param command: command name
+    :param *args: list of arguments
+    :returns: the message as a string
+    """
+    command, *args = encode_ao_packet([command] + list(args))
+    message = f"{command}#"
+    for arg in args:
+        # Evidence packet uses tuples to construct its evidence entries
+        if type(arg) is tuple:
+            # AO2 evidence packet uses & to separate pieces of evidence
+            arg = "&".join(arg)
+        message += f"{arg}#"
+    return message + "%"
+
+
 def derelative(sample):
     while '../' in sample or '/..' in sample or '..\\' in sample or '\\..' in sample:
         sample = sample.replace(
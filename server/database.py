@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
-from functools import reduce
+from functools import reduce, wraps
 from textwrap import dedent
 
 from .exceptions import ServerError
@@ -10,6 +10,9 @@ import os
 import asyncio
 import sqlite3
 import json
+import queue
+import threading
+import time
 
 import arrow
 
@@ -19,6 +22,10 @@ logger = logging.getLogger("database")
 
 
 DB_FILE = "storage/db.sqlite3"
+# Queued log events are written once this many are pending...
+LOG_BATCH_SIZE = 500
+# ...or once the oldest pending event is this many seconds old.
+LOG_FLUSH_INTERVAL = 1.0
 _database_singleton = None
 
 
@@ -29,6 +36,170 @@ def __getattr__(name):
     return getattr(_database_singleton, name)
 
 
+class LogWriter(threading.Thread):
+    """
+    Writes area, connect and misc events to the database in batches on
+    a dedicated thread and connection, so that logging does not block
+    the event loop.
+    """
+
+    # Sentinels understood by the writer thread
+    _FLUSH = "flush"
+    _STOP = "stop"
+
+    def __init__(self, database, batch_size=LOG_BATCH_SIZE, interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name="database-log-writer", daemon=True)
+        self.database = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue()
+
+    @property
+    def pending(self):
+        """Approximate number of events waiting to be written."""
+        return self.queue.qsize()
+
+    def put(self, event_type, values):
+        """
+        Queue an event for writing.
+        :param event_type: one of "area", "connect" or "misc"
+        :param values: row values in the order expected by the writer
+        """
+        self.queue.put((event_type, values))
+
+    def flush(self, timeout=None):
+        """
+        Block until every event queued so far has been committed.
+        :param timeout: seconds to wait at most (Default value = None)
+        """
+        if not self.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put((self._FLUSH, done))
+        done.wait(timeout)
+
+    def stop(self, timeout=None):
+        """Write out everything that is still queued and stop the thread."""
+        if not self.is_alive():
+            return
+        self.queue.put((self._STOP, None))
+        self.join(timeout)
+
+    def run(self):
+        conn = sqlite3.connect(DB_FILE)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.row_factory = sqlite3.Row
+        try:
+            running = True
+            while running:
+                batch = self._next_batch()
+                events = [e for e in batch if e[0] not in (self._FLUSH, self._STOP)]
+                if len(events) > 0:
+                    self._write(conn, events)
+                for event_type, arg in batch:
+                    if event_type == self._FLUSH:
+                        arg.set()
+                    elif event_type == self._STOP:
+                        running = False
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        """
+        Wait for an event, then keep collecting until the batch is full,
+        the flush interval runs out, or a flush/stop is requested.
+        """
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size and batch[-1][0] not in (
+            self._FLUSH,
+            self._STOP,
+        ):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, events):
+        try:
+            with conn:
+                for event_type, values in events:
+                    self._insert(conn, event_type, values)
+        except sqlite3.Error:
+            # Atoms created in the rolled back transaction are gone again
+            self.database.load_subtype_atoms(conn)
+            # Don't lose the whole batch to one bad row
+            logger.exception("Failed to write a batch of log events")
+            for event_type, values in events:
+                try:
+                    with conn:
+                        self._insert(conn, event_type, values)
+                except sqlite3.Error:
+                    self.database.load_subtype_atoms(conn)
+                    logger.exception("Dropped %s log event %s",
+                                     event_type, values)
+
+    def _insert(self, conn, event_type, values):
+        if event_type == "area":
+            subtype_id = self.database._subtype_atom(conn, "area", values[9])
+            conn.execute(
+                dedent(
+                    """
+                INSERT INTO area_events(event_time, ipid, hub_id, hub_name, area_id, area_name,
+                    ic_name, char_name, ooc_name, event_subtype, message, target_ipid)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """
+                ),
+                values[:9] + (subtype_id,) + values[10:],
+            )
+        elif event_type == "connect":
+            conn.execute(
+                dedent(
+                    """
+                INSERT INTO connect_events(event_time, ipid, hdid, failed)
+                VALUES (?, ?, ?, ?)
+                """
+                ),
+                values,
+            )
+        elif event_type == "misc":
+            subtype_id = self.database._subtype_atom(conn, "misc", values[3])
+            conn.execute(
+                dedent(
+                    """
+                INSERT INTO misc_events(event_time, ipid, target_ipid, event_subtype,
+                    event_data) VALUES (?, ?, ?, ?, ?)
+                """
+                ),
+                values[:3] + (subtype_id,) + values[4:],
+            )
+
+
+def _timed(func):
+    """Report how long a database call took to the call hook, if one is set."""
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.call_hook is None:
+            return func(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.call_hook(func.__name__, time.perf_counter() - start)
+
+    return wrapper
+
+
+def _timestamp():
+    """Current time in the format used by CURRENT_TIMESTAMP."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
 class Database:
     """
     Represents a connection to an SQLite database that persists
@@ -43,6 +214,38 @@ class Database:
         if new:
             self.migrate_json_to_v1()
         self.migrate()
+        # Event subtype name -> ID, keyed by (event type, subtype name)
+        self.subtype_atoms = {}
+        self.subtype_atom_hits = 0
+        self.subtype_atom_misses = 0
+        self.load_subtype_atoms(self.db)
+        # Let the log writer commit while the server keeps reading
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.log_writer = LogWriter(self)
+        self.log_writer.start()
+        # Called with the name and duration of every timed database call
+        self.call_hook = None
+
+    def set_call_hook(self, hook):
+        """
+        Set the function to report database call durations to.
+        :param hook: function taking the call name and seconds, or None
+        """
+        self.call_hook = hook
+
+    def flush(self):
+        """Wait until all queued log events have been written."""
+        self.log_writer.flush()
+
+    def close(self):
+        """Write out queued log events and close the database."""
+        self.log_writer.stop()
+        self.db.close()
+        logger.info(
+            "Event subtype cache: %s hits, %s misses",
+            self.subtype_atom_hits,
+            self.subtype_atom_misses,
+        )
 
     def migrate_json_to_v1(self):
         """Migrate to v1 of the database from JSON."""
@@ -162,6 +365,7 @@ class Database:
                 conn.executescript(file.read())
         logger.debug("Migration to v%s complete", version)
 
+    @_timed
     def ipid(self, ip):
         """Get an IPID from an IP address."""
         with self.db as conn:
@@ -183,6 +387,7 @@ class Database:
             ).fetchone()["ipid"]
             return ipid
 
+    @_timed
     def add_hdid(self, ipid, hdid):
         """Associate an HDID with an IPID."""
         with self.db as conn:
@@ -195,6 +400,7 @@ class Database:
                 (hdid, ipid),
             )
 
+    @_timed
     def ban(
         self,
         target_id,
@@ -258,10 +464,13 @@ class Database:
 
         return ban_id
 
+    @_timed
     def last_known_name(self, ipid):
         """
         Find the last known OOC name of an IPID.
         """
+        # OOC names come from the event log, which is written asynchronously
+        self.flush()
         with self.db as conn:
             row = conn.execute(
                 dedent(
@@ -331,6 +540,7 @@ class Database:
             """
             return _database_singleton.last_known_name(self.banned_by)
 
+    @_timed
     def find_ban(self, ipid=None, hdid=None, ban_id=None):
         """Check if an IPID and/or HDID are banned."""
         with self.db as conn:
@@ -363,6 +573,7 @@ class Database:
             else:
                 return None
 
+    @_timed
     def unban(self, ban_id):
         """Remove a ban entry."""
         logger.info("Unbanning %s", ban_id)
@@ -377,6 +588,7 @@ class Database:
             ).rowcount
             return unbans > 0
 
+    @_timed
     def schedule_unbans(self):
         """
         Schedule unbans from the database.
@@ -433,7 +645,6 @@ class Database:
             else (None, None, None)
         )
         target_ipid = target.ipid if target is not None else None
-        subtype_id = self._subtype_atom("area", event_subtype)
         if isinstance(message, dict):
             message = json.dumps(message)
 
@@ -445,29 +656,23 @@ class Database:
             f"[H{area.area_manager.id} A{area.id} '{area.name}'] {showname}"
             + f"/{client.name} ({client.ipid}): event {event_subtype} ({message})"
         )
-        with self.db as conn:
-            conn.execute(
-                dedent(
-                    """
-                INSERT INTO area_events(ipid, hub_id, hub_name, area_id, area_name, ic_name, char_name, ooc_name,
-                    event_subtype, message, target_ipid)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                ),
-                (
-                    ipid,
-                    area.area_manager.id,
-                    area.area_manager.name,
-                    area.id,
-                    area.name,
-                    client._showname,
-                    char_name,
-                    ooc_name,
-                    subtype_id,
-                    message,
-                    target_ipid,
-                ),
-            )
+        self.log_writer.put(
+            "area",
+            (
+                _timestamp(),
+                ipid,
+                area.area_manager.id,
+                area.area_manager.name,
+                area.id,
+                area.name,
+                client._showname,
+                char_name,
+                ooc_name,
+                event_subtype,
+                message,
+                target_ipid,
+            ),
+        )
 
     def log_connect(self, client, failed=False):
         """Log a connect attempt."""
@@ -475,15 +680,8 @@ class Database:
             f"{client.ipid} (HDID: {client.hdid}) "
             + f'{"was blocked from connecting" if failed else "connected"}.'
         )
-        with self.db as conn:
-            conn.execute(
-                dedent(
-                    """
-                INSERT INTO connect_events(ipid, hdid, failed) VALUES (?, ?, ?)
-                """
-                ),
-                (client.ipid, client.hdid, failed),
-            )
+        self.log_writer.put(
+            "connect", (_timestamp(), client.ipid, client.hdid, failed))
 
     def log_misc(self, event_subtype, client=None, target=None, data=None):
         """
@@ -492,22 +690,16 @@ class Database:
         """
         client_ipid = client.ipid if client is not None else None
         target_ipid = target.ipid if target is not None else None
-        subtype_id = self._subtype_atom("misc", event_subtype)
         data_json = json.dumps(data)
         logger.info(
             "%s (%s onto %s): %s", event_subtype, client_ipid, target_ipid, data)
 
-        with self.db as conn:
-            conn.execute(
-                dedent(
-                    """
-                INSERT INTO misc_events(ipid, target_ipid, event_subtype,
-                    event_data) VALUES (?, ?, ?, ?)
-                """
-                ),
-                (client_ipid, target_ipid, subtype_id, data_json),
-            )
+        self.log_writer.put(
+            "misc", (_timestamp(), client_ipid,
+                     target_ipid, event_subtype, data_json)
+        )
 
+    @_timed
     def recent_bans(self, count=5):
         """
         Get the most recent bans in chronological order.
@@ -528,26 +720,49 @@ class Database:
                 ).fetchall()
             ]
 
-    def _subtype_atom(self, event_type, event_subtype):
+    def load_subtype_atoms(self, conn):
+        """Fill the event subtype cache with every subtype in the database."""
+        atoms = {}
+        for event_type in ("area", "misc"):
+            for row in conn.execute(
+                f"SELECT type_id, type_name FROM {event_type}_event_types"
+            ).fetchall():
+                atoms[(event_type, row["type_name"])] = row["type_id"]
+        self.subtype_atoms = atoms
+
+    def _subtype_atom(self, conn, event_type, event_subtype):
+        """
+        Translate an event subtype to its ID, creating it if necessary.
+        Known subtypes are served from memory; new ones are created inside
+        the caller's transaction on `conn`.
+        """
         if event_type not in ("area", "misc"):
             raise AssertionError()
 
-        with self.db as conn:
-            conn.execute(
-                dedent(
-                    f"""
-                INSERT OR IGNORE INTO {event_type}_event_types(type_name)
-                VALUES (?)
-                """
-                ),
-                (event_subtype,),
-            )
-            return conn.execute(
-                dedent(
-                    f"""
-                SELECT type_id FROM {event_type}_event_types
-                WHERE type_name = ?
-                """
-                ),
-                (event_subtype,),
-            ).fetchone()["type_id"]
+        key = (event_type, event_subtype)
+        type_id = self.subtype_atoms.get(key)
+        if type_id is not None:
+            self.subtype_atom_hits += 1
+            return type_id
+        self.subtype_atom_misses += 1
+
+        conn.execute(
+            dedent(
+                f"""
+            INSERT OR IGNORE INTO {event_type}_event_types(type_name)
+            VALUES (?)
+            """
+            ),
+            (event_subtype,),
+        )
+        type_id = conn.execute(
+            dedent(
+                f"""
+            SELECT type_id FROM {event_type}_event_types
+            WHERE type_name = ?
+            """
+            ),
+            (event_subtype,),
+        ).fetchone()["type_id"]
+        self.subtype_atoms[key] = type_id
+        return type_id
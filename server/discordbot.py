@@ -1,25 +1,48 @@
 from urllib import parse
 import asyncio
+import time
 import discord
 from discord.ext import commands
 from discord.utils import escape_markdown
-from discord.errors import Forbidden, HTTPException
+from discord.errors import Forbidden, HTTPException, NotFound
+
+# Discord's limit on the length of a message
+MAX_MESSAGE_LENGTH = 2000
 
 
 class Bridgebot(commands.Bot):
     """
     The AO2 Discord bridge self.
+
+    IC messages bound for Discord wait in a bounded FIFO queue. A sender
+    task sends them through the channel's webhook, at most once every
+    `tickspeed` seconds, combining consecutive lines from the same
+    character into one message in the meantime.
     """
 
     def __init__(self, server, target_chanel, hub_id, area_id):
         intents = discord.Intents.all()
         super().__init__(command_prefix="$", intents=intents)
         self.server = server
-        self.pending_messages = []
+        queue_size = server.config["bridgebot"].get("queue_size", 100)
+        self.pending_messages = asyncio.Queue(queue_size)
+        # Message taken off the queue that couldn't be combined with the last
+        self.held = None
+        self.sender = None
+        # Webhook of the channel, looked up again only if sending fails
+        self.webhook = None
         self.hub_id = hub_id
         self.area_id = area_id
         self.target_channel = target_chanel
 
+        # Counters
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self.total_latency = 0
+        self.max_latency = 0
+
     async def init(self, token):
         """Starts the actual bot"""
         print("Trying to start the Discord Bridge bot...")
@@ -44,7 +67,30 @@ class Bridgebot(commands.Bot):
                 anim_url = base + parse.quote(
                     "characters/" + charname + "/" + anim + ".png"
                 )
-        self.pending_messages.append([name, message, avatar_url, anim_url])
+        if self.pending_messages.full():
+            # Drop the oldest message, the newer ones matter more to the chat
+            self.pending_messages.get_nowait()
+            self.dropped += 1
+        self.pending_messages.put_nowait(
+            (name, message, avatar_url, anim_url, time.monotonic())
+        )
+
+    def get_stats(self):
+        """
+        Get the bridge's counters.
+        :returns: dict of queue depth, messages sent, dropped and failed,
+            Discord messages sent, and average and worst seconds a message
+            waited before being sent
+        """
+        return {
+            "queue_depth": self.pending_messages.qsize() + (self.held is not None),
+            "sent": self.sent,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "avg_latency": self.total_latency / self.sent if self.sent else 0,
+            "max_latency": self.max_latency,
+        }
 
     async def on_ready(self):
         print("Discord Bridge Successfully logged in.")
@@ -56,11 +102,66 @@ class Bridgebot(commands.Bot):
         )
         await self.wait_until_ready()
 
-        while True:
-            if len(self.pending_messages) > 0:
-                await self.send_char_message(*self.pending_messages.pop())
+        # on_ready runs again after reconnecting, but one sender is enough
+        self.webhook = None
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.ensure_future(self.send_forever())
 
+    async def send_forever(self):
+        """Send queued messages to Discord until cancelled."""
+        while True:
+            batch = [await self.next_message()]
+            # Let lines pile up while waiting out the interval
             await asyncio.sleep(max(0.1, self.server.config["bridgebot"]["tickspeed"]))
+            name, message, avatar, image, _queued = batch[0]
+            while image is None:
+                line = self.held
+                if line is None:
+                    if self.pending_messages.empty():
+                        break
+                    line = self.pending_messages.get_nowait()
+                self.held = None
+                if (
+                    line[0] != name
+                    or line[2] != avatar
+                    or line[3] is not None
+                    or len(message) + 1 + len(line[1]) > MAX_MESSAGE_LENGTH
+                ):
+                    self.held = line
+                    break
+                message += "\n" + line[1]
+                batch.append(line)
+
+            if await self.send_char_message(name, message, avatar, image):
+                now = time.monotonic()
+                self.sent += len(batch)
+                self.batches += 1
+                for line in batch:
+                    latency = now - line[4]
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+            else:
+                self.failed += len(batch)
+
+    async def next_message(self):
+        """Get the oldest message waiting to be sent."""
+        if self.held is not None:
+            line = self.held
+            self.held = None
+            return line
+        return await self.pending_messages.get()
+
+    async def get_webhook(self):
+        """Get the bridge's webhook in the channel, creating it if needed."""
+        if self.webhook is None:
+            webhooks = await self.channel.webhooks()
+            for hook in webhooks:
+                if hook.user == self.user or hook.name == "AO2_Bridgebot":
+                    self.webhook = hook
+                    break
+            if self.webhook is None:
+                self.webhook = await self.channel.create_webhook(name="AO2_Bridgebot")
+        return self.webhook
 
     async def on_message(self, message):
         # Screw these loser bots
@@ -90,24 +191,27 @@ class Bridgebot(commands.Bot):
         # await self.process_commands(message)
 
     async def send_char_message(self, name, message, avatar=None, image=None):
-        webhook = None
+        """
+        Send a message through the bridge's webhook.
+        :returns: True if the message was sent
+        """
         embed = None
+        if image is not None:
+            embed = discord.Embed()
+            embed.set_image(url=image)
         try:
-            webhooks = await self.channel.webhooks()
-            for hook in webhooks:
-                if hook.user == self.user or hook.name == "AO2_Bridgebot":
-                    webhook = hook
-                    break
-            if webhook is None:
-                webhook = await self.channel.create_webhook(name="AO2_Bridgebot")
-            if image is not None:
-                embed = discord.Embed()
-                embed.set_image(url=image)
-                print(avatar, image)
-            await webhook.send(message, username=name, avatar_url=avatar, embed=embed)
+            webhook = await self.get_webhook()
+            try:
+                await webhook.send(message, username=name, avatar_url=avatar, embed=embed)
+            except NotFound:
+                # The webhook was deleted, make a new one
+                self.webhook = None
+                webhook = await self.get_webhook()
+                await webhook.send(message, username=name, avatar_url=avatar, embed=embed)
             print(
                 f'[DiscordBridge] Sending message from "{name}" to "{self.channel.name}"'
             )
+            return True
         except Forbidden:
             print(
                 f'[DiscordBridge] Insufficient permissions - couldnt send char message "{name}: {message}" with avatar "{avatar}" to "{self.channel.name}"'
@@ -120,3 +224,6 @@ class Bridgebot(commands.Bot):
             # This is a workaround to a problem - [Errno 104] Connection reset by peer occurs due to too many calls for this func.
             # Simple solution is to increase the tickspeed config so it waits longer between messages sent.
             print(f"[DiscordBridge] Exception - {ex}")
+        # Look the webhook up again next time, in case it's what went wrong
+        self.webhook = None
+        return False
@@ -1,7 +1,10 @@
 from os import path
 from configparser import ConfigParser
 
+import json
 import logging
+import os
+import threading
 
 logger = logging.getLogger("emotes")
 
@@ -14,10 +17,33 @@ class Emotes:
     used for validating which emotes can be sent by clients.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, emotes=None):
+        """
+        :param name: character folder name
+        :param emotes: (preanim, anim, sfx) tuples to use instead of
+            reading the char.ini (Default value = None)
+
+        """
         self.name = name
         self.emotes = set()
-        self.read_ini()
+        # Indexes of the emotes for validate: (preanim, anim) pairs, and
+        # each of the two on their own for when the other is left out
+        self.pairs = set()
+        self.preanims = set()
+        self.anims = set()
+        if emotes is None:
+            self.read_ini()
+        else:
+            for emote in emotes:
+                self.add_emote(*emote)
+
+    def add_emote(self, preanim, anim, sfx):
+        """Add an emote to the list and the indexes."""
+        preanim, anim, sfx = preanim.lower(), anim.lower(), sfx.lower()
+        self.emotes.add((preanim, anim, sfx))
+        self.pairs.add((preanim, anim))
+        self.preanims.add(preanim)
+        self.anims.add(anim)
 
     def read_ini(self):
         char_ini = ConfigParser(
@@ -57,8 +83,7 @@ class Emotes:
 
                     # sfx checking is not performed due to custom sfx being possible, so don't bother for now
                     sfx = ""
-                    self.emotes.add(
-                        (preanim.lower(), anim.lower(), sfx.lower()))
+                    self.add_emote(preanim, anim, sfx)
                 except KeyError as e:
                     logger.warning(
                         "Broken key %s in character file %s. "
@@ -86,10 +111,110 @@ class Emotes:
         if len(self.emotes) == 0:
             return True
         # sfx checking is skipped due to custom sound list
-        sfx = ""
-        # Loop through emotes
-        for emote in self.emotes:
-            # If we find an emote that matches all 3, allow it
-            if (preanim == "" or emote[0] == preanim) and (anim == "" or emote[1] == anim) and (sfx == "" or emote[2] == sfx):
-                return True
-        return False
+        # An empty preanim or anim matches any
+        if preanim == "":
+            return anim == "" or anim in self.anims
+        if anim == "":
+            return preanim in self.preanims
+        return (preanim, anim) in self.pairs
+
+
+class EmoteCache:
+    """
+    The emote lists of a character list, read when first needed.
+
+    Parsed char.ini files are remembered in a cache file together with the
+    file's modification time, so only new or changed files are parsed
+    again after a restart. preload can be run in a worker thread to parse
+    everything ahead of time.
+    """
+
+    def __init__(self, char_list, cache_path="storage/emotes_cache.json"):
+        """
+        :param char_list: character names that may be looked up
+        :param cache_path: file to keep parsed emotes in, or None
+
+        """
+        self.names = frozenset(char_list)
+        self.loaded = {}
+        self.cache_path = cache_path
+        # Character name -> [char.ini mtime, list of emotes]
+        self.cached = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        emotes = self.loaded.get(name)
+        if emotes is None:
+            if name not in self.names:
+                raise KeyError(name)
+            emotes = self.load(name)
+        return emotes
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self, name):
+        """
+        Get a character's emotes, from the cache if its char.ini is unchanged.
+        :param name: character name
+        """
+        try:
+            mtime = os.stat(path.join(char_dir, name, "char.ini")).st_mtime
+        except OSError:
+            mtime = None
+        with self.lock:
+            if self.cached is None:
+                self.read_cache()
+            entry = self.cached.get(name)
+        if entry is not None and entry[0] == mtime:
+            emotes = Emotes(name, entry[1])
+        else:
+            emotes = Emotes(name)
+            with self.lock:
+                self.cached[name] = [mtime, sorted(emotes.emotes)]
+                self.dirty = True
+        self.loaded[name] = emotes
+        return emotes
+
+    def preload(self):
+        """Load every character's emotes and save the cache. Thread-safe."""
+        try:
+            for name in self.names:
+                if name not in self.loaded:
+                    self.load(name)
+            self.save_cache()
+        except Exception:
+            logger.exception("Failed to preload character emotes")
+
+    def read_cache(self):
+        self.cached = {}
+        if self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if isinstance(cached, dict):
+                self.cached = cached
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable emote cache %s", self.cache_path)
+
+    def save_cache(self):
+        if self.cache_path is None:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            # Leave out characters that are no longer in the list
+            data = json.dumps(
+                {k: v for k, v in self.cached.items() if k in self.names})
+            self.dirty = False
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.cache_path)
@@ -10,15 +10,18 @@ class HubManager:
     def __init__(self, server):
         self.server = server
         self.hubs = []
+        # Clients in any hub, kept up to date by the areas
+        self.clients = set()
+        # Hubs by lowercase name and abbreviation, rebuilt after a hub is
+        # added, removed or renamed
+        self.hub_lookup = None
+        # Clients looking at the hub list instead of the area list
+        self.hub_list_viewers = set()
+        self._hub_list_key = None
+        self._hub_list = None
+        self._sent_hub_list_key = None
         self.load()
 
-    @property
-    def clients(self):
-        clients = set()
-        for hub in self.hubs:
-            clients = clients | hub.clients
-        return clients
-
     def load(self, path="config/areas.yaml", hub_id=-1):
         try:
             with open(path, "r", encoding="utf-8") as stream:
@@ -40,6 +43,7 @@ class HubManager:
             # Legacy support triggered! Abort operation
             if len(self.hubs) <= 0:
                 self.hubs.append(AreaManager(self, "Hub 0"))
+                self.renumber_hubs()
             self.hubs[0].load_areas(hubs)
 
             is_dr_hub = False
@@ -78,9 +82,11 @@ class HubManager:
             while len(self.hubs) > len(hubs):
                 # Clean up excess hubs
                 h = self.hubs.pop()
+                h.id = -1
                 clients = h.clients.copy()
                 for client in clients:
                     client.set_area(self.default_hub().default_area())
+            self.renumber_hubs()
 
             self.hubs[i].load(hub)
             self.hubs[i].o_name = self.hubs[i].name
@@ -98,27 +104,72 @@ class HubManager:
             raise AreaError(
                 f"Trying to save Hub list: File path {path} is invalid!")
 
+    def get_hub_list(self):
+        """
+        Get the arguments of the FA packet that lists the hubs.
+        The list is only rebuilt when a hub's name or player count changes.
+        """
+        key = tuple((hub.name, hub.count) for hub in self.hubs)
+        if key != self._hub_list_key:
+            self._hub_list_key = key
+            self._hub_list = (
+                "🌐 Hubs 🌐\n Double-Click me to see Areas\n  _______",
+                *[
+                    f"[{hub_id}] {name} (users: {count})"
+                    for hub_id, (name, count) in enumerate(key)
+                ],
+            )
+        return self._hub_list
+
+    def send_hub_list(self):
+        """Send the hub list to everyone viewing it, if it changed since it was last sent."""
+        hub_list = self.get_hub_list()
+        if self._hub_list_key == self._sent_hub_list_key:
+            return
+        self._sent_hub_list_key = self._hub_list_key
+        self.server.client_manager.broadcast_command(
+            self.hub_list_viewers, "FA", *hub_list)
+
     def default_hub(self):
         """Get the default hub."""
         return self.hubs[0]
 
+    def renumber_hubs(self):
+        """Update the hub IDs after hubs were added or removed."""
+        for i, hub in enumerate(self.hubs):
+            hub.id = i
+        self.hub_lookup = None
+
+    def get_hub_lookup(self):
+        """
+        Get the dictionaries used to find hubs by lowercase name and
+        abbreviation. When several hubs share one, the first wins.
+        """
+        if self.hub_lookup is None:
+            by_name = {}
+            by_abbreviation = {}
+            for hub in self.hubs:
+                by_name.setdefault(hub.name.lower(), hub)
+                by_abbreviation.setdefault(hub.abbreviation.lower(), hub)
+            self.hub_lookup = (by_name, by_abbreviation)
+        return self.hub_lookup
+
     def get_hub_by_name(self, name):
         """Get a hub by name."""
-        for hub in self.hubs:
-            if hub.name.lower() == name.lower():
-                return hub
-        raise AreaError("Hub not found.")
+        hub = self.get_hub_lookup()[0].get(name.lower())
+        if hub is None:
+            raise AreaError("Hub not found.")
+        return hub
 
     def get_hub_by_id(self, num):
         """Get a hub by ID."""
-        for hub in self.hubs:
-            if hub.id == num:
-                return hub
+        if isinstance(num, int) and 0 <= num < len(self.hubs):
+            return self.hubs[num]
         raise AreaError("Hub not found.")
 
     def get_hub_by_abbreviation(self, abbr):
         """Get a hub by abbreviation."""
-        for hub in self.hubs:
-            if hub.abbreviation.lower() == abbr.lower():
-                return hub
-        raise AreaError("Hub not found.")
+        hub = self.get_hub_lookup()[1].get(abbr.lower())
+        if hub is None:
+            raise AreaError("Hub not found.")
+        return hub
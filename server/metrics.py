@@ -0,0 +1,278 @@
+from bisect import bisect_left
+
+import logging
+
+from aiohttp import web
+
+from server import database
+
+logger = logging.getLogger("metrics")
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets."""
+
+    def __init__(self):
+        # One count per bucket, and one for anything over the last bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0
+        self.count = 0
+        self.max = 0
+
+    def observe(self, value):
+        """
+        Record a value.
+        :param value: latency in seconds
+        """
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+        :param q: quantile between 0 and 1
+        :returns: latency in seconds, never more than the largest value seen
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen > 0 and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def render(self, name, labels):
+        """
+        Render the histogram in the Prometheus text format.
+        :param name: metric name
+        :param labels: label string, without braces (may be empty)
+        :returns: list of lines
+        """
+        sep = "," if labels else ""
+        lines = []
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class HandlerStats:
+    """Calls, errors and latency of one packet type or OOC command."""
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    Collects server metrics and serves them in the Prometheus text format.
+
+    Handler latency is recorded per incoming packet type and per OOC
+    command, along with bytes received and sent and the event loop lag
+    sampled by the watchdog. Clients per hub and the database queue depth
+    are read when scraped. Nothing is recorded unless metrics_enabled is
+    set.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.enabled = server.config["metrics_enabled"]
+        self.packets = {}
+        self.commands = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.loop_lag = Histogram()
+        self.runner = None
+
+    async def start(self):
+        """Start serving metrics on localhost."""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_scrape)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1",
+                           self.server.config["metrics_port"])
+        await site.start()
+        logger.info("Serving metrics on 127.0.0.1:%s",
+                    self.server.config["metrics_port"])
+
+    async def close(self):
+        """Stop serving metrics."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_scrape(self, request):
+        return web.Response(text=self.render(),
+                            content_type="text/plain; version=0.0.4")
+
+    def observe(self, table, name, seconds, error):
+        if not self.enabled:
+            return
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = HandlerStats()
+        stats.latency.observe(seconds)
+        if error:
+            stats.errors += 1
+
+    def observe_lag(self, seconds):
+        """
+        Record an event loop lag sample.
+        :param seconds: how late the event loop woke up
+        """
+        if self.enabled:
+            self.loop_lag.observe(seconds)
+
+    def observe_packet(self, cmd, seconds, error=False):
+        """
+        Record a handled incoming packet.
+        :param cmd: packet type
+        :param seconds: time taken by the handler
+        :param error: whether the handler raised
+        """
+        self.observe(self.packets, cmd, seconds, error)
+
+    def observe_command(self, cmd, seconds, error=False):
+        """
+        Record a handled OOC command.
+        :param cmd: command name, without the ooc_cmd_ prefix
+        :param seconds: time taken by the command
+        :param error: whether the command raised
+        """
+        self.observe(self.commands, cmd, seconds, error)
+
+    def render(self):
+        """Get every metric in the Prometheus text format."""
+        lines = []
+        for table, kind, what in (
+            (self.packets, "packet", "Incoming packets handled, by packet type."),
+            (self.commands, "command", "OOC commands handled, by command."),
+        ):
+            name = f"kfo_{kind}s"
+            lines.append(f"# HELP {name}_total {what}")
+            lines.append(f"# TYPE {name}_total counter")
+            for cmd, stats in table.items():
+                lines.append(f'{name}_total{{{kind}="{escape_label(cmd)}"}} {stats.latency.count}')
+            lines.append(f"# HELP {name}_errors_total Handlers that raised, by {kind}.")
+            lines.append(f"# TYPE {name}_errors_total counter")
+            for cmd, stats in table.items():
+                lines.append(f'{name}_errors_total{{{kind}="{escape_label(cmd)}"}} {stats.errors}')
+            name = f"kfo_{kind}_seconds"
+            lines.append(f"# HELP {name} Handler latency, by {kind}.")
+            lines.append(f"# TYPE {name} histogram")
+            for cmd, stats in table.items():
+                lines.extend(stats.latency.render(name, f'{kind}="{escape_label(cmd)}"'))
+
+        lines.append("# HELP kfo_received_bytes_total Bytes received from clients.")
+        lines.append("# TYPE kfo_received_bytes_total counter")
+        lines.append(f"kfo_received_bytes_total {self.bytes_in}")
+        lines.append("# HELP kfo_sent_bytes_total Bytes sent to clients.")
+        lines.append("# TYPE kfo_sent_bytes_total counter")
+        lines.append(f"kfo_sent_bytes_total {self.bytes_out}")
+
+        lines.append("# HELP kfo_clients Connected clients, by hub.")
+        lines.append("# TYPE kfo_clients gauge")
+        for hub in self.server.hub_manager.hubs:
+            lines.append(
+                f'kfo_clients{{hub="{hub.id}",name="{escape_label(hub.name)}"}} {len(hub.clients)}')
+        lines.append("# HELP kfo_db_queue_depth Log events waiting to be written to the database.")
+        lines.append("# TYPE kfo_db_queue_depth gauge")
+        lines.append(f"kfo_db_queue_depth {database.log_writer.pending}")
+        lines.append("# HELP kfo_db_subtype_cache_total Event subtype ID lookups, by whether they were cached.")
+        lines.append("# TYPE kfo_db_subtype_cache_total counter")
+        lines.append(f'kfo_db_subtype_cache_total{{result="hit"}} {database.subtype_atom_hits}')
+        lines.append(f'kfo_db_subtype_cache_total{{result="miss"}} {database.subtype_atom_misses}')
+
+        stats = self.server.webhooks.get_stats()
+        lines.append("# HELP kfo_webhook_queue_depth Webhook payloads waiting to be delivered.")
+        lines.append("# TYPE kfo_webhook_queue_depth gauge")
+        lines.append(f"kfo_webhook_queue_depth {stats['queue_depth']}")
+        lines.append("# HELP kfo_webhook_payloads_total Webhook payloads, by what happened to them.")
+        lines.append("# TYPE kfo_webhook_payloads_total counter")
+        for result in ("delivered", "dropped", "failed"):
+            lines.append(f'kfo_webhook_payloads_total{{result="{result}"}} {stats[result]}')
+
+        if self.server.bridgebot is not None:
+            stats = self.server.bridgebot.get_stats()
+            lines.append("# HELP kfo_bridge_queue_depth Messages waiting to be sent to Discord.")
+            lines.append("# TYPE kfo_bridge_queue_depth gauge")
+            lines.append(f"kfo_bridge_queue_depth {stats['queue_depth']}")
+            lines.append("# HELP kfo_bridge_messages_total IC messages for Discord, by what happened to them.")
+            lines.append("# TYPE kfo_bridge_messages_total counter")
+            for result in ("sent", "dropped", "failed"):
+                lines.append(f'kfo_bridge_messages_total{{result="{result}"}} {stats[result]}')
+            lines.append("# HELP kfo_bridge_batches_total Discord messages sent by the bridge.")
+            lines.append("# TYPE kfo_bridge_batches_total counter")
+            lines.append(f"kfo_bridge_batches_total {stats['batches']}")
+            lines.append("# HELP kfo_bridge_latency_seconds How long sent messages waited, on average and at worst.")
+            lines.append("# TYPE kfo_bridge_latency_seconds gauge")
+            lines.append(f'kfo_bridge_latency_seconds{{stat="avg"}} {stats["avg_latency"]:.6f}')
+            lines.append(f'kfo_bridge_latency_seconds{{stat="max"}} {stats["max_latency"]:.6f}')
+
+        lines.append("# HELP kfo_event_loop_lag_seconds How late the event loop woke up from a sleep.")
+        lines.append("# TYPE kfo_event_loop_lag_seconds histogram")
+        lines.extend(self.loop_lag.render("kfo_event_loop_lag_seconds", ""))
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top=10):
+        """
+        Get a short summary for the /metrics command.
+        :param top: how many packet types and commands to list
+        :returns: text
+        """
+        info = f"Received {self.bytes_in} bytes, sent {self.bytes_out} bytes."
+        info += f"\nEvent loop lag: {self.server.watchdog.last_lag * 1000:.1f} ms now, "
+        info += f"p99 {self.loop_lag.quantile(0.99) * 1000:.1f} ms, "
+        info += f"max {self.loop_lag.max * 1000:.1f} ms."
+        info += f"\nDatabase queue: {database.log_writer.pending} event(s), event subtype cache: "
+        info += f"{database.subtype_atom_hits} hits, {database.subtype_atom_misses} misses."
+        info += "\n" + self.delivery_summary()
+        for hub in self.server.hub_manager.hubs:
+            info += f"\nHub [{hub.id}] {hub.name}: {len(hub.clients)} client(s)"
+        for table, what in ((self.packets, "packet types"), (self.commands, "commands")):
+            stats = sorted(table.items(), key=lambda x: x[1].latency.sum, reverse=True)
+            info += f"\nSlowest {what} by total time:"
+            for cmd, s in stats[:top]:
+                h = s.latency
+                info += (f"\n{cmd}: {h.count} call(s), {s.errors} error(s), "
+                         f"{h.sum * 1000:.1f} ms total, avg {h.sum / h.count * 1000:.2f} ms, "
+                         f"p99 {h.quantile(0.99) * 1000:.2f} ms, max {h.max * 1000:.2f} ms")
+        return info
+
+    def delivery_summary(self):
+        """
+        Get the webhook and Discord bridge counters, which are kept even
+        when metrics are disabled.
+        :returns: text
+        """
+        stats = self.server.webhooks.get_stats()
+        info = (f"Webhooks: {stats['queue_depth']} waiting, {stats['delivered']} delivered, "
+                f"{stats['dropped']} dropped, {stats['failed']} failed.")
+        if self.server.bridgebot is not None:
+            stats = self.server.bridgebot.get_stats()
+            info += (f"\nDiscord bridge: {stats['queue_depth']} waiting, {stats['sent']} sent "
+                     f"in {stats['batches']} message(s), {stats['dropped']} dropped, "
+                     f"{stats['failed']} failed, waited {stats['avg_latency']:.1f} s on average, "
+                     f"{stats['max_latency']:.1f} s at worst.")
+        return info
@@ -0,0 +1,110 @@
+from functools import lru_cache
+from itertools import chain
+
+import oyaml as yaml  # ordered yaml
+import os
+
+import logging
+
+logger = logging.getLogger("music")
+
+# (path, mtime) -> MusicList loaded from that file
+_loaded = {}
+
+
+class MusicList(list):
+    """
+    A music list as read from YAML: a list of categories with their songs,
+    plus any settings entries. Lookups by song or category name and the
+    flattened name list sent in FM packets are computed once on creation.
+
+    Treat instances as read-only; make a new one instead of changing one.
+    """
+
+    # Hash by identity so that combinations of lists can be cached
+    __hash__ = object.__hash__
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        # name -> (name, length) for every song and category
+        self.songs = {}
+        self.categories = set()
+        # Category and song names in order, as sent in FM/SM packets
+        self.names = []
+        for item in self:
+            if "category" not in item:  # skip settings n stuff
+                continue
+            category = item["category"]
+            self.names.append(category)
+            self.categories.add(category)
+            # The first entry with a given name wins, like a linear search
+            self.songs.setdefault(category, (category, 0))
+            for song in item.get("songs", []):
+                name = song["name"]
+                self.names.append(name)
+                self.songs.setdefault(name, (name, song.get("length", -1)))
+
+    @staticmethod
+    def load(path):
+        """
+        Load a music list from a YAML file. Song names are prefixed with the
+        file name if the list asks for `use_unique_folder`.
+        The result is shared by everyone loading the same unchanged file.
+        :param path: path to the YAML file
+        :returns: MusicList
+        """
+        key = (path, os.stat(path).st_mtime_ns)
+        music_list = _loaded.get(key)
+        if music_list is not None:
+            return music_list
+
+        with open(path, "r", encoding="utf-8") as stream:
+            items = yaml.safe_load(stream)
+
+        prepath = ""
+        for item in items:
+            if "use_unique_folder" in item and item["use_unique_folder"] is True:
+                prepath = os.path.splitext(os.path.basename(path))[0] + "/"
+
+            if "category" not in item:
+                continue
+
+            if "songs" in item:
+                for song in item["songs"]:
+                    song["name"] = prepath + song["name"]
+
+        # Forget older versions of this file
+        for old_key in [k for k in _loaded if k[0] == path]:
+            del _loaded[old_key]
+        music_list = MusicList(items)
+        _loaded[key] = music_list
+        logger.debug("Loaded music list %s", path)
+        return music_list
+
+    @staticmethod
+    def combine(*music_lists):
+        """
+        Get the music list made of several lists one after another.
+        Combinations are remembered, so the same layering of lists
+        gives back the same object.
+        """
+        if len(music_lists) == 1:
+            return music_lists[0]
+        return _combine(music_lists)
+
+    def get_song_data(self, music):
+        """
+        Get information about a track or category.
+        :param music: track name
+        :returns: tuple (name, length or -1), or None if not found
+        """
+        return self.songs.get(music)
+
+    def is_category(self, music):
+        """Get whether a name is one of the categories."""
+        return music in self.categories
+
+
+@lru_cache(maxsize=256)
+def _combine(music_lists):
+    return MusicList(chain(*music_lists))
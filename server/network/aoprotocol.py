@@ -1,10 +1,11 @@
 from .. import commands
-from server.constants import dezalgo, censor, contains_URL, derelative
+from server.network.framer import PacketFramer
+from server.network.schema import ArgType, Layout, NetCommand
+from server.constants import dezalgo, contains_URL, derelative
 from server.exceptions import ClientError, AreaError, ArgumentError, ServerError
 from server import database
 import time
 import arrow
-from enum import Enum
 import asyncio
 import re
 import unicodedata
@@ -13,23 +14,49 @@ import logging
 
 logger = logging.getLogger("aoprotocol")
 
+# The fields every IC message layout starts with
+_ms_common = (
+    ("msg_type", ArgType.STR),
+    ("pre", ArgType.STR_OR_EMPTY),
+    ("folder", ArgType.STR),
+    ("anim", ArgType.STR_OR_EMPTY),
+    ("text", ArgType.STR_OR_EMPTY),
+    ("pos", ArgType.STR),
+    ("sfx", ArgType.STR),
+    ("emote_mod", ArgType.INT),
+    ("cid", ArgType.INT),
+    ("sfx_delay", ArgType.INT),
+    ("button", ArgType.INT_OR_STR),
+    ("evidence", ArgType.INT),
+    ("flip", ArgType.INT),
+    ("ding", ArgType.INT),
+    ("color", ArgType.INT),
+)
+
+
+def _ms_dro_finish(msg):
+    if msg.ding != 1:
+        msg = msg._replace(ding=0)
+    return msg
+
+
+def _ms_pair_finish(msg):
+    # 2.8 sends the pair as <charid>^<order>
+    pair_args = msg.charid_pair.split("^")
+    return msg._replace(
+        charid_pair=int(pair_args[0]),
+        pair_order=pair_args[1] if len(pair_args) > 1 else msg.pair_order,
+    )
+
 
 class AOProtocol(asyncio.Protocol):
     """The main class that deals with the AO protocol."""
 
-    class ArgType(Enum):
-        """Represents the data type of an argument for a network command."""
-
-        STR = (1,)
-        STR_OR_EMPTY = (2,)
-        INT = (3,)
-        INT_OR_STR = 3
-
     def __init__(self, server):
         super().__init__()
         self.server = server
         self.client = None
-        self.buffer = ""
+        self.framer = PacketFramer(on_oversize=self.packet_too_big)
         self.ping_timeout = None
 
     def data_received(self, data):
@@ -41,48 +68,49 @@ class AOProtocol(asyncio.Protocol):
         :param data: bytes of data
 
         """
-        buf = data
         ipid = self.client.ipid
 
-        if buf is None:
-            buf = b""
-
-        if not isinstance(buf, str):
-            # try to decode as utf-8, ignore any erroneous characters
-            buf = self.buffer + buf.decode("utf-8", "ignore")
-
-        buf = buf.translate({ord(c): None for c in "\0"})
-
         packet_size = 1024  # in bits
         if "packet_size" in self.server.config:
             packet_size = self.server.config["packet_size"]
+        self.framer.max_size = packet_size * 8  # convert bits to bytes
 
-        if len(buf) > packet_size * 8:  # convert bits to bytes
-            self.client.send_ooc(
-                "Your last action was dropped because it was too big! Contact the server administrator for more information."
-            )
-            logger.debug("Buffer overflow from %s with %s", ipid, len(buf))
-            return
-        self.buffer = buf
-        for msg in self.get_messages():
+        metrics = self.server.metrics
+        watchdog = self.server.watchdog
+        metrics.bytes_in += len(data)
+        for msg in self.framer.feed(data):
             if len(msg) < 2:
                 continue
+            cmd, *args = msg.split("#")
+            error = False
+            start = time.perf_counter()
             try:
-                cmd, *args = msg.split("#")
                 self.net_cmd_dispatcher[cmd](self, args)
             except KeyError:
                 logger.debug(
                     "Unknown incoming message from %s: %s", ipid, msg)
             except Exception:
+                error = True
                 print(traceback.format_exc())
                 self.client.disconnect()
                 raise
+            finally:
+                # Unknown packet types aren't recorded
+                if cmd in self.net_cmd_dispatcher:
+                    elapsed = time.perf_counter() - start
+                    metrics.observe_packet(cmd, elapsed, error=error)
+                    watchdog.check(elapsed, "packet", cmd, self.client)
 
     def connection_made(self, transport):
         """Called upon a new client connecting
 
         :param transport: the transport object
         """
+        if isinstance(transport, asyncio.WriteTransport):
+            transport.set_write_buffer_limits(
+                high=self.server.config["write_buffer_high"],
+                low=self.server.config["write_buffer_low"],
+            )
         try:
             self.client = self.server.new_client(transport)
         except ClientError:
@@ -118,40 +146,42 @@ class AOProtocol(asyncio.Protocol):
         if self.ping_timeout is not None:
             self.ping_timeout.cancel()
 
-    def get_messages(self):
-        """Parses out full messages from the buffer.
+    def pause_writing(self):
+        """Called when the transport's buffer goes over the high water mark."""
+        if self.client is not None:
+            self.client.pause_writing()
+
+    def resume_writing(self):
+        """Called when the transport's buffer drains below the low water mark."""
+        if self.client is not None:
+            self.client.resume_writing()
 
-        :return: yields messages
+    def packet_too_big(self, size):
+        """Called by the framer when a packet over the size limit is dropped.
+
+        :param size: size of the packet in bytes
 
         """
-        while "#%" in self.buffer:
-            spl = self.buffer.split("#%", 1)
-            self.buffer = spl[1]
-            yield spl[0]
+        self.client.send_ooc(
+            "Your last action was dropped because it was too big! Contact the server administrator for more information."
+        )
+        logger.debug("Buffer overflow from %s with %s", self.client.ipid, size)
 
-    def validate_net_cmd(self, args, *types, needs_auth=True):
-        """Makes sure the net command's arguments match expectations.
+    def parse_net_cmd(self, command, args):
+        """Parses the net command's arguments using its schema.
 
+        :param command: name of the net command
         :param args: actual arguments to the net command
-        :param types: what kind of data types are expected
-        :param needs_auth: whether you need to have chosen a character (Default value = True)
-        :param *types: list of types corresponding to each argument in the command
-        :returns: returns True if message was validated
+        :returns: record of the parsed arguments, or None if they don't
+            match what is expected
 
         """
-        if needs_auth and (self.client.char_id is None or self.client.char_id == -1):
-            return False
-        if len(args) != len(types):
-            return False
-        for i, arg in enumerate(args):
-            if len(str(arg)) == 0 and types[i] != self.ArgType.STR_OR_EMPTY:
-                return False
-            if types[i] == self.ArgType.INT:
-                try:
-                    args[i] = int(arg)
-                except ValueError:
-                    return False
-        return True
+        schema = self.net_cmd_schemas[command]
+        if schema.needs_auth and (
+            self.client.char_id is None or self.client.char_id == -1
+        ):
+            return None
+        return schema.parse(args)
 
     def net_cmd_hi(self, args):
         """Handshake.
@@ -161,7 +191,8 @@ class AOProtocol(asyncio.Protocol):
         :param args: a list containing all the arguments
 
         """
-        if not self.validate_net_cmd(args, self.ArgType.STR, needs_auth=False):
+        args = self.parse_net_cmd("HI", args)
+        if args is None:
             return
         # We already got an assigned hdid by the server
         if self.client.hdid != "":
@@ -169,8 +200,9 @@ class AOProtocol(asyncio.Protocol):
                 "KB", "Your HDID was sent a second time by your client.")
             self.client.disconnect()
             return
-        hdid = self.client.hdid = args[0]
+        hdid = self.client.hdid = args.hdid
         ipid = self.client.ipid
+        self.server.client_manager.update_index(self.client)
 
         database.add_hdid(ipid, hdid)
         ban = database.find_ban(ipid, hdid)
@@ -333,14 +365,13 @@ class AOProtocol(asyncio.Protocol):
         CC#<client_id:int>#<char_id:int>#<hdid:string>#%
 
         """
-        if not self.validate_net_cmd(
-            args, self.ArgType.INT, self.ArgType.INT, self.ArgType.STR, needs_auth=False
-        ):
+        args = self.parse_net_cmd("CC", args)
+        if args is None:
             return
         elif not self.client.is_checked:
             return
 
-        cid = args[1]
+        cid = args.char_id
         try:
             self.client.change_character(cid)
         except ClientError:
@@ -349,7 +380,7 @@ class AOProtocol(asyncio.Protocol):
     def net_cmd_ms(self, args):
         """IC message.
 
-        Refer to the implementation for details.
+        Refer to net_cmd_schemas for the accepted layouts.
 
         """
         if not self.client.is_checked:
@@ -358,211 +389,40 @@ class AOProtocol(asyncio.Protocol):
             self.client.send_ooc("You are muted by a moderator.")
             return
 
-        showname = ""
-        charid_pair = -1
-        offset_pair = 0
-        nonint_pre = 0
-        sfx_looping = "0"
-        screenshake = 0
-        frames_shake = ""
-        frames_realization = ""
-        frames_sfx = ""
-        additive = 0
-        effect = ""
-        pair_order = 0
-        if self.validate_net_cmd(
-            args,
-            self.ArgType.STR,  # msg_type
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR,  # pre, folder
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,  # anim, text
-            self.ArgType.STR,
-            self.ArgType.STR,  # pos, sfx
-            self.ArgType.INT,
-            self.ArgType.INT,  # emote_mod, cid
-            self.ArgType.INT,
-            self.ArgType.INT_OR_STR,  # sfx_delay, button
-            self.ArgType.INT,
-            self.ArgType.INT,  # evidence, flip
-            self.ArgType.INT,
-            self.ArgType.INT,  # ding, color
-        ):
-            # Pre-2.6 validation monstrosity.
-            (
-                msg_type,
-                pre,
-                folder,
-                anim,
-                text,
-                pos,
-                sfx,
-                emote_mod,
-                cid,
-                sfx_delay,
-                button,
-                evidence,
-                flip,
-                ding,
-                color,
-            ) = args
-        elif self.validate_net_cmd(
-            args,
-            self.ArgType.STR,  # msg_type
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR,  # pre, folder
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,  # anim, text
-            self.ArgType.STR,
-            self.ArgType.STR,  # pos, sfx
-            self.ArgType.INT,
-            self.ArgType.INT,  # emote_mod, cid
-            self.ArgType.INT,
-            self.ArgType.INT_OR_STR,  # sfx_delay, button
-            self.ArgType.INT,
-            self.ArgType.INT,  # evidence, flip
-            self.ArgType.INT,
-            self.ArgType.INT,  # ding, color
-            self.ArgType.STR_OR_EMPTY,  # DRO Showname
-            self.ArgType.STR_OR_EMPTY,  # DRO Video
-            self.ArgType.INT,  # 0 or 1, DRO hide_character
-        ):
-            # DRO1.1.0 validation monstrosity.
-            (
-                msg_type,
-                pre,
-                folder,
-                anim,
-                text,
-                pos,
-                sfx,
-                emote_mod,
-                cid,
-                sfx_delay,
-                button,
-                evidence,
-                flip,
-                ding,
-                color,
-                showname,
-                video,
-                blankpost,
-            ) = args
-            if ding != 1:
-                ding = 0
-        elif self.validate_net_cmd(
-            args,
-            self.ArgType.STR,
-            self.ArgType.STR_OR_EMPTY,  # msg_type, pre
-            self.ArgType.STR,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,  # folder, anim, text
-            self.ArgType.STR,
-            self.ArgType.STR,
-            self.ArgType.INT,  # pos, sfx, emote_mod
-            self.ArgType.INT,
-            self.ArgType.INT,
-            self.ArgType.INT_OR_STR,  # cid, sfx_delay, button
-            self.ArgType.INT,
-            self.ArgType.INT,
-            self.ArgType.INT,  # evidence, flip, ding
-            self.ArgType.INT,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.INT,  # color, showname, charid_pair
-            self.ArgType.INT,
-            self.ArgType.INT,  # offset_pair, nonint_pre
-        ):
-            # 2.6 validation monstrosity.
-            (
-                msg_type,
-                pre,
-                folder,
-                anim,
-                text,
-                pos,
-                sfx,
-                emote_mod,
-                cid,
-                sfx_delay,
-                button,
-                evidence,
-                flip,
-                ding,
-                color,
-                showname,
-                charid_pair,
-                offset_pair,
-                nonint_pre,
-            ) = args
-        elif self.validate_net_cmd(
-            args,
-            self.ArgType.STR,
-            self.ArgType.STR_OR_EMPTY,  # msg_type, pre
-            self.ArgType.STR,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,  # folder, anim, text
-            self.ArgType.STR,
-            self.ArgType.STR,
-            self.ArgType.INT,  # pos, sfx, emote_mod
-            self.ArgType.INT,
-            self.ArgType.INT,
-            self.ArgType.INT_OR_STR,  # cid, sfx_delay, button
-            self.ArgType.INT,
-            self.ArgType.INT,
-            self.ArgType.INT,  # evidence, flip, ding
-            self.ArgType.INT,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR,  # color, showname, charid_pair
-            self.ArgType.STR,
-            self.ArgType.INT,
-            self.ArgType.STR,  # offset_pair, nonint_pre, sfx_looping
-            self.ArgType.INT,
-            self.ArgType.STR,
-            self.ArgType.STR,  # screenshake, frames_shake, frames_realization
-            self.ArgType.STR,
-            self.ArgType.INT,
-            self.ArgType.STR,  # frames_sfx, additive, effect
-        ):
-            # 2.8 validation monstrosity. (rip 2.7)
-            (
-                msg_type,
-                pre,
-                folder,
-                anim,
-                text,
-                pos,
-                sfx,
-                emote_mod,
-                cid,
-                sfx_delay,
-                button,
-                evidence,
-                flip,
-                ding,
-                color,
-                showname,
-                charid_pair,
-                offset_pair,
-                nonint_pre,
-                sfx_looping,
-                screenshake,
-                frames_shake,
-                frames_realization,
-                frames_sfx,
-                additive,
-                effect,
-            ) = args
-            try:
-                pair_args = charid_pair.split("^")
-                charid_pair = int(pair_args[0])
-                if len(pair_args) > 1:
-                    pair_order = pair_args[1]
-            except ValueError:
-                self.client.send_ooc(
-                    "Something went wrong! Please report the issue to the developers.")
-                return
-        else:
+        msg = self.parse_net_cmd("MS", args)
+        if msg is None:
             return
+        (
+            msg_type,
+            pre,
+            folder,
+            anim,
+            text,
+            pos,
+            sfx,
+            emote_mod,
+            cid,
+            sfx_delay,
+            button,
+            evidence,
+            flip,
+            ding,
+            color,
+            showname,
+            charid_pair,
+            offset_pair,
+            nonint_pre,
+            sfx_looping,
+            screenshake,
+            frames_shake,
+            frames_realization,
+            frames_sfx,
+            additive,
+            effect,
+            video,
+            blankpost,
+            pair_order,
+        ) = msg
 
         # Targets for whispering
         whisper_clients = None
@@ -640,28 +500,9 @@ class AOProtocol(asyncio.Protocol):
             and self.server.censors is not None
             and len(self.server.censors) > 0
         ):
-            text = censor(
-                text, self.server.censors["whole"], self.server.censors["replace"], True
-            )
-            text = censor(
-                text,
-                self.server.censors["partial"],
-                self.server.censors["replace"],
-                False,
-            )
+            text = self.server.censor.scrub(text)
             if len(showname) > 0:
-                showname = censor(
-                    showname,
-                    self.server.censors["whole"],
-                    self.server.censors["replace"],
-                    True,
-                )
-                showname = censor(
-                    showname,
-                    self.server.censors["partial"],
-                    self.server.censors["replace"],
-                    False,
-                )
+                showname = self.server.censor.scrub(showname)
         if text.lower().startswith("/a ") or text.lower().startswith("/s "):
             part = text.split(" ")
             try:
@@ -1291,16 +1132,16 @@ class AOProtocol(asyncio.Protocol):
         ):  # Checks to see if the client has been muted by a mod
             self.client.send_ooc("You are muted by a moderator.")
             return
-        if not self.validate_net_cmd(
-            args, self.ArgType.STR_OR_EMPTY, self.ArgType.STR, needs_auth=False
-        ):
+        args = self.parse_net_cmd("CT", args)
+        if args is None:
             return
-        args[0] = args[0].strip()
-        if args[0] == "":
+        ooc_name = args.name.strip()
+        text = args.message
+        if ooc_name == "":
             self.client.send_ooc(
                 "You must insert your OOC Name into 'Name' before you can speak.")
             return
-        if len(args[0]) > 30:
+        if len(ooc_name) > 30:
             self.client.send_ooc(
                 "Your OOC name is too long! Limit it to 30 characters."
             )
@@ -1310,15 +1151,15 @@ class AOProtocol(asyncio.Protocol):
                 f"You are using OOC too fast. Please try again after {int(self.client.ooc_mute())} seconds."
             )
             return
-        for c in args[0]:
+        for c in ooc_name:
             if unicodedata.category(c) == "Cf":
                 self.client.send_ooc(
                     "You cannot use format characters in your name!")
                 return
         if (
-            args[0].startswith(self.server.config["hostname"])
-            or args[0].startswith("<dollar>G")
-            or args[0].startswith("<dollar>M")
+            ooc_name.startswith(self.server.config["hostname"])
+            or ooc_name.startswith("<dollar>G")
+            or ooc_name.startswith("<dollar>M")
         ):
             self.client.send_ooc("That name is reserved!")
             return
@@ -1330,49 +1171,28 @@ class AOProtocol(asyncio.Protocol):
             and len(self.server.censors) > 0
         ):
             # Censor the name
-            args[0] = censor(
-                args[0],
-                self.server.censors["whole"],
-                self.server.censors["replace"],
-                True,
-            )
-            args[0] = censor(
-                args[0],
-                self.server.censors["partial"],
-                self.server.censors["replace"],
-                False,
-            )
+            ooc_name = self.server.censor.scrub(ooc_name)
 
             # Censor the text
-            args[1] = censor(
-                args[1],
-                self.server.censors["whole"],
-                self.server.censors["replace"],
-                True,
-            )
-            args[1] = censor(
-                args[1],
-                self.server.censors["partial"],
-                self.server.censors["replace"],
-                False,
-            )
+            text = self.server.censor.scrub(text)
 
-        if not self.client.is_valid_name(args[0]):
+        if not self.client.is_valid_name(ooc_name):
             self.client.send_ooc(
                 "Your OOC name is invalid!"
             )
             return
 
-        self.client.name = args[0]
-        if args[1].lstrip() != args[1] and args[1].lstrip().startswith("/"):
+        self.client.name = ooc_name
+        self.server.client_manager.update_index(self.client)
+        if text.lstrip() != text and text.lstrip().startswith("/"):
             self.client.send_ooc(
                 "Your message was not sent for safety reasons: you left space before that slash."
             )
             return
         database.log_area("chat.ooc", self.client,
-                          self.client.area, message=args[1])
-        if args[1].startswith("/"):
-            spl = args[1][1:].split(" ", 1)
+                          self.client.area, message=text)
+        if text.startswith("/"):
+            spl = text[1:].split(" ", 1)
             cmd = spl[0].lower()
             arg = ""
             if len(spl) == 2:
@@ -1393,7 +1213,7 @@ class AOProtocol(asyncio.Protocol):
             max_char = int(self.server.config["max_chars"])
         except Exception:
             max_char = 256
-        if len(args[1]) > max_char:
+        if len(text) > max_char:
             self.client.send_ooc("Your message is too long!")
             return
 
@@ -1406,14 +1226,14 @@ class AOProtocol(asyncio.Protocol):
             name = "[CM]"
 
         name = f"{prefix}{self.client.name}"
-        args[1] = dezalgo(args[1], self.server.zalgo_tolerance)
+        text = dezalgo(text, self.server.zalgo_tolerance)
         if self.client.shaken:
-            args[1] = self.client.shake_message(args[1])
+            text = self.client.shake_message(text)
         if self.client.disemvowel:
-            args[1] = self.client.disemvowel_message(args[1])
-        self.client.area.send_command("CT", name, args[1])
+            text = self.client.disemvowel_message(text)
+        self.client.area.send_command("CT", name, text)
         self.client.area.send_owner_command(
-            "CT", f"[{self.client.area.id}]{name}", args[1]
+            "CT", f"[{self.client.area.id}]{name}", text
         )
 
     def net_cmd_mc(self, args):
@@ -1431,22 +1251,8 @@ class AOProtocol(asyncio.Protocol):
             preflist = self.client.server.supported_features.copy()
             preflist.remove("arup")
             self.client.send_command("FL", *preflist)
-            for hub in self.client.server.hub_manager.hubs:
-                count = 0
-                for c in hub.clients:
-                    if not c.area.hide_clients and not c.hidden:
-                        count = count + 1
-                hub.count = count
             self.client.send_command(
-                "FA",
-                *[
-                    "🌐 Hubs 🌐\n Double-Click me to see Areas\n  _______",
-                    *[
-                        f"[{hub.id}] {hub.name} (users: {hub.count})"
-                        for hub in self.client.server.hub_manager.hubs
-                    ],
-                ],
-            )
+                "FA", *self.client.server.hub_manager.get_hub_list())
             return
         if args[0].split("\n")[0] == "🌐 Hubs 🌐":
             # self.client.send_ooc('Switching to the list of Areas...')
@@ -1470,19 +1276,11 @@ class AOProtocol(asyncio.Protocol):
             getattr(commands, called_function)(
                 self.client, args[0].split("\n")[0])
         except AreaError:
-            if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT):
-                if not self.validate_net_cmd(
-                    args, self.ArgType.STR, self.ArgType.INT, self.ArgType.STR_OR_EMPTY
-                ):
-                    if not self.validate_net_cmd(
-                        args,
-                        self.ArgType.STR,
-                        self.ArgType.INT,
-                        self.ArgType.STR_OR_EMPTY,
-                        self.ArgType.INT,
-                    ):
-                        return
-            self.client.change_music(*args)
+            args = self.parse_net_cmd("MC", args)
+            if args is None:
+                return
+            self.client.change_music(
+                args.song, args.char_id, args.showname, args.effects)
         except ClientError as ex:
             self.client.send_ooc(ex)
 
@@ -1516,18 +1314,21 @@ class AOProtocol(asyncio.Protocol):
                 "You are not on the area's invite list, and thus, you cannot use the WTCE buttons!"
             )
             return
-        if not self.validate_net_cmd(
-            args, self.ArgType.STR
-        ) and not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT):
+        args = self.parse_net_cmd("RT", args)
+        if args is None:
             return
-        if args[0] == "testimony1":
+        if args.sign == "testimony1":
             sign = "WT"
-        elif args[0] == "testimony2":
+        elif args.sign == "testimony2":
             sign = "CE"
-        elif args[0] == "judgeruling":
+        elif args.sign == "judgeruling":
             sign = "JR"
         else:
             return
+        # Judge rulings carry the verdict as a second argument
+        rt_args = [args.sign]
+        if args.variant is not None:
+            rt_args.append(args.variant)
         if self.client.wtce_mute():
             self.client.send_ooc(
                 f"You used witness testimony/cross examination signs too many times. Please try again after {int(self.client.wtce_mute())} seconds."
@@ -1539,24 +1340,16 @@ class AOProtocol(asyncio.Protocol):
                 a_list = ", ".join([str(a.id)
                                    for a in self.client.broadcast_list])
                 self.client.send_ooc(f"Broadcasting to areas {a_list}")
-                if len(args) == 1:
-                    self.client.area.area_manager.send_remote_command(
-                        self.client.broadcast_list, "RT", args[0]
-                    )
-                elif len(args) == 2:
-                    self.client.area.area_manager.send_remote_command(
-                        self.client.broadcast_list, "RT", args[0], args[1]
-                    )
+                self.client.area.area_manager.send_remote_command(
+                    self.client.broadcast_list, "RT", *rt_args
+                )
             except (AreaError, ValueError):
                 self.client.send_ooc(
                     "Your broadcast list is invalid! Do /clear_broadcast to reset it and /broadcast <id(s)> to set a new one."
                 )
                 return
 
-        if len(args) == 1:
-            self.client.area.send_command("RT", args[0])
-        elif len(args) == 2:
-            self.client.area.send_command("RT", args[0], args[1])
+        self.client.area.send_command("RT", *rt_args)
         self.client.area.add_to_judgelog(self.client, f"used {sign}")
         database.log_area("wtce", self.client, self.client.area, message=sign)
 
@@ -1604,13 +1397,12 @@ class AOProtocol(asyncio.Protocol):
                     # Make it orange
                     lst[14] = 3
                     statement = tuple(lst)
-                    targets = self.client.area.clients
-                    for c in targets:
-                        # Blinded clients don't receive IC messages
-                        if c.blinded:
-                            continue
-                        # Ignore those losers with listenpos for testimony
-                        c.send_command("MS", *statement)
+                    # Blinded clients don't receive IC messages
+                    # Ignore those losers with listenpos for testimony
+                    targets = [
+                        c for c in self.client.area.clients if not c.blinded]
+                    self.server.client_manager.broadcast_command(
+                        targets, "MS", *statement)
 
     def net_cmd_setcase(self, args):
         """Sets the casing preferences of the given client.
@@ -1704,10 +1496,11 @@ class AOProtocol(asyncio.Protocol):
                 "You are not on the area's invite list, and thus, you cannot change the Confidence bars!"
             )
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.INT):
+        args = self.parse_net_cmd("HP", args)
+        if args is None:
             return
         try:
-            self.client.area.change_hp(args[0], args[1])
+            self.client.area.change_hp(args.side, args.value)
             self.client.area.add_to_judgelog(
                 self.client, "changed the penalties")
             database.log_area("hp", self.client, self.client.area)
@@ -1724,18 +1517,12 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(
-            args,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,
-        ):
+        args = self.parse_net_cmd("PE", args)
+        if args is None:
             return
-        if len(args) < 3:
-            return
-        # evi = Evidence(args[0], args[1], args[2], self.client.pos)
+        # evi = Evidence(args.name, args.desc, args.image, self.client.pos)
         self.client.area.evi_list.add_evidence(
-            self.client, args[0], args[1], args[2], "all"
+            self.client, args.name, args.desc, args.image, "all"
         )
         database.log_area("evidence.add", self.client, self.client.area)
         self.client.area.broadcast_evidence_list()
@@ -1748,9 +1535,10 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT):
+        args = self.parse_net_cmd("DE", args)
+        if args is None:
             return
-        self.client.area.evi_list.del_evidence(self.client, int(args[0]))
+        self.client.area.evi_list.del_evidence(self.client, args.evi_id)
         database.log_area("evidence.del", self.client, self.client.area)
         self.client.area.broadcast_evidence_list()
 
@@ -1762,20 +1550,13 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(
-            args,
-            self.ArgType.INT,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,
-            self.ArgType.STR_OR_EMPTY,
-        ):
-            return
-        elif len(args) < 4:
+        args = self.parse_net_cmd("EE", args)
+        if args is None:
             return
 
-        evi = (args[1], args[2], args[3], "all")
+        evi = (args.name, args.desc, args.image, "all")
 
-        self.client.area.evi_list.edit_evidence(self.client, int(args[0]), evi)
+        self.client.area.evi_list.edit_evidence(self.client, args.evi_id, evi)
         database.log_area("evidence.edit", self.client, self.client.area)
         self.client.area.broadcast_evidence_list()
 
@@ -1862,23 +1643,22 @@ class AOProtocol(asyncio.Protocol):
         The state is cleared after the client sends the IC message.
         Also cleared after 100-200ms of inactivity.
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.STR, self.ArgType.STR, needs_auth=False):
+        args = self.parse_net_cmd("TT", args)
+        if args is None:
             return
 
-        #  char_name
-        if args[1].lower() != self.client.char_name.lower():
-        #                       char_name
-            self.client.iniswap = args[1]
+        if args.char_name.lower() != self.client.char_name.lower():
+            self.client.iniswap = args.char_name
         else:
             self.client.iniswap = ""
         # Note: Updating the last_sprite could make things like updating the pair emote by just starting to type.
         # For example, this could be done by adding:
-        #   self.client.last_sprite = args[2]
+        #   self.client.last_sprite = args.emote
         # TODO: Think if it is a desired behaviour or not.
-        if args[0] in (0, 1):
+        if args.state in (0, 1):
             clients = (c for c in self.client.area.clients if c.id != self.client.id)
-            for c in clients:
-                c.send_command("TT", args[0], args[1], args[2])
+            self.server.client_manager.broadcast_command(
+                clients, "TT", args.state, args.char_name, args.emote)
 
     def net_cmd_cu(self, args):
         """
@@ -1896,22 +1676,16 @@ class AOProtocol(asyncio.Protocol):
                 |   2 = Clear all,
                     
         """
-        if not self.validate_net_cmd(args,
-                                     self.ArgType.INT,
-                                     self.ArgType.INT,
-                                     self.ArgType.STR_OR_EMPTY,
-                                     self.ArgType.STR,
-                                     needs_auth=False):
+        args = self.parse_net_cmd("CU", args)
+        if args is None:
             return
 
-        if args[0] == 0:
+        if args.authority == 0:
             # Only the server should have access to the "server" authority
             # or any other added authority level of the future by default.
             # If planned to add more authority levels, this "if" should be reconsidered.
             return
-        #                       char_name
-        #  action
-        if args[1] != 1:
+        if args.action != 1:
             # Only you should be able to edit your own user link
             # Fixes a bug where you could change the character URL of another user.
             # Or even clear all the user link entries of the area.
@@ -1920,10 +1694,9 @@ class AOProtocol(asyncio.Protocol):
         clients = (c for c in self.client.area.clients if c.id != self.client.id)
 
         # Clear the char_url that the client sent on the previous CU packet.
-        if args[2] == "":
+        if args.char_name == "":
             for c in clients:
-                #                   authority, action, char_name
-                c.send_command('CU', args[0], "1", self.client.f_char_name_raw)
+                c.send_command('CU', args.authority, "1", self.client.f_char_name_raw)
             self.client.char_url = ""
             return
 
@@ -1931,27 +1704,21 @@ class AOProtocol(asyncio.Protocol):
         if self.client.char_url != "":
             for c in clients:
                 # Clear the old char_url
-                #                   authority, action, char_name
-                c.send_command('CU', args[0], "0", self.client.f_char_name_raw)
+                c.send_command('CU', args.authority, "0", self.client.f_char_name_raw)
 
                 # Add the new char_url
-                #                   authority, action, char_name, link
-                c.send_command('CU', args[0], args[1], args[2], args[3])
+                c.send_command('CU', args.authority, args.action, args.char_name, args.link)
         else:
             for c in clients:
                 # Set the char_url
-                #                   authority, action, char_name, link
-                c.send_command('CU', args[0], args[1], args[2], args[3])
+                c.send_command('CU', args.authority, args.action, args.char_name, args.link)
 
-        #  char_name
-        if args[2].lower() != self.client.char_name.lower():
-        #                       char_name
-            self.client.iniswap = args[2]
+        if args.char_name.lower() != self.client.char_name.lower():
+            self.client.iniswap = args.char_name
         else:
             self.client.iniswap = ""
 
-        #                      link
-        self.client.char_url = args[3]
+        self.client.char_url = args.link
 
 
     net_cmd_dispatcher = {
@@ -1979,3 +1746,108 @@ class AOProtocol(asyncio.Protocol):
         "TT": net_cmd_tt,
         "CU": net_cmd_cu,
     }
+
+    net_cmd_schemas = {
+        "HI": NetCommand("HI", ("hdid", ArgType.STR), needs_auth=False),
+        "CC": NetCommand(
+            "CC",
+            ("client_id", ArgType.INT),
+            ("char_id", ArgType.INT),
+            ("hdid", ArgType.STR),
+            needs_auth=False,
+        ),
+        "MS": NetCommand(
+            "MS",
+            # 2.8 (rip 2.7)
+            Layout(
+                *_ms_common,
+                ("showname", ArgType.STR_OR_EMPTY, ""),
+                ("charid_pair", ArgType.STR, -1),
+                ("offset_pair", ArgType.STR, 0),
+                ("nonint_pre", ArgType.INT, 0),
+                ("sfx_looping", ArgType.STR, "0"),
+                ("screenshake", ArgType.INT, 0),
+                ("frames_shake", ArgType.STR, ""),
+                ("frames_realization", ArgType.STR, ""),
+                ("frames_sfx", ArgType.STR, ""),
+                ("additive", ArgType.INT, 0),
+                ("effect", ArgType.STR, ""),
+                finish=_ms_pair_finish,
+            ),
+            # DRO 1.1.0
+            Layout(
+                *_ms_common,
+                ("showname", ArgType.STR_OR_EMPTY),
+                ("video", ArgType.STR_OR_EMPTY, ""),
+                ("blankpost", ArgType.INT, 0),  # 0 or 1, DRO hide_character
+                finish=_ms_dro_finish,
+            ),
+            # 2.6
+            Layout(
+                *_ms_common,
+                ("showname", ArgType.STR_OR_EMPTY),
+                ("charid_pair", ArgType.INT),
+                ("offset_pair", ArgType.INT),
+                ("nonint_pre", ArgType.INT),
+            ),
+            # Pre-2.6
+            Layout(*_ms_common),
+            extra=(("pair_order", 0),),
+        ),
+        "CT": NetCommand(
+            "CT",
+            ("name", ArgType.STR_OR_EMPTY),
+            ("message", ArgType.STR),
+            needs_auth=False,
+        ),
+        "MC": NetCommand(
+            "MC",
+            Layout(("song", ArgType.STR), ("char_id", ArgType.INT)),
+            Layout(
+                ("song", ArgType.STR),
+                ("char_id", ArgType.INT),
+                ("showname", ArgType.STR_OR_EMPTY, ""),
+            ),
+            Layout(
+                ("song", ArgType.STR),
+                ("char_id", ArgType.INT),
+                ("showname", ArgType.STR_OR_EMPTY),
+                ("effects", ArgType.INT, 0),
+            ),
+        ),
+        "RT": NetCommand(
+            "RT",
+            Layout(("sign", ArgType.STR)),
+            Layout(("sign", ArgType.STR), ("variant", ArgType.INT)),
+        ),
+        "HP": NetCommand("HP", ("side", ArgType.INT), ("value", ArgType.INT)),
+        "PE": NetCommand(
+            "PE",
+            ("name", ArgType.STR_OR_EMPTY),
+            ("desc", ArgType.STR_OR_EMPTY),
+            ("image", ArgType.STR_OR_EMPTY),
+        ),
+        "DE": NetCommand("DE", ("evi_id", ArgType.INT)),
+        "EE": NetCommand(
+            "EE",
+            ("evi_id", ArgType.INT),
+            ("name", ArgType.STR_OR_EMPTY),
+            ("desc", ArgType.STR_OR_EMPTY),
+            ("image", ArgType.STR_OR_EMPTY),
+        ),
+        "TT": NetCommand(
+            "TT",
+            ("state", ArgType.INT),
+            ("char_name", ArgType.STR),
+            ("emote", ArgType.STR),
+            needs_auth=False,
+        ),
+        "CU": NetCommand(
+            "CU",
+            ("authority", ArgType.INT),
+            ("action", ArgType.INT),
+            ("char_name", ArgType.STR_OR_EMPTY),
+            ("link", ArgType.STR),
+            needs_auth=False,
+        ),
+    }
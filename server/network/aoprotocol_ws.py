@@ -1,18 +1,35 @@
 import asyncio
+import logging
 
 from websockets import ConnectionClosed
 
 from server.network.aoprotocol import AOProtocol
 
+logger = logging.getLogger("websocket")
+
 
 class AOProtocolWS(AOProtocol):
     """A websocket wrapper around AOProtocol."""
 
     class TransportWrapper:
-        """A class to wrap asyncio's Transport class."""
+        """
+        A class to wrap asyncio's Transport class.
+
+        Outgoing packets go into a queue that a single writer task sends in
+        order. Everything written in the same event loop iteration goes out
+        as one websocket message. If more than `websocket_high_water` bytes
+        are waiting, the client can't keep up: depending on
+        `websocket_overflow` it is either disconnected or the packet dropped.
+        """
 
-        def __init__(self, websocket):
+        def __init__(self, websocket, server):
             self.ws = websocket
+            self.server = server
+            self.queue = []
+            self.queued_bytes = 0
+            self.closing = False
+            self.wakeup = asyncio.Event()
+            self.writer = asyncio.ensure_future(self.write_forever())
 
         def get_extra_info(self, key):
             """Get extra info about the client.
@@ -33,27 +50,71 @@ class AOProtocolWS(AOProtocol):
             return info[key]
 
         def write(self, message):
-            """Write message to the socket.
+            """Queue a message to be written to the socket.
 
             :param message: message in bytes
 
             """
-            message = message.decode("utf-8")
-            asyncio.ensure_future(self.ws_try_writing_message(message))
+            if self.closing:
+                return
+            if self.queued_bytes + len(message) > self.server.config["websocket_high_water"]:
+                if self.server.config["websocket_overflow"] == "drop":
+                    return
+                logger.debug(
+                    "Disconnecting websocket client %s, %d bytes waiting to be sent",
+                    self.ws.remote_address, self.queued_bytes)
+                self.abort()
+                return
+            self.queue.append(message)
+            self.queued_bytes += len(message)
+            self.wakeup.set()
+
+        def get_write_buffer_size(self):
+            """Get how many bytes are waiting to be sent."""
+            return self.queued_bytes
 
         def close(self):
-            """Disconnect the client by force."""
+            """Disconnect the client by force, after sending what is queued."""
+            self.closing = True
+            self.wakeup.set()
+
+        def abort(self):
+            """Disconnect the client right away, dropping what is queued."""
+            self.closing = True
+            self.queue.clear()
+            self.queued_bytes = 0
+            # The writer may be stuck waiting on the client
+            self.writer.cancel()
             asyncio.ensure_future(self.ws.close())
 
-        async def ws_try_writing_message(self, message):
+        async def write_forever(self):
             """
-            Try writing the message if the client has not already closed
-            the connection.
+            Send queued messages until the transport is closed or the
+            client has closed the connection.
             """
             try:
-                await self.ws.send(message)
+                while True:
+                    await self.wakeup.wait()
+                    self.wakeup.clear()
+                    if len(self.queue) > 0:
+                        data = b"".join(self.queue)
+                        self.queue.clear()
+                        self.queued_bytes = 0
+                        await self.ws.send(data.decode("utf-8"))
+                    # Anything written while sending gets sent first
+                    if self.closing and len(self.queue) == 0:
+                        break
             except ConnectionClosed:
-                return
+                pass
+            except Exception:
+                logger.exception(
+                    "Error while writing to websocket client %s", self.ws.remote_address)
+            finally:
+                # Stop queueing for a client that can't be written to
+                self.closing = True
+                self.queue.clear()
+                self.queued_bytes = 0
+                await self.ws.close()
 
     def __init__(self, server, websocket):
         super().__init__(server)
@@ -64,7 +125,8 @@ class AOProtocolWS(AOProtocol):
 
     def ws_on_connect(self):
         """Handle a new client connection."""
-        self.connection_made(self.TransportWrapper(self.ws))
+        self.ws_transport = self.TransportWrapper(self.ws, self.server)
+        self.connection_made(self.ws_transport)
 
     async def ws_handle(self):
         try:
@@ -73,6 +135,8 @@ class AOProtocolWS(AOProtocol):
         except Exception as exc:
             # Any event handled in data_received could raise any exception
             self.ws_connected = False
+            # Let the writer task finish
+            self.ws_transport.close()
             self.connection_lost(exc)
 
 
@@ -0,0 +1,90 @@
+class PacketFramer:
+    """
+    Splits an incoming byte stream into AO packets.
+
+    Data is appended to a single bytearray and only the newly arrived bytes
+    are scanned for the `#%` terminator, so pipelined or fragmented packets
+    cost the same as whole ones. Each complete packet is decoded once.
+    Used by both the TCP and the websocket protocol.
+    """
+
+    DELIMITER = b"#%"
+
+    def __init__(self, max_size=None, on_oversize=None):
+        """
+        :param max_size: largest packet accepted, in bytes (None for no limit)
+        :param on_oversize: called with the size of every packet that was
+            dropped for being larger than max_size
+
+        """
+        self.max_size = max_size
+        self.on_oversize = on_oversize
+        self.buffer = bytearray()
+        # Offset in the buffer up to which no terminator was found
+        self.scanned = 0
+        # True while throwing away the rest of a packet that was too big
+        self.discarding = False
+
+    def feed(self, data):
+        """
+        Add received data and get the packets it completed.
+
+        :param data: bytes received, or a str (e.g. a websocket text frame)
+        :returns: list of packets as str, without the terminator
+
+        """
+        if not data:
+            return []
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        buf = self.buffer
+        buf += data
+        delimiter = self.DELIMITER
+        max_size = self.max_size
+        messages = []
+        start = 0
+        # A terminator may straddle the previous chunk and this one
+        pos = buf.find(delimiter, max(self.scanned - 1, 0))
+        with memoryview(buf) as view:
+            while pos != -1:
+                if self.discarding:
+                    self.discarding = False
+                elif max_size is not None and pos - start > max_size:
+                    self._oversize(pos - start)
+                else:
+                    messages.append(self._decode(view[start:pos]))
+                start = pos + 2
+                pos = buf.find(delimiter, start)
+
+        del buf[:start]
+        self.scanned = len(buf)
+
+        # Don't let an unterminated packet grow without bound. One extra
+        # byte is allowed since it may be the start of the terminator.
+        if max_size is not None and len(buf) > max_size + 1:
+            if not self.discarding:
+                self.discarding = True
+                self._oversize(len(buf))
+            # Keep the last byte in case it starts a terminator
+            del buf[:-1]
+            self.scanned = len(buf)
+        return messages
+
+    def clear(self):
+        """Forget any partially received packet."""
+        self.buffer.clear()
+        self.scanned = 0
+        self.discarding = False
+
+    def _oversize(self, size):
+        if self.on_oversize is not None:
+            self.on_oversize(size)
+
+    @staticmethod
+    def _decode(frame):
+        # Decode as utf-8, ignoring any erroneous characters
+        msg = str(frame, "utf-8", "ignore")
+        if "\0" in msg:
+            msg = msg.replace("\0", "")
+        return msg
@@ -1,4 +1,6 @@
 import sys
+import time
+import random
 import logging
 import traceback
 
@@ -17,24 +19,59 @@ stun_servers = [
 API_BASE_URL = 'https://servers.aceattorneyonline.com'
 
 
+def stun_probe():
+    """
+    Get the external IP address using STUN servers.
+
+    Returns:
+        str: The external IP address, or None if every STUN server is blocked.
+    """
+    for stun_ip, stun_port in stun_servers:
+        nat_type, external_ip, _external_port = \
+            stun.get_ip_info(stun_host=stun_ip, stun_port=stun_port)
+        if nat_type != stun.Blocked:
+            return external_ip
+
+
 class MasterServerClient:
     """Advertises information about this server to the master server."""
 
-    def __init__(self, server):
+    def __init__(self, server, probe=stun_probe, session_factory=aiohttp.ClientSession,
+                 api_base_url=API_BASE_URL):
+        """
+        Parameters:
+            server: The server to advertise.
+            probe: Blocking function returning the external IP address, or None.
+                Runs in an executor.
+            session_factory: Function returning an aiohttp.ClientSession (or anything
+                with the same post method and async context manager).
+            api_base_url: URL of the master server.
+        """
         self.server = server
-        self.interval = 60
+        self.probe = probe
+        self.session_factory = session_factory
+        self.api_base_url = api_base_url
+        # External IP address found by the probe, and when it goes stale
+        self.external_ip = None
+        self.external_ip_expiry = 0
+        # What was last advertised, and when
+        self.last_body = None
+        self.last_sent = 0
+        # Heartbeats that failed in a row
+        self.failures = 0
 
     async def connect(self):
         """
-        Connects to the server and sends server information periodically.
+        Connects to the server and keeps the server's listing up to date.
 
         This function establishes a connection to the server using the aiohttp library's
-        ClientSession. It then enters a loop where it continuously sends server information
-        using the `send_server_info` method. If a `ClientError` occurs while sending the
-        information, it is logged as a connection error. Otherwise, if an unknown error
-        occurs, it is logged as an unknown connection error. In both cases, the function
-        sleeps for 5 seconds before retrying. Finally, the function sleeps for 60 seconds
-        before sending the next server information.
+        ClientSession. It then checks every `masterserver_min_interval` seconds whether
+        the server information changed, and sends it using the `send_server_info` method
+        if it did, or if `masterserver_max_interval` seconds passed since it was last sent.
+        If a `ClientError` occurs while sending the information, it is logged as a
+        connection error. Otherwise, if an unknown error occurs, it is logged as an unknown
+        connection error. In both cases, the next attempt is delayed with an exponential
+        backoff and some random jitter.
 
         Parameters:
             self: The instance of the class.
@@ -42,44 +79,90 @@ class MasterServerClient:
         Returns:
             None
         """
-        async with aiohttp.ClientSession() as http:
+        async with self.session_factory() as http:
             while True:
                 try:
-                    await self.send_server_info(http)
+                    await self.heartbeat(http)
                 except aiohttp.ClientError:
                     # Master server is down or unreachable, may be temporary so log it as a warning
                     logger.warning('Failed to connect to the master server')
-                except Exception as err:
+                    self.failures += 1
+                except Exception:
                     # Unknown error occurred, log it as a hard error with full exception information
                     exc_type, exc_value, exc_traceback = sys.exc_info()
                     logger.error("Uncaught exception while advertising server to masterserver")
                     traceback.print_exception(exc_type, exc_value, exc_traceback)
+                    self.failures += 1
                 finally:
-                    await asyncio.sleep(self.interval)
+                    await asyncio.sleep(self.next_delay())
 
-    def get_my_ip(self):
+    def next_delay(self):
         """
-        Get the external IP address using STUN servers.
+        Get how long to wait before the next heartbeat.
 
         Returns:
-            str: The external IP address.
+            float: The delay in seconds. After failures, this backs off exponentially
+            up to the max interval, with jitter so servers don't retry in lockstep.
         """
-        for stun_ip, stun_port in stun_servers:
-            nat_type, external_ip, _external_port = \
-                stun.get_ip_info(stun_host=stun_ip, stun_port=stun_port)
-            if nat_type != stun.Blocked:
-                return external_ip
+        cfg = self.server.config
+        min_interval = cfg['masterserver_min_interval']
+        if self.failures == 0:
+            return min_interval
+        backoff = min(min_interval * 2 ** self.failures, cfg['masterserver_max_interval'])
+        return backoff * random.uniform(0.5, 1.0)
 
-    async def send_server_info(self, http: aiohttp.ClientSession):
+    async def heartbeat(self, http):
         """
-        Send server information to the specified HTTP client session.
-        Usually being the master server.
+        Send the server information if it changed, the last heartbeat failed,
+        or the max interval passed.
 
         Parameters:
             http (aiohttp.ClientSession): The aiohttp client to send the server information to.
 
         Returns:
-            None
+            bool: Whether the server information was sent.
+        """
+        body = await self.get_server_info()
+        stale = time.monotonic() - self.last_sent >= self.server.config['masterserver_max_interval']
+        if body == self.last_body and not stale and self.failures == 0:
+            return False
+        await self.send_server_info(http, body)
+        return True
+
+    def get_my_ip(self):
+        """
+        Get the external IP address using the probe.
+
+        Returns:
+            str: The external IP address.
+        """
+        return self.probe()
+
+    async def get_external_ip(self):
+        """
+        Get the external IP address, probing for it only when the last one
+        found is older than `masterserver_ip_ttl` seconds or was forgotten.
+
+        Returns:
+            str: The external IP address, or None if it couldn't be found.
+        """
+        now = time.monotonic()
+        if self.external_ip is None or now >= self.external_ip_expiry:
+            loop = asyncio.get_running_loop()
+            external_ip = await loop.run_in_executor(None, self.get_my_ip)
+            if external_ip is None:
+                # Keep using the old address until a probe works again
+                return self.external_ip
+            self.external_ip = external_ip
+            self.external_ip_expiry = now + self.server.config['masterserver_ip_ttl']
+        return self.external_ip
+
+    async def get_server_info(self):
+        """
+        Get the information to advertise.
+
+        Returns:
+            dict: The body of the heartbeat request.
         """
         cfg = self.server.config
 
@@ -88,8 +171,7 @@ class MasterServerClient:
 
         # If fails, try to get the external IP
         if not f_ip:
-            loop = asyncio.get_event_loop()
-            f_ip = await loop.run_in_executor(None, self.get_my_ip)
+            f_ip = await self.get_external_ip()
 
         body = {
             'ip': f_ip,
@@ -105,12 +187,33 @@ class MasterServerClient:
         if 'use_securewebsockets' in cfg and cfg['use_securewebsockets']:
             if 'secure_websocket_port' in cfg:
                 body['wss_port'] = cfg['secure_websocket_port']
+        return body
 
-        async with http.post(f'{API_BASE_URL}/servers', json=body) as res:
+    async def send_server_info(self, http: aiohttp.ClientSession, body):
+        """
+        Send server information to the specified HTTP client session.
+        Usually being the master server.
+
+        Parameters:
+            http (aiohttp.ClientSession): The aiohttp client to send the server information to.
+            body (dict): The server information, from `get_server_info`.
+
+        Returns:
+            None
+        """
+        async with http.post(f'{self.api_base_url}/servers', json=body) as res:
             err_body = await res.text()
             try:
                 res.raise_for_status()
             except aiohttp.ClientResponseError as err:
                 logging.error("Got status=%s advertising %s: %s", err.status, body, err_body)
-
-        logger.debug('Heartbeat to %s/servers', API_BASE_URL)
+                self.failures += 1
+                if err.status < 500:
+                    # The address may be what the master server doesn't like
+                    self.external_ip = None
+                return
+
+        self.last_body = body
+        self.last_sent = time.monotonic()
+        self.failures = 0
+        logger.debug('Heartbeat to %s/servers', self.api_base_url)
@@ -0,0 +1,125 @@
+from collections import namedtuple
+from enum import Enum
+
+
+class ArgType(Enum):
+    """Represents the data type of an argument for a network command."""
+
+    STR = 1  # non-empty string
+    STR_OR_EMPTY = 2
+    INT = 3
+    INT_OR_STR = 4  # non-empty, kept as a string
+
+
+def _non_empty(arg):
+    if arg == "":
+        raise ValueError("empty argument")
+    return arg
+
+
+def _any(arg):
+    return arg
+
+
+CONVERTERS = {
+    ArgType.STR: _non_empty,
+    ArgType.STR_OR_EMPTY: _any,
+    ArgType.INT: int,
+    ArgType.INT_OR_STR: _non_empty,
+}
+
+
+class Layout:
+    """
+    One accepted layout of a network command's arguments.
+
+    Fields are (name, ArgType) or (name, ArgType, default) tuples. The
+    default is used by the other layouts of the same command that don't
+    have the field.
+    """
+
+    def __init__(self, *fields, finish=None):
+        """
+        :param fields: the arguments, in the order they are sent
+        :param finish: optional function taking the parsed record and
+            returning it, possibly adjusted. May raise ValueError to reject it.
+
+        """
+        self.fields = fields
+        self.finish = finish
+
+
+class NetCommand:
+    """
+    The argument schema of a network command.
+
+    Each layout is compiled once into a list of converters, and the layout
+    to use is picked by the number of arguments received. Every layout
+    parses into the same record type, a namedtuple with a field for
+    everything any of the layouts can send.
+    """
+
+    def __init__(self, name, *layouts, needs_auth=True, extra=()):
+        """
+        :param name: name of the command, used for the record type
+        :param layouts: Layout objects (or field tuples for a single layout)
+        :param needs_auth: whether the client must have chosen a character
+        :param extra: (name, default) tuples for record fields that are not
+            sent by the client, but filled in by a layout's finish function
+
+        """
+        self.name = name
+        self.needs_auth = needs_auth
+        if len(layouts) > 0 and not isinstance(layouts[0], Layout):
+            layouts = (Layout(*layouts),)
+
+        # Every field any layout has, in order of first appearance
+        names = []
+        defaults = {}
+        for layout in layouts:
+            for field in layout.fields:
+                if field[0] not in names:
+                    names.append(field[0])
+                if len(field) > 2:
+                    defaults[field[0]] = field[2]
+        for field, default in extra:
+            names.append(field)
+            defaults[field] = default
+        self.record = namedtuple(f"{name}Args", names)
+        self.template = [defaults.get(n) for n in names]
+
+        # Argument count -> (slots, converters, finish)
+        self.layouts = {}
+        for layout in layouts:
+            count = len(layout.fields)
+            if count in self.layouts:
+                raise ValueError(
+                    f"{name} has two layouts with {count} arguments")
+            self.layouts[count] = (
+                tuple(names.index(field[0]) for field in layout.fields),
+                tuple(CONVERTERS[field[1]] for field in layout.fields),
+                layout.finish,
+            )
+
+    def parse(self, args):
+        """
+        Parse the arguments of the command.
+        :param args: list of argument strings
+        :returns: record of the parsed arguments, or None if they don't
+            match any layout
+
+        """
+        layout = self.layouts.get(len(args))
+        if layout is None:
+            return None
+        slots, converters, finish = layout
+        values = self.template.copy()
+        try:
+            for slot, convert, arg in zip(slots, converters, args):
+                values[slot] = convert(arg)
+            record = self.record._make(values)
+            if finish is not None:
+                record = finish(record)
+        except ValueError:
+            return None
+        return record
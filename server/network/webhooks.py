@@ -1,18 +1,223 @@
 from time import gmtime, strftime
 
-import requests
-import json
+import asyncio
+import logging
+
+import aiohttp
 
 from server import database
 
+logger = logging.getLogger("webhooks")
+
+# Discord's limits on a single webhook message
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+
 
 class Webhooks:
     """
     Contains functions related to webhooks.
+
+    Webhooks are delivered in the background: send_webhook puts the payload
+    on a bounded queue, and a worker task posts them one at a time over a
+    shared HTTP session, retrying failed deliveries with exponential backoff
+    and waiting out rate limits.
     """
 
     def __init__(self, server):
         self.server = server
+        self.queue = None
+        self.worker = None
+        self.http = None
+        # Payload taken off the queue that couldn't be merged with the last
+        self.held = None
+
+        # Counters, in payloads
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the delivery worker, if it isn't running yet."""
+        if self.worker is not None and not self.worker.done():
+            return
+        self.queue = asyncio.Queue(self.server.config["webhook_queue_size"])
+        self.worker = asyncio.ensure_future(self.deliver_forever())
+
+    async def close(self):
+        """Stop the delivery worker and close the HTTP session."""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        if self.http is not None:
+            await self.http.close()
+            self.http = None
+
+    def enqueue(self, url, data):
+        """
+        Queue a payload for delivery. Never blocks; if the queue is full
+        the payload is dropped.
+        :param url: webhook URL
+        :param data: JSON payload
+        :returns: True if the payload was queued
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning("Webhook dropped, the server is not running")
+            self.dropped += 1
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait((url, data))
+        except asyncio.QueueFull:
+            database.log_misc("webhook.err", data="queue full, payload dropped")
+            self.dropped += 1
+            return False
+        return True
+
+    def get_stats(self):
+        """
+        Get the webhook counters.
+        :returns: dict of payloads waiting, delivered, dropped and failed
+        """
+        queued = self.queue.qsize() if self.queue is not None else 0
+        return {
+            "queue_depth": queued + (self.held is not None),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def deliver_forever(self):
+        """Deliver queued webhooks until cancelled."""
+        if self.http is None:
+            self.http = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(
+                    total=self.server.config["webhook_timeout"])
+            )
+        while True:
+            url, data, count = await self.next_payload()
+            delivered = False
+            try:
+                delivered = await self.deliver(url, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Uncaught exception while delivering a webhook")
+            if delivered:
+                self.delivered += count
+            else:
+                self.failed += count
+            for _ in range(count):
+                self.queue.task_done()
+
+    async def next_payload(self):
+        """
+        Get the next payload to deliver. If coalescing is enabled, the
+        payloads queued right behind it are merged into it where possible.
+        :returns: URL, payload and the number of queued payloads it covers
+        """
+        if self.held is not None:
+            url, data = self.held
+            self.held = None
+        else:
+            url, data = await self.queue.get()
+        count = 1
+        if not self.server.config["webhook_coalesce"]:
+            return url, data, count
+        data = dict(data)
+        while not self.queue.empty():
+            next_url, next_data = self.queue.get_nowait()
+            if next_url != url or not self.merge(data, next_data):
+                self.held = (next_url, next_data)
+                break
+            count += 1
+        return url, data, count
+
+    @staticmethod
+    def merge(data, other):
+        """
+        Merge a payload into another, if they look the same to Discord and
+        the result stays within its limits.
+        :param data: payload to merge into
+        :param other: payload to merge
+        :returns: True if merged
+        """
+        if (
+            data["username"] != other["username"]
+            or data["avatar_url"] != other["avatar_url"]
+        ):
+            return False
+        contents = [c for c in (data["content"], other["content"]) if c]
+        content = "\n".join(contents) if contents else None
+        embeds = data.get("embeds", []) + other.get("embeds", [])
+        if content is not None and len(content) > MAX_CONTENT_LENGTH:
+            return False
+        if len(embeds) > MAX_EMBEDS:
+            return False
+        data["content"] = content
+        if len(embeds) > 0:
+            data["embeds"] = embeds
+        return True
+
+    async def deliver(self, url, data):
+        """
+        Post a payload, retrying with exponential backoff on connection
+        errors and server errors, and after the delay Discord asks for when
+        rate limited.
+        :param url: webhook URL
+        :param data: JSON payload
+        :returns: True if the payload was delivered
+        """
+        retries = self.server.config["webhook_retries"]
+        backoff = self.server.config["webhook_backoff"]
+        for attempt in range(retries + 1):
+            delay = backoff * 2**attempt
+            try:
+                async with self.http.post(url, json=data) as result:
+                    status = result.status
+                    if status == 429:
+                        delay = await self.retry_after(result, delay)
+                    elif 200 <= status < 300:
+                        database.log_misc(
+                            "webhook.ok",
+                            data="successfully delivered payload, code {}".format(
+                                status
+                            ),
+                        )
+                        return True
+                    elif status < 500:
+                        # The request itself is wrong, retrying won't help
+                        database.log_misc("webhook.err", data=status)
+                        return False
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                status = type(err).__name__
+            if attempt < retries:
+                await asyncio.sleep(delay)
+        database.log_misc("webhook.err", data=status)
+        return False
+
+    @staticmethod
+    async def retry_after(result, default):
+        """
+        Get how long a rate limited request should wait, in seconds.
+        :param result: HTTP response with status 429
+        :param default: delay to use if the response doesn't say
+        """
+        try:
+            body = await result.json(content_type=None)
+            return float(body["retry_after"])
+        except (ValueError, KeyError, TypeError, aiohttp.ClientError):
+            pass
+        try:
+            return float(result.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return default
 
     def send_webhook(
         self,
@@ -41,20 +246,7 @@ class Webhooks:
             embed["description"] = description
             embed["title"] = title
             data["embeds"].append(embed)
-        result = requests.post(
-            url, data=json.dumps(data), headers={"Content-Type": "application/json"}
-        )
-        try:
-            result.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            database.log_misc("webhook.err", data=err.response.status_code)
-        else:
-            database.log_misc(
-                "webhook.ok",
-                data="successfully delivered payload, code {}".format(
-                    result.status_code
-                ),
-            )
+        self.enqueue(url, data)
 
     def modcall(self, char, ipid, area, reason=None):
         is_enabled = self.server.config["modcall_webhook"]["enabled"]
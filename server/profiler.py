@@ -0,0 +1,359 @@
+from types import BuiltinFunctionType, CodeType, FrameType, FunctionType, MethodType, ModuleType
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from server import database
+from server import music_list
+
+logger = logging.getLogger("profiler")
+
+# Objects that are never counted or walked through when sizing subsystems
+SKIPPED_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType,
+                 FrameType, CodeType)
+
+# Source files (relative to the server package) -> subsystem their
+# allocations are counted under
+SUBSYSTEM_FILES = {
+    "client_manager.py": "clients",
+    "area.py": "areas",
+    "area_manager.py": "areas",
+    "hub_manager.py": "areas",
+    "evidence.py": "evidence",
+    "music_list.py": "music lists",
+    "database.py": "DB",
+}
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def log_path(prefix, extension):
+    """Get a timestamped file name under logs/."""
+    return os.path.join("logs", f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+
+def format_size(size):
+    """Format a size in bytes for humans."""
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class StackSampler:
+    """
+    Samples the event loop thread's stack, and writes the stacks seen in
+    the collapsed format flamegraph tools read.
+
+    Where the platform has it, a profiling timer signal interrupts the
+    event loop thread every profile_interval seconds of CPU time, so the
+    samples show where CPU time goes and idle time costs nothing. Elsewhere
+    a background thread samples every profile_interval seconds; it can
+    only look while the event loop thread lets go of the GIL, so those
+    samples lean towards the points where the event loop waits.
+
+    Sampling stops by itself after profile_max_duration seconds, and at
+    most profile_max_stacks distinct stacks are kept.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.use_signal = hasattr(signal, "setitimer")
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.active = False
+        # Collapsed stack -> times it was seen
+        self.stacks = {}
+        self.samples = 0
+        # Samples left out because there were too many distinct stacks
+        self.dropped = 0
+        self.started = None
+        self.deadline = None
+        # Code object -> frame label
+        self.labels = {}
+
+    @property
+    def running(self):
+        return self.active and time.monotonic() < self.deadline
+
+    def start(self, duration=None):
+        """
+        Start sampling the calling thread, forgetting any earlier samples.
+        Must be called from the event loop thread.
+        :param duration: seconds to sample for, at most profile_max_duration
+        """
+        max_duration = self.server.config["profile_max_duration"]
+        if duration is None or duration > max_duration:
+            duration = max_duration
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started = time.monotonic()
+        self.deadline = self.started + duration
+        self.active = True
+        interval = self.server.config["profile_interval"]
+        if self.use_signal:
+            signal.signal(signal.SIGPROF, self.sample_signal)
+            signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        else:
+            self.stop_event.clear()
+            self.thread = threading.Thread(
+                target=self.sample_forever, args=(threading.get_ident(), interval),
+                name="StackSampler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self.active = False
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        elif self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+    def sample_signal(self, signum, frame):
+        if time.monotonic() >= self.deadline:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            return
+        self.record(frame)
+
+    def sample_forever(self, thread_id, interval):
+        while not self.stop_event.wait(interval):
+            if time.monotonic() >= self.deadline:
+                return
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            self.record(frame)
+
+    def record(self, frame):
+        stack = self.collapse(frame)
+        self.samples += 1
+        if stack in self.stacks:
+            self.stacks[stack] += 1
+        elif len(self.stacks) < self.server.config["profile_max_stacks"]:
+            self.stacks[stack] = 1
+        else:
+            self.dropped += 1
+
+    def collapse(self, frame):
+        """Get a stack as semicolon-separated frames, outermost first."""
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                filename = code.co_filename
+                if filename.startswith(SERVER_DIR):
+                    filename = os.path.relpath(filename, os.path.dirname(SERVER_DIR))
+                else:
+                    filename = os.path.basename(filename)
+                label = self.labels[code] = \
+                    f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def dump(self):
+        """
+        Write the stacks sampled so far under logs/.
+        :returns: path of the file written
+        """
+        # Copied in one step, as a sample may be recorded at any point
+        stacks = dict(self.stacks)
+        path = log_path("profile", "folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items(), key=lambda x: x[1], reverse=True):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def status(self):
+        """Get a short description of the profiler's state."""
+        if self.started is None:
+            return "The profiler has not been started."
+        if self.running:
+            info = (f"Profiling for {time.monotonic() - self.started:.0f} s, "
+                    f"{self.deadline - time.monotonic():.0f} s left")
+        else:
+            info = "Profiling stopped"
+        info += f": {self.samples} samples, {len(self.stacks)} distinct stacks"
+        if self.dropped > 0:
+            info += f", {self.dropped} samples left out (too many stacks)"
+        return info + "."
+
+
+class MemoryProfiler:
+    """
+    Reports what the server's memory is used by.
+
+    The live objects of each subsystem are sized by walking what they
+    refer to, up to memprofile_max_objects objects. Allocations are traced
+    with tracemalloc for at most memprofile_max_duration seconds, and the
+    top allocation sites and their subsystems are reported along with it.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.handle = None
+        # Whether tracemalloc was started by us, and should be stopped again
+        self.tracing = False
+
+    @property
+    def running(self):
+        return self.handle is not None
+
+    def start(self, duration, on_done):
+        """
+        Start tracing allocations, and write a report when done.
+        If tracemalloc is already tracing, the report is written right away.
+        :param duration: seconds to trace allocations for, at most
+        memprofile_max_duration
+        :param on_done: called with the path of the report, or None if it
+        couldn't be written
+        :returns: seconds until the report is written
+        """
+        duration = min(duration, self.server.config["memprofile_max_duration"])
+        loop = asyncio.get_running_loop()
+        if tracemalloc.is_tracing():
+            duration = 0
+        else:
+            tracemalloc.start(self.server.config["memprofile_frames"])
+            self.tracing = True
+        self.handle = loop.call_later(
+            duration, lambda: asyncio.ensure_future(self.finish(on_done)))
+        return duration
+
+    async def finish(self, on_done):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        traced = tracemalloc.get_traced_memory()
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+        roots, boundary = self.subsystem_roots()
+        loop = asyncio.get_running_loop()
+        try:
+            path = await loop.run_in_executor(
+                None, self.write_report, snapshot, traced, roots, boundary)
+        except Exception:
+            logger.exception("Failed to write the memory report")
+            path = None
+        self.handle = None
+        on_done(path)
+
+    def subsystem_roots(self):
+        """
+        Get the objects each subsystem is made of, in the order they are
+        sized, and the objects sizing never walks through: the server, its
+        managers, hubs, areas and clients, other than as roots.
+        :returns: list of (subsystem, objects), and set of object IDs
+        """
+        server = self.server
+        hubs = server.hub_manager.hubs
+        areas = [area for hub in hubs for area in hub.areas]
+        clients = list(server.client_manager.clients)
+        music_lists = [server.music_list]
+        music_lists += [hub.music_list for hub in hubs]
+        music_lists += [area.music_list for area in areas]
+        for client in clients:
+            music_lists += [client.music_list, client.local_music_list]
+        music_lists += list(music_list._loaded.values())
+        roots = [
+            ("testimony", [area.testimony for area in areas]),
+            ("evidence", [area.evi_list for area in areas]),
+            ("music lists", music_lists),
+            ("clients", clients),
+            ("areas", areas + hubs),
+            ("DB", [database._database_singleton]),
+        ]
+        boundary = {id(server), id(server.client_manager), id(server.hub_manager),
+                    id(asyncio.get_running_loop())}
+        boundary.update(id(obj) for obj in areas + hubs + clients)
+        return roots, boundary
+
+    def size_subsystems(self, roots, boundary):
+        """
+        Size the objects reachable from each subsystem's roots. Each object
+        is only counted once, for the first subsystem it is reached from.
+        :param roots: list of (subsystem, objects)
+        :param boundary: IDs of objects not to walk through
+        :returns: list of (subsystem, bytes, objects), and whether the
+        walk stopped at memprofile_max_objects
+        """
+        max_objects = self.server.config["memprofile_max_objects"]
+        seen = set()
+        sizes = []
+        for name, objects in roots:
+            size = 0
+            count = 0
+            pending = [obj for obj in objects if obj is not None]
+            while pending and len(seen) < max_objects:
+                obj = pending.pop()
+                if id(obj) in seen or isinstance(obj, SKIPPED_TYPES):
+                    continue
+                seen.add(id(obj))
+                size += sys.getsizeof(obj, 0)
+                count += 1
+                for referent in gc.get_referents(obj):
+                    if id(referent) not in boundary and id(referent) not in seen:
+                        pending.append(referent)
+            sizes.append((name, size, count))
+        return sizes, len(seen) >= max_objects
+
+    def write_report(self, snapshot, traced, roots, boundary):
+        """
+        Write a memory report under logs/.
+        :param snapshot: tracemalloc snapshot
+        :param traced: current and peak traced memory
+        :param roots: list of (subsystem, objects) to size
+        :param boundary: IDs of objects not to walk through when sizing
+        :returns: path of the file written
+        """
+        top = self.server.config["memprofile_top"]
+        sizes, truncated = self.size_subsystems(roots, boundary)
+
+        allocated = {}
+        stats = snapshot.statistics("traceback")
+        for stat in stats:
+            subsystem = "other"
+            for frame in reversed(stat.traceback):
+                if frame.filename.startswith(SERVER_DIR):
+                    relative = os.path.relpath(frame.filename, SERVER_DIR)
+                    subsystem = SUBSYSTEM_FILES.get(relative, relative.split(os.sep)[0])
+                    break
+            allocated[subsystem] = allocated.get(subsystem, 0) + stat.size
+
+        path = log_path("memprofile", "txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Live objects by subsystem (approximate, shared objects counted once)\n")
+            for name, size, count in sizes:
+                f.write(f"{name:>12}  {format_size(size):>10}  {count} objects\n")
+            if truncated:
+                f.write("Stopped after memprofile_max_objects objects; the last subsystems are incomplete.\n")
+
+            current, peak = traced
+            f.write(f"\nTraced allocations: {format_size(current)} still allocated, "
+                    f"{format_size(peak)} at peak\n")
+            f.write("By subsystem (the innermost server source file that allocated it)\n")
+            for name, size in sorted(allocated.items(), key=lambda x: x[1], reverse=True):
+                f.write(f"{name:>12}  {format_size(size):>10}\n")
+
+            f.write(f"\nTop {top} allocation sites\n")
+            for stat in snapshot.statistics("lineno")[:top]:
+                frame = stat.traceback[0]
+                f.write(f"{format_size(stat.size):>10}  {stat.count:>8} blocks  "
+                        f"{frame.filename}:{frame.lineno}\n")
+        return path
@@ -11,14 +11,18 @@ import server.logger
 from server import database
 from server.hub_manager import HubManager
 from server.client_manager import ClientManager
-from server.emotes import Emotes
+from server.emotes import EmoteCache
+from server.metrics import Metrics
+from server.music_list import MusicList
+from server.profiler import MemoryProfiler, StackSampler
 from server.discordbot import Bridgebot
 from server.exceptions import ClientError, ServerError
 from server.network.aoprotocol import AOProtocol
 from server.network.aoprotocol_ws import new_websocket_client
 from server.network.masterserverclient import MasterServerClient
 from server.network.webhooks import Webhooks
-from server.constants import remove_URL, dezalgo
+from server.watchdog import Watchdog
+from server.constants import remove_URL, dezalgo, Censor
 
 
 logger = logging.getLogger("main")
@@ -35,10 +39,12 @@ class TsuServer3:
 
         self.config = None
         self.censors = None
+        self.censor = Censor()
         self.allowed_iniswaps = []
+        self.iniswap_map = {}
         self.char_list = None
         self.char_emotes = None
-        self.music_list = []
+        self.music_list = MusicList()
         self.music_whitelist = []
         self.backgrounds = None
         self.server_links = None
@@ -87,6 +93,8 @@ class TsuServer3:
             self.load_backgrounds()
             self.load_server_links()
             self.load_ipranges()
+            # Areas broadcast through the client manager while loading
+            self.client_manager = ClientManager(self)
             self.hub_manager = HubManager(self)
         except yaml.YAMLError as exc:
             print("There was a syntax error parsing a configuration file:")
@@ -103,10 +111,13 @@ class TsuServer3:
             print("Please check sample config files for the correct format.")
             sys.exit(1)
 
-        self.client_manager = ClientManager(self)
         server.logger.setup_logging(debug=self.config["debug"])
 
         self.webhooks = Webhooks(self)
+        self.metrics = Metrics(self)
+        self.watchdog = Watchdog(self)
+        self.profiler = StackSampler(self)
+        self.memprofiler = MemoryProfiler(self)
         self.bridgebot = None
 
     def start(self):
@@ -151,7 +162,12 @@ class TsuServer3:
             except Exception as ex:
                 # Don't end the whole server if bridgebot destroys itself
                 print(ex)
+        self.watchdog.start()
+        if self.config["metrics_enabled"]:
+            loop.run_until_complete(self.metrics.start())
+
         asyncio.ensure_future(self.schedule_unbans())
+        loop.call_soon(self.preload_emotes)
 
         database.log_misc("start")
         print("Server started and is listening on port {}".format(
@@ -163,7 +179,12 @@ class TsuServer3:
             print("KEYBOARD INTERRUPT")
             loop.stop()
 
+        loop.run_until_complete(self.webhooks.close())
+        loop.run_until_complete(self.metrics.close())
+        loop.run_until_complete(self.watchdog.close())
         database.log_misc("stop")
+        # Write out any log events still waiting in the queue
+        database.close()
 
         ao_server.close()
         loop.run_until_complete(ao_server.wait_closed())
@@ -288,6 +309,60 @@ class TsuServer3:
             self.config["block_relative"] = False
         if "global_chat" not in self.config:
             self.config["global_chat"] = True
+        if "arup_interval" not in self.config:
+            self.config["arup_interval"] = 0
+        if "chars_check_updates" not in self.config:
+            self.config["chars_check_updates"] = True
+        if "webhook_queue_size" not in self.config:
+            self.config["webhook_queue_size"] = 100
+        if "webhook_timeout" not in self.config:
+            self.config["webhook_timeout"] = 10
+        if "webhook_retries" not in self.config:
+            self.config["webhook_retries"] = 3
+        if "webhook_backoff" not in self.config:
+            self.config["webhook_backoff"] = 1
+        if "webhook_coalesce" not in self.config:
+            self.config["webhook_coalesce"] = False
+        if "masterserver_min_interval" not in self.config:
+            self.config["masterserver_min_interval"] = 10
+        if "masterserver_max_interval" not in self.config:
+            self.config["masterserver_max_interval"] = 60
+        if "masterserver_ip_ttl" not in self.config:
+            self.config["masterserver_ip_ttl"] = 3600
+        if "websocket_high_water" not in self.config:
+            self.config["websocket_high_water"] = 1048576
+        if "websocket_overflow" not in self.config:
+            self.config["websocket_overflow"] = "disconnect"
+        if "write_buffer_high" not in self.config:
+            self.config["write_buffer_high"] = 65536
+        if "write_buffer_low" not in self.config:
+            self.config["write_buffer_low"] = 16384
+        if "write_buffer_max" not in self.config:
+            self.config["write_buffer_max"] = 1048576
+        if "metrics_enabled" not in self.config:
+            self.config["metrics_enabled"] = False
+        if "metrics_port" not in self.config:
+            self.config["metrics_port"] = 27018
+        if "watchdog_interval" not in self.config:
+            self.config["watchdog_interval"] = 0.5
+        if "watchdog_threshold" not in self.config:
+            self.config["watchdog_threshold"] = 0.1
+        if "watchdog_history" not in self.config:
+            self.config["watchdog_history"] = 20
+        if "profile_interval" not in self.config:
+            self.config["profile_interval"] = 0.01
+        if "profile_max_duration" not in self.config:
+            self.config["profile_max_duration"] = 300
+        if "profile_max_stacks" not in self.config:
+            self.config["profile_max_stacks"] = 10000
+        if "memprofile_max_duration" not in self.config:
+            self.config["memprofile_max_duration"] = 300
+        if "memprofile_frames" not in self.config:
+            self.config["memprofile_frames"] = 10
+        if "memprofile_top" not in self.config:
+            self.config["memprofile_top"] = 25
+        if "memprofile_max_objects" not in self.config:
+            self.config["memprofile_max_objects"] = 1000000
 
     def load_command_aliases(self):
         """Load a list of alternative command names."""
@@ -306,12 +381,34 @@ class TsuServer3:
                 self.censors = yaml.safe_load(censors)
         except Exception:
             logger.debug("Cannot find censors.yaml")
+            return
+        if self.censors is None:
+            self.censor = Censor()
+            return
+        self.censor = Censor(
+            self.censors.get("whole"),
+            self.censors.get("partial"),
+            self.censors.get("replace", "*"),
+        )
 
     def load_characters(self):
         """Load the character list from a YAML file."""
         with open("config/characters.yaml", "r", encoding="utf-8") as chars:
             self.char_list = yaml.safe_load(chars)
-        self.char_emotes = {char: Emotes(char) for char in self.char_list}
+        self.char_emotes = EmoteCache(self.char_list)
+        self.preload_emotes()
+
+    def preload_emotes(self):
+        """
+        Parse the characters' char.ini files in a worker thread, so IC
+        messages rarely have to wait for one. Only done once the server is
+        running; until then emotes are read on first use.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.run_in_executor(None, self.char_emotes.preload)
 
     def load_music(self):
         self.load_music_list()
@@ -336,6 +433,23 @@ class TsuServer3:
                 self.allowed_iniswaps = yaml.safe_load(iniswaps)
         except Exception:
             logger.debug("Cannot find iniswaps.yaml")
+        self.iniswap_map = self.build_iniswap_map(self.allowed_iniswaps)
+
+    @staticmethod
+    def build_iniswap_map(allowed_iniswaps):
+        """
+        Turn the INI swap groups into a map of each character to the
+        characters it may be swapped with.
+        :param allowed_iniswaps: list of lists of character names
+        :returns: dict of character name to set of character names
+        """
+        iniswap_map = {}
+        for char_link in allowed_iniswaps or []:
+            if not char_link:
+                continue
+            for char in char_link:
+                iniswap_map.setdefault(char, set()).update(char_link)
+        return iniswap_map
 
     def load_ipranges(self):
         """Load a list of banned IP ranges."""
@@ -347,8 +461,7 @@ class TsuServer3:
 
     def load_music_list(self):
         try:
-            with open("config/music.yaml", "r", encoding="utf-8") as music:
-                self.music_list = yaml.safe_load(music)
+            self.music_list = MusicList.load("config/music.yaml")
         except Exception:
             logger.debug("Cannot find music.yaml")
         try:
@@ -358,14 +471,11 @@ class TsuServer3:
             logger.debug("Cannot find url.txt")
 
     def build_music_list(self, music_list):
-        song_list = []
-        for item in music_list:
-            if "category" not in item:  # skip settings n stuff
-                continue
-            song_list.append(item["category"])
-            for song in item["songs"]:
-                song_list.append(song["name"])
-        return song_list
+        """
+        Get the category and song names of a music list, as sent in FM/SM packets.
+        :param music_list: MusicList
+        """
+        return music_list.names
 
     def get_song_data(self, music_list, music):
         """
@@ -375,18 +485,10 @@ class TsuServer3:
         :returns: tuple (name, length or -1)
         :raises: ServerError if track not found
         """
-        for item in music_list:
-            if "category" not in item:  # skip settings n stuff
-                continue
-            if item["category"] == music:
-                return item["category"], 0
-            for song in item["songs"]:
-                if song["name"] == music:
-                    try:
-                        return song["name"], song["length"]
-                    except KeyError:
-                        return song["name"], -1
-        raise ServerError("Music not found.")
+        song = music_list.get_song_data(music)
+        if song is None:
+            raise ServerError("Music not found.")
+        return song
 
     def get_song_is_category(self, music_list, music):
         """
@@ -395,21 +497,15 @@ class TsuServer3:
         :param music: track name
         :returns: bool
         """
-        for item in music_list:
-            if "category" not in item:  # skip settings n stuff
-                continue
-            if item["category"] == music:
-                return True
-        return False
+        return music_list.is_category(music)
 
     def send_all_cmd_pred(self, cmd, *args, pred=lambda x: True):
         """
         Broadcast an AO-compatible command to all clients that satisfy
         a predicate.
         """
-        for client in self.client_manager.clients:
-            if pred(client):
-                client.send_command(cmd, *args)
+        targets = [client for client in self.client_manager.clients if pred(client)]
+        self.client_manager.broadcast_command(targets, cmd, *args)
 
     def broadcast_global(self, client, msg, as_mod=False):
         """
@@ -0,0 +1,149 @@
+from collections import deque
+from dataclasses import dataclass
+
+import asyncio
+import logging
+import time
+
+from server import database
+
+logger = logging.getLogger("watchdog")
+
+
+@dataclass
+class SlowCall:
+    """A callback that held up the event loop."""
+
+    timestamp: float
+    seconds: float
+    kind: str
+    name: str
+    client_id: int = None
+    location: str = ""
+
+    def __str__(self):
+        info = f"{self.kind} {self.name}"
+        if self.client_id is not None:
+            info += f" by client {self.client_id}"
+        if self.location:
+            info += f" in {self.location}"
+        return info
+
+
+class Watchdog:
+    """
+    Watches for anything that holds up the event loop.
+
+    The scheduling delay of the event loop is sampled continuously, and
+    packet handlers, OOC commands, timers, the jukebox, demo playback and
+    database calls report how long they took. Any of them taking longer
+    than watchdog_threshold seconds is logged with what it was and who and
+    where it was for, and kept in a ring buffer for the /lag command.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.threshold = server.config["watchdog_threshold"]
+        self.slow_calls = deque(maxlen=server.config["watchdog_history"])
+        # Slowest call reported since the last lag sample, to blame lag on
+        self.slowest = None
+        self.last_lag = 0
+        self.max_lag = 0
+        self.task = None
+
+    def start(self):
+        """Start sampling the event loop lag and timing database calls."""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.sample_lag_forever())
+        database.set_call_hook(self.check_db)
+
+    async def close(self):
+        """Stop sampling the event loop lag."""
+        database.set_call_hook(None)
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def sample_lag_forever(self):
+        """Measure how late the event loop wakes up from a sleep."""
+        interval = self.server.config["watchdog_interval"]
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(loop.time() - start - interval, 0)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.server.metrics.observe_lag(lag)
+            slowest = self.slowest
+            self.slowest = None
+            if lag < self.threshold:
+                continue
+            blame = str(slowest) if slowest is not None else "unknown"
+            logger.warning("Event loop blocked for %.0f ms, slowest call: %s",
+                           lag * 1000, blame)
+            self.slow_calls.append(SlowCall(time.time(), lag, "lag", blame))
+
+    def check(self, seconds, kind, name, client=None, area=None, hub=None):
+        """
+        Report how long a callback took, recording it if it was slow.
+        :param seconds: time taken
+        :param kind: what was called (packet, command, timer, jukebox, demo, db)
+        :param name: packet type, command name or other identifier
+        :param client: client it was for, if any
+        :param area: area it was for, if any (defaults to the client's,
+        unless a hub is given)
+        :param hub: hub it was for, if any (defaults to the area's)
+        """
+        if seconds < self.threshold:
+            return
+        if area is None and hub is None and client is not None:
+            area = client.area
+        if hub is None and area is not None:
+            hub = area.area_manager
+        location = ""
+        if hub is not None:
+            location = f"hub {hub.id}"
+            if area is not None:
+                location += f" area {area.id}"
+        slow = SlowCall(
+            time.time(),
+            seconds,
+            kind,
+            name,
+            client.id if client is not None else None,
+            location,
+        )
+        logger.warning("Slow %s took %.0f ms", slow, seconds * 1000)
+        self.slow_calls.append(slow)
+        if self.slowest is None or seconds > self.slowest.seconds:
+            self.slowest = slow
+
+    def check_db(self, name, seconds):
+        """Report how long a database call took."""
+        self.check(seconds, "db", name)
+
+    def wrap(self, func, kind, name, client=None, area=None, hub=None):
+        """
+        Wrap a callback so it reports how long it took.
+        :param func: callback taking no arguments
+        :returns: the wrapped callback
+        """
+
+        def timed():
+            start = time.perf_counter()
+            try:
+                return func()
+            finally:
+                self.check(time.perf_counter() - start, kind, name,
+                           client=client, area=area, hub=hub)
+
+        return timed
+
+    def worst(self):
+        """Get the recorded slow calls, slowest first."""
+        return sorted(self.slow_calls, key=lambda x: x.seconds, reverse=True)